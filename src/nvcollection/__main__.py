@@ -0,0 +1,19 @@
+"""Run the headless command line interface.
+
+Usage: python -m nvcollection [-j jobs] command file [file ...]
+
+Commands:
+    validate, list, stats, refresh, export, import, add, remove.
+See "python -m nvcollection --help" for details.
+The novelibre application's "nvlib" package must be on the Python path.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import sys
+
+from nvcollection.collection_cli import CollectionCli
+
+if __name__ == '__main__':
+    sys.exit(CollectionCli.main())
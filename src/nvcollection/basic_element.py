@@ -0,0 +1,44 @@
+"""Provide a base class for books and series.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class BasicElement:
+    """Collection element with a title and a description.
+    
+    The description can be kept in a DescStore instance
+    until it is accessed.
+    """
+
+    def __init__(self):
+        self.title = None
+        self._desc = None
+        self._descStore = None
+        self._descKey = None
+        # Key of the description in the store, if not loaded.
+
+    @property
+    def desc(self):
+        if self._descKey is not None:
+            return self._descStore.get(self._descKey)
+
+        return self._desc
+
+    @desc.setter
+    def desc(self, desc):
+        self._desc = desc
+        self._descStore = None
+        self._descKey = None
+
+    def set_stored_desc(self, descStore, desc):
+        """Keep a long description in descStore instead of memory."""
+        if desc is None or len(desc) < descStore.MIN_LENGTH:
+            self.desc = desc
+            return
+
+        self._desc = None
+        self._descStore = descStore
+        self._descKey = descStore.put(desc)
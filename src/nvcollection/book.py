@@ -4,9 +4,10 @@ Copyright (c) Peter Triesberger
 For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
+from nvcollection.basic_element import BasicElement
 
 
-class Book:
+class Book(BasicElement):
     """Book representation for the collection.
     
     This is a lightweight placeholder for a novelibre project file instance,
@@ -14,9 +15,38 @@ class Book:
     """
 
     def __init__(self, filePath):
+        super().__init__()
+        self.root = None
+        # Name of the root directory that path refers to.
+
+        self.path = None
+        # Project file path as stored in the collection file.
+
+        self._pathResolver = None
+        self._filePath = None
         self.filePath = filePath
-        self.title = None
-        self.desc = None
+        self.stats = None
+        # BookStats instance, if the statistics have been collected.
+
+        self.isMissing = False
+        # True, if the project file was not found when last checked.
+
+        self.tags = []
+        # List of str: labels such as genre, status, or imprint.
+
+    @property
+    def filePath(self):
+        if self._pathResolver is not None:
+            return self._pathResolver.resolve(self.root, self.path)
+
+        return self._filePath
+
+    @filePath.setter
+    def filePath(self, filePath):
+        self._filePath = filePath
+        self._pathResolver = None
+        self.root = None
+        self.path = filePath
 
     def pull_metadata(self, novel):
         """Update metadata from novel.
@@ -38,3 +68,8 @@ class Book:
         novel.title = self.title
         novel.desc = self.desc
 
+    def set_location(self, pathResolver, root, path):
+        """Set the stored path, to be resolved by pathResolver."""
+        self._pathResolver = pathResolver
+        self.root = root
+        self.path = path
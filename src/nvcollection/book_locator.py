@@ -0,0 +1,164 @@
+"""Provide a class for finding moved project files.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import os
+
+
+class BookLocator:
+    """Index of the project files below search directories.
+
+    The search directories are walked once by parallel workers,
+    each listing one directory and passing its subdirectories on.
+    The project files found are indexed by file name,
+    so the new location of any number of missing books
+    is looked up without searching the disk again.
+
+    If several files have a missing book's name, the file with the
+    most trailing directory names in common with the old path is chosen.
+    A tie is broken by the book's last known file size.
+    Books that still cannot be told apart are not relocated.
+    """
+    MAX_WORKERS = 8
+    EXTENSION = '.novx'
+
+    def __init__(self):
+        self._files = {}
+        # Dictionary:
+        #   keyword -- normalized file name
+        #   value -- list of tuples (file path, size)
+
+    def add_directories(self, directories):
+        """Index the project files below the directories.
+
+        Positional arguments:
+            directories -- iterable of str: the search directories.
+
+        Directories that cannot be read are skipped.
+        Symbolic links to directories are not followed.
+        Return the number of project files indexed.
+        This method may run in a background thread.
+        """
+        fileCount = 0
+        visited = set()
+        # Normalized paths of the directories listed,
+        # so nested search directories are not indexed twice.
+
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            pending = set()
+            subdirectories = [os.path.abspath(directory) for directory in directories]
+            while True:
+                for directory in subdirectories:
+                    key = os.path.normcase(directory)
+                    if not key in visited:
+                        visited.add(key)
+                        pending.add(executor.submit(self._scan, directory))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                subdirectories = []
+                for future in done:
+                    files, found = future.result()
+                    for fileName, filePath, size in files:
+                        self._files.setdefault(fileName, []).append((filePath, size))
+                    fileCount += len(files)
+                    subdirectories.extend(found)
+        return fileCount
+
+    def locate(self, filePaths, sizes=None):
+        """Return a tuple (new file paths, ambiguous file paths).
+
+        Positional arguments:
+            filePaths -- iterable of str: paths of missing project files.
+
+        Optional arguments:
+            sizes -- dict: last known file size per file path, if any.
+
+        The new file paths are a dictionary with the new path per old path.
+        The ambiguous file paths are a list of the old paths
+        with several equally matching candidates.
+        Paths without candidates are in neither.
+        """
+        if sizes is None:
+            sizes = {}
+        newPaths = {}
+        ambiguous = []
+        for filePath in filePaths:
+            candidates = self._files.get(
+                os.path.normcase(os.path.basename(filePath)),
+                None,
+            )
+            if not candidates:
+                continue
+
+            if len(candidates) > 1:
+                candidates = self._get_best_candidates(
+                    filePath,
+                    candidates,
+                    sizes.get(filePath, None),
+                )
+            if len(candidates) > 1:
+                ambiguous.append(filePath)
+            else:
+                newPaths[filePath] = candidates[0][0]
+        return newPaths, ambiguous
+
+    def _get_best_candidates(self, filePath, candidates, size):
+        # Return the candidates that match the old file path best.
+        oldParts = self._get_parts(filePath)
+        best = []
+        bestScore = -1
+        for candidate in candidates:
+            score = 0
+            for oldPart, newPart in zip(oldParts, self._get_parts(candidate[0])):
+                if oldPart != newPart:
+                    break
+
+                score += 1
+            if score > bestScore:
+                best = [candidate]
+                bestScore = score
+            elif score == bestScore:
+                best.append(candidate)
+        if len(best) > 1 and size is not None:
+            sameSize = [candidate for candidate in best if candidate[1] == size]
+            if sameSize:
+                best = sameSize
+        return best
+
+    def _get_parts(self, filePath):
+        # Return the normalized directory names of filePath, last first.
+        parts = os.path.normcase(os.path.normpath(filePath)).split(os.sep)
+        return parts[-2::-1]
+
+    def _scan(self, directory):
+        # List a single directory.
+        # Return a tuple (project files, subdirectories), where the
+        # project files are tuples (normalized file name, path, size).
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.path)
+                        elif (entry.name.lower().endswith(self.EXTENSION)
+                              and entry.is_file()
+                        ):
+                            files.append((
+                                os.path.normcase(entry.name),
+                                entry.path,
+                                entry.stat().st_size,
+                            ))
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return files, subdirectories
@@ -0,0 +1,41 @@
+"""Provide a class for book and series manuscript statistics.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from datetime import datetime
+
+
+class BookStats:
+    """Manuscript statistics of a book, or totals of a series.
+    
+    Only normal chapters and sections are counted. 
+    """
+
+    def __init__(self, words=0, chapters=0, sections=0, modified=None):
+        self.words = words
+        self.chapters = chapters
+        self.sections = sections
+        self.modified = modified
+        # Modification timestamp of the project file, or None.
+
+    def add(self, other, sign=1):
+        """Add the counts of another BookStats instance.
+        
+        Optional arguments:
+            sign -- int: 1 for adding, -1 for subtracting.
+        
+        The modification date is not affected.
+        """
+        self.words += sign * other.words
+        self.chapters += sign * other.chapters
+        self.sections += sign * other.sections
+
+    def get_values(self):
+        """Return a tuple of the values to display."""
+        if self.modified is None:
+            modified = ''
+        else:
+            modified = datetime.fromtimestamp(self.modified).strftime('%Y-%m-%d')
+        return (self.words, self.chapters, self.sections, modified)
@@ -0,0 +1,402 @@
+"""Provide a class for a virtualized flat table of the collection's books.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from tkinter import ttk
+
+from nvcollection.change_bus import ChangeBus
+from nvcollection.nvcollection_locale import _
+from nvlib.novx_globals import norm_path
+
+
+class BookTable(ttk.Frame):
+    """Flat table of the books shown in the collection tree.
+
+    The table is virtualized: its Treeview holds a fixed pool of rows,
+    one per line that fits into the window. When scrolling, the rows
+    are refilled with the books of the visible window, so memory usage
+    and redraw cost depend on the window height, not on the number
+    of books.
+
+    The books are sorted by column with sort keys that are computed
+    once per book and column, and kept until the book changes.
+    """
+    COLUMNS = (
+        ('title', _('Title'), 200, 'w'),
+        ('series', _('Series'), 150, 'w'),
+        ('path', _('Path'), 250, 'w'),
+        ('words', _('Words'), 70, 'e'),
+        ('chapters', _('Chapters'), 70, 'e'),
+        ('sections', _('Sections'), 70, 'e'),
+        ('modified', _('Modified'), 90, 'e'),
+    )
+    # Table columns: (ID, heading, width, anchor).
+
+    STATS_COLUMNS = ('words', 'chapters', 'sections', 'modified')
+    # Columns filled from the book statistics, in display order.
+
+    ROW_HEIGHT = 20
+    # Estimated row height in pixels, until the first row is displayed.
+
+    HEADING_HEIGHT = 24
+    # Estimated heading height in pixels, until the first row is displayed.
+
+    SORT_MARKS = {False: ' ▲', True: ' ▼'}
+    # Heading suffixes showing the sort direction.
+
+    def __init__(self, parent, on_select, on_open, **kw):
+        """Positional arguments:
+            parent -- parent widget.
+            on_select -- function that takes the ID of a selected book.
+            on_open -- function without arguments that opens the selected book.
+        """
+        super().__init__(parent, **kw)
+        self._on_select = on_select
+        self._on_open = on_open
+        self._collection = None
+        self._rows = []
+        # Book IDs in display order.
+
+        self._first = 0
+        # Index of the book displayed in the top row.
+
+        self._pool = []
+        # Item IDs of the Treeview rows.
+
+        self._detached = set()
+        # Rows not needed, because the books end above the window.
+
+        self._selected = None
+        # ID of the selected book, even if it is scrolled out of sight.
+
+        self._sortColumn = None
+        self._reverse = False
+        self._sortKeys = {}
+        # Dictionary:
+        #   keyword -- column ID
+        #   value -- dictionary: sort key per book ID
+
+        self._table = ttk.Treeview(
+            self,
+            show='headings',
+            selectmode='browse',
+            columns=[column for column, __, __, __ in self.COLUMNS],
+        )
+        for column, heading, width, anchor in self.COLUMNS:
+            self._table.heading(
+                column,
+                text=heading,
+                command=lambda column=column: self.sort(column),
+            )
+            self._table.column(column, width=width, minwidth=width, anchor=anchor)
+        self._table.tag_configure('MISSING', foreground='gray')
+        self._scrollbar = ttk.Scrollbar(
+            self,
+            orient='vertical',
+            command=self._on_scrollbar,
+        )
+        self._scrollbar.pack(side='right', fill='y')
+        self._table.pack(side='left', expand=True, fill='both')
+        self._table.bind('<Configure>', self._on_resize)
+        self._table.bind('<<TreeviewSelect>>', self._on_select_row)
+        self._table.bind('<Double-1>', self._open_book)
+        self._table.bind('<Return>', self._open_book)
+        self._table.bind('<MouseWheel>', self._on_mouse_wheel)
+        self._table.bind('<Button-4>', self._on_mouse_wheel)
+        self._table.bind('<Button-5>', self._on_mouse_wheel)
+        for key in ('<Up>', '<Down>', '<Prior>', '<Next>', '<Home>', '<End>'):
+            self._table.bind(key, self._on_key)
+
+    def refresh(self, changes):
+        """Display the changed book data.
+
+        Positional arguments:
+            changes -- dict: set of ChangeBus event types per element ID.
+
+        The sort keys of the changed books are computed again.
+        The books are reloaded, if elements have been inserted,
+        deleted, or moved, or if the sort order may have changed.
+        """
+        if self._collection is None:
+            return
+
+        reload = False
+        for elementId, eventTypes in changes.items():
+            if ChangeBus.STRUCTURE in eventTypes:
+                reload = True
+            for column, keys in self._sortKeys.items():
+                if elementId in keys:
+                    del keys[elementId]
+                    if column == self._sortColumn:
+                        reload = True
+            if (ChangeBus.TITLE in eventTypes
+                and elementId in self._collection.series
+                and 'series' in self._sortKeys
+            ):
+                seriesKeys = self._sortKeys['series']
+                for bkId in self._collection.treeFilter.get_children(elementId):
+                    seriesKeys.pop(bkId, None)
+                if self._sortColumn == 'series':
+                    reload = True
+        if reload:
+            self.reload()
+        else:
+            self._draw()
+
+    def reload(self):
+        """Get the books again from the collection tree, and sort them."""
+        self._rows = []
+        if self._collection is not None:
+            tree = self._collection.tree
+            for node in tree.get_children(''):
+                if node in self._collection.books:
+                    self._rows.append(node)
+                else:
+                    self._rows.extend(tree.get_children(node))
+            if self._sortColumn is not None:
+                self._sort_rows()
+        self._draw()
+
+    def see(self, bkId):
+        """Select a book, and scroll it into view.
+
+        Book IDs not in the table clear the selection.
+        """
+        if bkId == self._selected:
+            return
+
+        self._selected = None
+        try:
+            index = self._rows.index(bkId)
+        except ValueError:
+            self._draw()
+            return
+
+        self._selected = bkId
+        self._scroll_to_index(index)
+
+    def set_collection(self, collection):
+        """Show the books of collection, or clear the table, if None."""
+        self._collection = collection
+        self._sortKeys = {}
+        self._selected = None
+        self._first = 0
+        self.reload()
+
+    def sort(self, column):
+        """Sort the books by column.
+
+        Sorting by the same column again reverses the order.
+        Books without a value are placed at the end.
+        """
+        if column == self._sortColumn:
+            self._reverse = not self._reverse
+        else:
+            if self._sortColumn is not None:
+                self._table.heading(
+                    self._sortColumn,
+                    text=self._get_heading(self._sortColumn),
+                )
+            self._sortColumn = column
+            self._reverse = False
+        self._table.heading(
+            column,
+            text=f'{self._get_heading(column)}{self.SORT_MARKS[self._reverse]}',
+        )
+        self._sort_rows()
+        if self._selected in self._rows:
+            self._scroll_to_index(self._rows.index(self._selected))
+        else:
+            self._draw()
+
+    def _draw(self):
+        # Fill the rows with the books of the visible window.
+        self._first = max(0, min(self._first, len(self._rows) - len(self._pool)))
+        selectedRow = None
+        for i, row in enumerate(self._pool):
+            index = self._first + i
+            if index >= len(self._rows):
+                if not row in self._detached:
+                    self._table.detach(row)
+                    self._detached.add(row)
+                continue
+
+            if row in self._detached:
+                self._table.move(row, '', i)
+                self._detached.discard(row)
+            bkId = self._rows[index]
+            book = self._collection.books.get(bkId, None)
+            if book is None:
+                # Deleted; the table is reloaded when the application is idle.
+                self._table.item(row, values=(), tags='')
+                continue
+
+            self._table.item(
+                row,
+                values=self._get_values(bkId, book),
+                tags='MISSING' if book.isMissing else '',
+            )
+            if bkId == self._selected:
+                selectedRow = row
+        if selectedRow is None:
+            self._table.selection_remove(self._table.selection())
+        else:
+            self._table.selection_set(selectedRow)
+            self._table.focus(selectedRow)
+        if self._rows:
+            self._scrollbar.set(
+                self._first / len(self._rows),
+                min(1, (self._first + len(self._pool)) / len(self._rows)),
+            )
+        else:
+            self._scrollbar.set(0, 1)
+
+    def _get_heading(self, column):
+        # Return the column's heading text without sort mark.
+        for columnId, heading, __, __ in self.COLUMNS:
+            if columnId == column:
+                return heading
+
+    def _get_sort_key(self, column, bkId):
+        # Return the book's key for sorting by column, or None.
+        book = self._collection.books[bkId]
+        if column == 'title':
+            return self._collection.collationKeys.get_key(bkId, book.title)
+
+        if column == 'series':
+            srId = self._collection.treeFilter.get_parent(bkId)
+            if not srId:
+                return None
+
+            return self._collection.collationKeys.get_key(
+                srId,
+                self._collection.series[srId].title,
+            )
+
+        if column == 'path':
+            if book.filePath is None:
+                return None
+
+            return norm_path(book.filePath).casefold()
+
+        if book.stats is None:
+            return None
+
+        return getattr(book.stats, column)
+
+    def _get_values(self, bkId, book):
+        # Return the values to display in the book's row.
+        srId = self._collection.treeFilter.get_parent(bkId)
+        if srId:
+            seriesTitle = self._collection.series[srId].title
+        else:
+            seriesTitle = ''
+        if book.stats is None:
+            stats = ('',) * len(self.STATS_COLUMNS)
+        else:
+            stats = book.stats.get_values()
+        return (book.title, seriesTitle, norm_path(book.filePath)) + stats
+
+    def _on_key(self, event):
+        # Move the selection through all books, not only the visible rows.
+        if not self._rows:
+            return 'break'
+
+        if self._selected in self._rows:
+            index = self._rows.index(self._selected)
+        else:
+            index = self._first - 1
+        pageSize = max(1, len(self._pool) - 1)
+        index = {
+            'Up': index - 1,
+            'Down': index + 1,
+            'Prior': index - pageSize,
+            'Next': index + pageSize,
+            'Home': 0,
+            'End': len(self._rows) - 1,
+        }[event.keysym]
+        index = max(0, min(index, len(self._rows) - 1))
+        self._selected = self._rows[index]
+        self._scroll_to_index(index)
+        self._on_select(self._selected)
+        return 'break'
+
+    def _on_mouse_wheel(self, event):
+        # Scroll by three rows per wheel step.
+        if event.num == 4 or event.delta > 0:
+            self._scroll(-3)
+        else:
+            self._scroll(3)
+        return 'break'
+
+    def _on_resize(self, event):
+        # Adjust the number of rows to the window height.
+        rowHeight = self.ROW_HEIGHT
+        headingHeight = self.HEADING_HEIGHT
+        if self._pool:
+            bbox = self._table.bbox(self._pool[0])
+            if bbox:
+                __, headingHeight, __, rowHeight = bbox
+        poolSize = max(1, (event.height - headingHeight) // rowHeight)
+        while len(self._pool) < poolSize:
+            self._pool.append(self._table.insert('', 'end'))
+        while len(self._pool) > poolSize:
+            row = self._pool.pop()
+            self._detached.discard(row)
+            self._table.delete(row)
+        self._draw()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        # Scroll to the scrollbar position, or by units or pages.
+        if action == 'moveto':
+            self._first = int(float(value) * len(self._rows))
+            self._draw()
+        elif unit == 'pages':
+            self._scroll(int(value) * max(1, len(self._pool) - 1))
+        else:
+            self._scroll(int(value))
+
+    def _on_select_row(self, event=None):
+        # Pass the book selected with the mouse on.
+        selection = self._table.selection()
+        if not selection:
+            return
+
+        index = self._first + self._pool.index(selection[0])
+        if index >= len(self._rows) or self._rows[index] == self._selected:
+            return
+
+        self._selected = self._rows[index]
+        self._on_select(self._selected)
+
+    def _open_book(self, event=None):
+        if self._selected is not None:
+            self._on_open()
+        return 'break'
+
+    def _scroll(self, rows):
+        # Scroll the window by a number of rows.
+        self._first += rows
+        self._draw()
+
+    def _scroll_to_index(self, index):
+        # Scroll the window just enough to show the book at index.
+        if index < self._first:
+            self._first = index
+        elif index >= self._first + len(self._pool):
+            self._first = index - len(self._pool) + 1
+        self._draw()
+
+    def _sort_rows(self):
+        # Sort the books with the cached keys.
+        # Keys missing in the cache are computed once.
+        keys = self._sortKeys.setdefault(self._sortColumn, {})
+        for bkId in self._rows:
+            if not bkId in keys:
+                keys[bkId] = self._get_sort_key(self._sortColumn, bkId)
+        sortable = [bkId for bkId in self._rows if keys[bkId] is not None]
+        sortable.sort(key=keys.__getitem__, reverse=self._reverse)
+        sortable.extend(bkId for bkId in self._rows if keys[bkId] is None)
+        self._rows = sortable
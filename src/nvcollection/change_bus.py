@@ -0,0 +1,50 @@
+"""Provide a class for publishing model change events.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class ChangeBus:
+    """Publisher of typed change events for collection elements.
+
+    Subscribers are called with the event type and the element ID
+    each time an element's displayed data changes.
+    They are called synchronously, so they should only queue
+    the events, and process them later in one go.
+    """
+    TITLE = 'title'
+    # The element's title has changed.
+
+    STATS = 'stats'
+    # The element's statistics or aggregates have changed.
+
+    STATE = 'state'
+    # The book's missing state may have changed.
+
+    STRUCTURE = 'structure'
+    # The element has been inserted, deleted, or moved.
+    # With the ID '', the order or visibility of the elements has changed.
+
+    def __init__(self):
+        self._subscribers = []
+
+    def has_subscribers(self):
+        """Return True, if any subscriber is registered."""
+        return bool(self._subscribers)
+
+    def publish(self, eventType, elementId):
+        """Call the subscribers with the event."""
+        for callback in self._subscribers:
+            callback(eventType, elementId)
+
+    def subscribe(self, callback):
+        """Register a callback(event type, element ID)."""
+        if not callback in self._subscribers:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Remove a registered callback."""
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
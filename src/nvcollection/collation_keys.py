@@ -0,0 +1,49 @@
+"""Provide a class for cached locale-aware title sort keys.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import locale
+
+
+class CollationKeys:
+    """Cache of locale-aware collation keys for element titles.
+    
+    A key is computed once per title, and kept until the 
+    element's title changes.
+    The keys follow the collation locale set by the application;
+    the plugin does not change it.
+    """
+
+    def __init__(self):
+        self._keys = {}
+        # Dictionary:
+        #   keyword -- element ID
+        #   value -- tuple (title, collation key)
+
+    def clear(self):
+        """Remove all cached keys."""
+        self._keys.clear()
+
+    def discard(self, elementId):
+        """Remove the cached key of an element, if any."""
+        self._keys.pop(elementId, None)
+
+    def get_key(self, elementId, title):
+        """Return the collation key of an element's title."""
+        entry = self._keys.get(elementId, None)
+        if entry is None or entry[0] != title:
+            entry = (title, self.make_key(title))
+            self._keys[elementId] = entry
+        return entry[1]
+
+    @staticmethod
+    def make_key(title):
+        """Return a locale-aware collation key for a title.
+        
+        Case differences only decide between otherwise equal titles.
+        """
+        if not title:
+            title = ''
+        return (locale.strxfrm(title.casefold()), locale.strxfrm(title))
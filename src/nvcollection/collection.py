@@ -4,20 +4,34 @@ Copyright (c) Peter Triesberger
 For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
+import hashlib
 import os
 
 from nvcollection.book import Book
+from nvcollection.change_bus import ChangeBus
+from nvcollection.collation_keys import CollationKeys
+from nvcollection.collection_history import CollectionHistory
+from nvcollection.collection_merger import CollectionMerger
+from nvcollection.collection_snapshot import CollectionSnapshot
+from nvcollection.command_log import CommandLog
+from nvcollection.desc_store import DescStore
+from nvcollection.file_lock import FileLock
 from nvcollection.nvcollection_globals import BOOK_PREFIX
 from nvcollection.nvcollection_globals import SERIES_PREFIX
 from nvcollection.nvcollection_locale import _
+from nvcollection.nvcx_compression import NvcxCompression
 from nvcollection.nvcx_opener import NvcxOpener
+from nvcollection.nvcx_validator import NvcxValidator
+from nvcollection.nvcx_writer import NvcxWriter
+from nvcollection.path_resolver import PathResolver
 from nvcollection.series import Series
+from nvcollection.series_stats import SeriesStats
+from nvcollection.tag_index import TagIndex
+from nvcollection.title_index import TitleIndex
+from nvcollection.tree_filter import TreeFilter
 from nvlib.model.data.id_generator import new_id
-from nvlib.model.xml.xml_filter import strip_illegal_characters
-from nvlib.model.xml.xml_indent import indent
 from nvlib.novx_globals import norm_path
 import tkinter.font as tkFont
-import xml.etree.ElementTree as ET
 
 
 class Collection:
@@ -29,17 +43,48 @@ class Collection:
     The collection data is saved in an XML file.
     """
     MAJOR_VERSION = 1
-    MINOR_VERSION = 1
+    MINOR_VERSION = 3
     # DTD version.
 
     EXTENSION = 'nvcx'
+    COMPRESSED_EXTENSION = f'{EXTENSION}.{NvcxCompression.EXTENSION}'
+    # Collection files with this extension are written compressed.
 
-    XML_HEADER = (
-        '<?xml version="1.0" encoding="utf-8"?>\n'
-        f'<!DOCTYPE nvcx SYSTEM "nvcx_{MAJOR_VERSION}_{MINOR_VERSION}.dtd">\n'
-    )
     fileOpener = NvcxOpener
 
+    MAX_REPORTED_VIOLATIONS = 10
+
+    PROJECTS_ROOT = 'projects'
+    # Name of the root directory set via the user interface.
+
+    # Undo/redo command types:
+    #   ('add', element ID, element, parent ID, index, members)
+    #   ('remove', element ID, element, parent ID, index, members)
+    #   ('ungroup', series ID, series, index, member IDs)
+    #   ('move', node ID, old parent ID, old index, new parent ID, new index)
+    #   ('title', element ID, old title, new title)
+    #   ('desc', element ID, old description, new description)
+    #   ('tags', book ID, old tags, new tags)
+    #   ('relocate', tuple of (book ID, old root, old path, new root, new path))
+    #   ('order', {parent ID: old child IDs}, {parent ID: new child IDs})
+    #   ('merge', tuple of commands executed in sequence)
+    #   ('import', tuple of commands executed in sequence)
+    # Members are (book ID, Book instance) tuples.
+    # Indexes refer to the unfiltered tree.
+    COMMAND_NAMES = {
+        'add': _('Add'),
+        'remove': _('Remove'),
+        'ungroup': _('Remove series'),
+        'move': _('Move'),
+        'title': _('Edit title'),
+        'desc': _('Edit description'),
+        'tags': _('Edit tags'),
+        'relocate': _('Relocate books'),
+        'order': _('Sort'),
+        'merge': _('Merge duplicates'),
+        'import': _('Merge collection'),
+    }
+
     def __init__(self, filePath, tree):
         """Initialize the instance variables.
         
@@ -49,8 +94,14 @@ class Collection:
         """
         self.title = None
         self.tree = tree
-        fontSize = tkFont.nametofont('TkDefaultFont').actual()['size']
-        self.tree.tag_configure('SERIES', font=('', fontSize, 'bold'))
+        try:
+            fontSize = tkFont.nametofont('TkDefaultFont').actual()['size']
+        except RuntimeError:
+            # There is no Tk root window, e.g. with a HeadlessTree.
+            pass
+        else:
+            self.tree.tag_configure('SERIES', font=('', fontSize, 'bold'))
+        self.tree.tag_configure('MISSING', foreground='gray')
 
         self.books = {}
         # Dictionary:
@@ -62,9 +113,50 @@ class Collection:
         #   keyword -- series ID
         #   value -- Series instance
 
+        self.collationKeys = CollationKeys()
+
+        self.titleIndex = TitleIndex()
+        # Sorted titles for finding elements by the beginning of the title.
+
+        self.tagIndex = TagIndex()
+        # Bitmaps of the books per tag for filtering by tags.
+
+        self.treeFilter = TreeFilter(self.tree)
+
+        self.commandLog = CommandLog()
+
+        self.changeBus = ChangeBus()
+        # Changes of the displayed element data are published here.
+        # Without subscribers, the tree is updated immediately.
+
+        self.descStore = DescStore()
+        # Long descriptions are loaded from here on demand.
+
+        self.pathResolver = PathResolver()
+        # Book paths are stored relative to the collection file
+        # or to named roots.
+
+        self.upgradePending = False
+        # True, if the file was read from a legacy format.
+        # The upgrade is written with the next save.
+
+        self.mergeConflicts = None
+        # List of the root names and element IDs changed both here and
+        # by another process, if the last write() merged the file.
+
+        self._base = CollectionSnapshot()
+        # State of the collection when last read or written.
+
+        self._fingerprint = None
+        # Digest of the file content when last read or written.
+        # File times are not used, because they may be coarse on shares.
+
         self._filePath = None
         # Location of the collection XML file.
 
+        self.history = None
+        # CollectionHistory with the saved versions of the file.
+
         self.filePath = filePath
 
     @property
@@ -74,9 +166,20 @@ class Collection:
     @filePath.setter
     def filePath(self, filePath):
         """Accept only filenames with the right extension. """
-        if filePath.lower().endswith(self.EXTENSION):
-            self._filePath = filePath
-            self.title, __ = os.path.splitext(os.path.basename(self.filePath))
+        fileName = os.path.basename(filePath)
+        for extension in (self.EXTENSION, self.COMPRESSED_EXTENSION):
+            if fileName.lower().endswith(extension):
+                break
+        else:
+            return
+
+        self._filePath = filePath
+        self._fingerprint = None
+        self.history = CollectionHistory(filePath)
+        self.title = fileName[:-len(extension)].rstrip('.')
+        self.pathResolver.set_collection_dir(
+            os.path.dirname(os.path.abspath(filePath))
+        )
 
     def add_book(self, book, parent='', index='end'):
         """Add an existing project file as book to the collection. 
@@ -93,20 +196,17 @@ class Collection:
         if not os.path.isfile(book.filePath):
             raise RuntimeError(f'"{norm_path(book.filePath)}" not found.')
 
-        for bkId in self.books:
-            if book.filePath == self.books[bkId].filePath:
+        root, path = self.pathResolver.get_location(book.filePath)
+        for member in self.books.values():
+            if path == member.path and root == member.root:
                 return None
 
         bkId = new_id(self.books, prefix=BOOK_PREFIX)
-        self.books[bkId] = Book(book.filePath)
-        self.books[bkId].pull_metadata(book.novel)
-        self.tree.insert(
-            parent,
-            index,
-            bkId,
-            text=self.books[bkId].title,
-            open=True,
-        )
+        newBook = Book(book.filePath)
+        newBook.set_location(self.pathResolver, root, path)
+        newBook.pull_metadata(book.novel)
+        self._insert_element(bkId, newBook, parent, index)
+        self._log_insertion('add', bkId, ())
         return bkId
 
     def add_series(self, seriesTitle, index='end'):
@@ -115,96 +215,536 @@ class Collection:
         Return the series ID.
         """
         srId = new_id(self.series, prefix=SERIES_PREFIX)
-        self.series[srId] = Series()
-        self.series[srId].title = seriesTitle
-        self.tree.insert(
-            '',
-            index,
-            srId,
-            text=self.series[srId].title,
-            tags='SERIES',
-            open=True,
-        )
+        newSeries = Series()
+        newSeries.title = seriesTitle
+        self._insert_element(srId, newSeries, '', index)
+        self._log_insertion('add', srId, ())
         return srId
 
-    def read(self):
-        """Parse the nvcx XML file located at filePath.
+    def apply_stats(self, statsByPath):
+        """Set the books' statistics and update the series totals.
         
-        Fetch the Collection attributes.
+        Positional arguments:
+            statsByPath -- dict: BookStats instance per book file path,
+                           as returned by StatsCache.collect().
+        
+        Books whose file path is not in statsByPath are not changed.
+        Return a message.
+        """
+        count = 0
+        for bkId, book in self.books.items():
+            if not book.filePath in statsByPath:
+                continue
+
+            stats = statsByPath[book.filePath]
+            if stats is not None:
+                count += 1
+            self._set_book_stats(bkId, stats)
+        return f'{_("Statistics updated")}: {count} {_("books")}.'
+
+    def filter_titles(self, text):
+        """Show only the books and series whose titles contain text.
+        
+        Words starting with "#" select books by their tags:
+            #a -- books tagged "a".
+            #a|#b -- books tagged "a" or "b".
+            -#a -- books not tagged "a".
+        Series are shown with the selected members only.
+        All conditions must be met.
+        The comparison is case-insensitive.
+        If text is empty, show all books and series.
+        """
+        words = []
+        required = []
+        excluded = []
+        for word in text.split():
+            if word.startswith('-#'):
+                excluded.append(word[2:])
+            elif word.startswith('#'):
+                required.append(
+                    [tag.lstrip('#') for tag in word.split('|') if tag.lstrip('#')]
+                )
+            else:
+                words.append(word)
+        text = ' '.join(words).casefold()
+        self._publish(ChangeBus.STRUCTURE, '')
+        if not (text or required or excluded):
+            self.treeFilter.clear()
+            return
+
+        if required or excluded:
+            selected = set(self.tagIndex.get_ids(
+                self.tagIndex.select(required, excluded)
+            ))
+        else:
+            selected = None
+
+        def is_visible(elementId):
+            if selected is not None and not elementId in selected:
+                return False
+
+            return text in self._get_element(elementId).title.casefold()
+
+        self.treeFilter.apply(is_visible)
+
+    def find_duplicates(self, digestsByPath):
+        """Return groups of books that refer to the same manuscript.
+        
+        Positional arguments:
+            digestsByPath -- dict: tuple (file digest, text digest) 
+                             per book file path, 
+                             as returned by StatsCache.collect_digests().
+        
+        Books are grouped, if their project files are identical,
+        or if their manuscript texts are the same.
+        Return a list of tuples (identical, book IDs), where identical 
+        is True if all project files of the group are identical. 
+        The book IDs are in tree order.
+        """
+        groups = {}
+        # Dictionary:
+        #   keyword -- text digest, or file digest if there is no text
+        #   value -- list of tuples (book ID, file digest)
+        bkIds = []
+        for node in self.treeFilter.get_children(''):
+            if node.startswith(BOOK_PREFIX):
+                bkIds.append(node)
+            else:
+                bkIds.extend(self.treeFilter.get_children(node))
+        for bkId in bkIds:
+            digests = digestsByPath.get(self.books[bkId].filePath, None)
+            if digests is None:
+                continue
+
+            fileDigest, textDigest = digests
+            key = textDigest if textDigest is not None else fileDigest
+            groups.setdefault(key, []).append((bkId, fileDigest))
+        duplicates = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+
+            fileDigests = set(fileDigest for __, fileDigest in members)
+            duplicates.append((
+                len(fileDigests) == 1,
+                tuple(bkId for bkId, __ in members),
+            ))
+        return duplicates
+
+    @classmethod
+    def get_book_paths(cls, filePath, records):
+        """Return the project file paths of a collection's records.
+        
+        Positional arguments:
+            filePath -- str: path to the collection file.
+            records -- list of records, as returned by preload().
+        """
+        pathResolver = PathResolver(os.path.dirname(os.path.abspath(filePath)))
+        bookPaths = []
+        for record in records:
+            if record['type'] == 'ROOT':
+                pathResolver.set_root(record['id'], record['path'])
+            elif record['type'] == 'BOOK' and record['path']:
+                bookPath = pathResolver.resolve(record['root'], record['path'])
+                if bookPath is not None:
+                    bookPaths.append(bookPath)
+        return bookPaths
+
+    def iter_records(self):
+        """Generate the root, series, and book records of the collection.
+        
+        The records are generated in document order, 
+        including the elements hidden by a filter.
+        See NvcxOpener.iter_records() for the record keys.
+        """
+        for name, directory in self.pathResolver.roots.items():
+            yield {'type': 'ROOT', 'id': name, 'path': directory}
+
+        for position, elementId in enumerate(self.treeFilter.get_children('')):
+            yield self._get_record(elementId, '', position)
+
+            if elementId.startswith(SERIES_PREFIX):
+                for memberPosition, bkId in enumerate(
+                    self.treeFilter.get_children(elementId)
+                ):
+                    yield self._get_record(bkId, elementId, memberPosition)
+
+    def merge_books(self, bkIds):
+        """Merge the collection entries of duplicate books.
+        
+        Positional arguments:
+            bkIds -- sequence of book IDs. The first book is kept.
+        
+        The kept book takes over the first description found, 
+        if it has none. The other books are removed.
+        The merge is undone in one step.
+        Return a message.
+        """
+        keptId = bkIds[0]
+        keptBook = self.books[keptId]
+        commands = []
+        if not keptBook.desc:
+            for bkId in bkIds[1:]:
+                desc = self.books[bkId].desc
+                if desc:
+                    commands.append(('desc', keptId, keptBook.desc, desc))
+                    keptBook.desc = desc
+                    break
+
+        for bkId in bkIds[1:]:
+            parent, index = self._get_position(bkId)
+            commands.append(('remove', bkId, self.books[bkId], parent, index, ()))
+            self._delete_element(bkId)
+        self.commandLog.push(('merge', tuple(commands)))
+        return (
+            f'{_("Duplicate books merged")}: '
+            f'"{keptBook.title}" ({len(bkIds) - 1}).'
+        )
+
+    def merge_collection(self, filePath):
+        """Add the series and books of another collection file.
+        
+        Positional arguments:
+            filePath -- str: path to the other collection file.
+        
+        The other file's records are processed in a single pass.
+        IDs already in use are replaced with new ones.
+        Books whose project file is already in the collection
+        are skipped; they are looked up in a set of normalized paths.
+        The book paths are stored relative to this collection's
+        roots or location, if possible.
+        The series and books are appended at the top level,
+        keeping the series membership.
+        The merge is undone in one step.
         Return a message.
         Raise the "RuntimeError" exception in case of error.
         """
+        otherResolver = PathResolver(os.path.dirname(os.path.abspath(filePath)))
+        pathKeys = set(self._get_path_key(book) for book in self.books.values())
+        nextNumbers = {
+            BOOK_PREFIX: self._get_next_number(self.books, BOOK_PREFIX),
+            SERIES_PREFIX: self._get_next_number(self.series, SERIES_PREFIX),
+        }
+        idMap = {}
+        # Dictionary:
+        #   keyword -- ID in the other file
+        #   value -- new ID, if the ID is already in use
 
-        def get_book(parent, xmlBook):
-            bkId = xmlBook.attrib[('id')]
-            xmlPath = xmlBook.find('Path')
-            if xmlPath is not None:
-                bookPath = xmlPath.text
-                if bookPath and os.path.isfile(bookPath):
-                    self.books[bkId] = Book(bookPath)
-                    xmlTitle = xmlBook.find('Title')
-                    if xmlTitle is not None and xmlTitle.text:
-                        self.books[bkId].title = xmlTitle.text
-                    else:
-                        self.books[bkId].title = f"{_('Untitled')} ({bkId})"
-                    xmlDesc = xmlBook.find('Desc')
-                    if xmlDesc is not None:
-                        paragraphs = []
-                        for xmlParagraph in xmlDesc.iterfind('p'):
-                            if xmlParagraph.text:
-                                paragraphs.append(xmlParagraph.text)
-                        self.books[bkId].desc = '\n'.join(paragraphs)
-                    self.tree.insert(
-                        parent,
-                        'end',
-                        bkId,
-                        text=self.books[bkId].title,
-                        open=True,
-                    )
+        positions = {'': len(self.treeFilter.get_children(''))}
+        # Index of the next child per parent.
+
+        commands = []
+        bookCount = 0
+        skipped = 0
+        validator = NvcxValidator()
+        try:
+            for record in self.fileOpener.iter_records(
+                filePath,
+                self.MAJOR_VERSION,
+                self.MINOR_VERSION,
+                validator=validator,
+            ):
+                if record['type'] == 'ROOT':
+                    otherResolver.set_root(record['id'], record['path'])
+                    continue
+
+                if record['type'] == 'SERIES':
+                    prefix = SERIES_PREFIX
+                    element = Series()
+                else:
+                    if not record['path']:
+                        continue
+
+                    prefix = BOOK_PREFIX
+                    root = record.get('root', None)
+                    path = record['path']
+                    bookPath = otherResolver.resolve(root, path)
+                    if bookPath is not None:
+                        root, path = self.pathResolver.get_location(bookPath)
+                    element = Book(path)
+                    element.set_location(self.pathResolver, root, path)
+                    pathKey = self._get_path_key(element)
+                    if pathKey in pathKeys:
+                        skipped += 1
+                        continue
 
-        xmlRoot = self.fileOpener.get_xml_root(
-            self.filePath,
-            self.MAJOR_VERSION,
-            self.MINOR_VERSION,
+                    pathKeys.add(pathKey)
+                    element.tags = record.get('tags', None) or []
+                    bookCount += 1
+                elementId = record['id']
+                if elementId in self.books or elementId in self.series:
+                    newId = f'{prefix}{nextNumbers[prefix]}'
+                    while newId in self.books or newId in self.series:
+                        nextNumbers[prefix] += 1
+                        newId = f'{prefix}{nextNumbers[prefix]}'
+                    nextNumbers[prefix] += 1
+                    idMap[elementId] = newId
+                    elementId = newId
+                if record['title']:
+                    element.title = record['title']
+                else:
+                    element.title = f"{_('Untitled')} ({elementId})"
+                desc = self._get_record_desc(record)
+                if desc is not None:
+                    element.set_stored_desc(self.descStore, desc)
+                parent = idMap.get(record['parent'], record['parent'])
+                if not parent in positions:
+                    parent = ''
+                index = positions[parent]
+                positions[parent] = index + 1
+                if prefix == SERIES_PREFIX:
+                    positions[elementId] = 0
+                self._insert_element(elementId, element, parent, 'end')
+                commands.append(('add', elementId, element, parent, index, ()))
+            if validator.violations:
+                raise RuntimeError(
+                    self._get_violation_report(validator.violations, filePath)
+                )
+
+        except:
+            # Leave the collection unchanged.
+            for command in reversed(commands):
+                self._execute(command, undo=True)
+            raise
+
+        if commands:
+            self.commandLog.push(('import', tuple(commands)))
+        return (
+            f'{_("Collection merged")}: "{norm_path(filePath)}" '
+            f'({bookCount} {_("books added")}, '
+            f'{skipped} {_("duplicates skipped")}).'
         )
+
+    def move_node(self, nodeId, parent, index):
+        """Move a book or series in the tree.
+        
+        Update the series statistics, if a book changes the series.
+        """
+        oldParent, oldIndex = self._get_position(nodeId)
+        self._move_element(nodeId, parent, index)
+        newParent, newIndex = self._get_position(nodeId)
+        if (oldParent, oldIndex) != (newParent, newIndex):
+            self.commandLog.push(
+                ('move', nodeId, oldParent, oldIndex, newParent, newIndex)
+            )
+
+    @classmethod
+    def preload(cls, filePath):
+        """Parse and validate the nvcx XML file at filePath.
+        
+        Return a tuple (records, file information, DTD violations)
+        to be passed to read(). 
+        This method does not access the tree, 
+        so it may run in a background thread.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        fileInfo = {'fingerprint': cls._get_fingerprint(filePath)}
+        validator = NvcxValidator()
+        records = list(cls.fileOpener.iter_records(
+            filePath,
+            cls.MAJOR_VERSION,
+            cls.MINOR_VERSION,
+            fileInfo=fileInfo,
+            validator=validator,
+        ))
+        return records, fileInfo, validator.violations
+
+    def pull_metadata(self, bkId, novel):
+        """Update a book's title and description from novel.
+        
+        The changes are made via set_title() and set_desc(),
+        so the indexes and the display are updated, and undo is possible.
+        Return True, if the book is changed, otherwise return False.
+        """
+        isChanged = self.set_title(bkId, novel.title)
+        if self.set_desc(bkId, novel.desc):
+            isChanged = True
+        return isChanged
+
+    def read(self, preloaded=None):
+        """Parse the nvcx XML file located at filePath.
+        
+        Optional arguments:
+            preloaded -- tuple, as returned by preload() for filePath.
+                         If given, the file is not parsed again.
+        
+        Fetch the Collection attributes.
+        The whole file is parsed and validated before the collection
+        is changed, so the collection is kept as it is in case of error.
+        Return a message.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        if preloaded is None:
+            preloaded = self.preload(self.filePath)
+        records, fileInfo, violations = preloaded
+        if violations:
+            raise RuntimeError(self._get_violation_report(violations))
+
         self.reset_tree()
         self.books.clear()
         self.series.clear()
-        for xmlElement in xmlRoot:
-            if xmlElement.tag == 'BOOK':
-                get_book('', xmlElement)
-            elif xmlElement.tag == 'SERIES':
-                srId = xmlElement.attrib['id']
-                self.series[srId] = Series()
-                xmlTitle = xmlElement.find('Title')
-                if xmlTitle is not None and xmlTitle.text:
-                    self.series[srId].title = xmlTitle.text
-                else:
-                    self.series[srId].title = f"{_('Untitled')} ({srId})"
-                xmlDesc = xmlElement.find('Desc')
-                if xmlDesc is not None:
-                    paragraphs = []
-                    for xmlParagraph in xmlDesc.iterfind('p'):
-                        if xmlParagraph.text:
-                            paragraphs.append(xmlParagraph.text)
-                    self.series[srId].desc = '\n'.join(paragraphs)
-                self.tree.insert(
-                    '',
-                    'end',
-                    srId,
-                    text=self.series[srId].title,
-                    tags='SERIES',
-                    open=True,
-                )
-                for xmlBook in xmlElement.iter('BOOK'):
-                    get_book(srId, xmlBook)
-        if not xmlRoot.attrib.get('version', None):
-            self.write()
+        self.collationKeys.clear()
+        self.titleIndex.clear()
+        self.tagIndex.clear()
+        self.commandLog.clear()
+        self.descStore.clear()
+        self.pathResolver.clear()
+        self._base = CollectionSnapshot()
+        titles = []
+        # Tuples (element ID, title) for loading the title index at once.
+
+        bookTags = []
+        # Tuples (book ID, tags) for loading the tag index at once.
+
+        for record in records:
+            if record['type'] == 'ROOT':
+                self.pathResolver.set_root(record['id'], record['path'])
+                self._base.add_record(record)
+                continue
+
+            elementId = record['id']
+            if elementId in self.books or elementId in self.series:
+                # Duplicate ID; reported by the validator.
+                continue
+
+            if record['type'] == 'SERIES':
+                element = Series()
+                self.series[elementId] = element
+                tags = 'SERIES'
+            else:
+                bookPath = record['path']
+                if not bookPath:
+                    continue
+
+                root = record.get('root', None)
+                if root is None and os.path.isabs(bookPath):
+                    # Shorten absolute paths, e.g. from legacy files.
+                    root, bookPath = self.pathResolver.get_location(bookPath)
+                element = Book(bookPath)
+                element.set_location(self.pathResolver, root, bookPath)
+                self.books[elementId] = element
+                # Books whose files are missing are kept,
+                # so they can be found again by moving their root.
+                self._check_book_file(element)
+                tags = self._get_book_tags(element)
+                if record['parent'] in self.series:
+                    self.series[record['parent']].stats.add_member(
+                        None,
+                        element.isMissing,
+                    )
+                element.tags = record.get('tags', None) or []
+                bookTags.append((elementId, element.tags))
+            if record['title']:
+                element.title = record['title']
+            else:
+                element.title = f"{_('Untitled')} ({elementId})"
+            titles.append((elementId, element.title))
+            desc = self._get_record_desc(record)
+            if desc is not None:
+                element.set_stored_desc(self.descStore, desc)
+            self._base.add(
+                elementId,
+                record['parent'],
+                element.title,
+                desc,
+                element.root if record['type'] == 'BOOK' else None,
+                element.path if record['type'] == 'BOOK' else None,
+                element.tags if record['type'] == 'BOOK' else None,
+            )
+            self.tree.insert(
+                record['parent'],
+                'end',
+                elementId,
+                text=element.title,
+                tags=tags,
+                open=True,
+            )
+        self.titleIndex.load(titles)
+        self.tagIndex.load(bookTags)
+        for srId in self.series:
+            self._show_stats(srId)
+        self.upgradePending = fileInfo.get('upgraded', False)
+        self._fingerprint = fileInfo.get('fingerprint', None)
         return (
             f'{len(self.books)} Books found '
             f'in "{norm_path(self.filePath)}".'
         )
 
+    def redo(self):
+        """Repeat the last undone edit.
+        
+        An active filter is cleared before.
+        Return a message, or None if there is nothing to redo.
+        """
+        command = self.commandLog.pop_redo()
+        if command is None:
+            return None
+
+        self.treeFilter.clear()
+        self._execute(command, undo=False)
+        return f'{_("Redo")}: {self.COMMAND_NAMES[command[0]]}.'
+
+    def refresh_nodes(self, changes):
+        """Display the changed element data in the tree.
+        
+        Positional arguments:
+            changes -- dict: set of ChangeBus event types per element ID.
+        
+        Each node is updated in a single call.
+        Elements deleted in the meantime are skipped.
+        """
+        for elementId, eventTypes in changes.items():
+            if elementId in self.books:
+                element = self.books[elementId]
+            elif elementId in self.series:
+                element = self.series[elementId]
+            else:
+                continue
+
+            if not self.tree.exists(elementId):
+                continue
+
+            options = {}
+            if ChangeBus.TITLE in eventTypes:
+                options['text'] = element.title
+            if ChangeBus.STATS in eventTypes:
+                if element.stats is None:
+                    options['values'] = ()
+                else:
+                    options['values'] = element.stats.get_values()
+            if ChangeBus.STATE in eventTypes and elementId in self.books:
+                options['tags'] = self._get_book_tags(element)
+            if options:
+                self.tree.item(elementId, **options)
+
+    def relocate_books(self, newPaths):
+        """Point missing books to the new locations of their project files.
+        
+        Positional arguments:
+            newPaths -- dict: new file path per old file path,
+                        as returned by BookLocator.locate().
+        
+        The new paths are stored relative to a root, if possible.
+        All books are relocated in one step, which is undone at once.
+        Return a list of the relocated book IDs.
+        """
+        relocations = []
+        for bkId, book in self.books.items():
+            if not book.isMissing:
+                continue
+
+            newPath = newPaths.get(book.filePath, None)
+            if newPath is None:
+                continue
+
+            root, path = self.pathResolver.get_location(newPath)
+            relocations.append((bkId, book.root, book.path, root, path))
+        for bkId, __, __, root, path in relocations:
+            self._set_location(bkId, root, path)
+        if relocations:
+            self.commandLog.push(('relocate', tuple(relocations)))
+        return [bkId for bkId, __, __, __, __ in relocations]
+
     def remove_book(self, bkId):
         """Remove a book from the collection.
 
@@ -214,8 +754,8 @@ class Collection:
         bookTitle = bkId
         try:
             bookTitle = self.books[bkId].title
-            del self.books[bkId]
-            self.tree.delete(bkId)
+            self._log_insertion('remove', bkId, ())
+            self._delete_element(bkId)
             message = (
                 f'{_("Book removed from the collection")}: '
                 f'"{bookTitle}".'
@@ -231,10 +771,15 @@ class Collection:
         Raise the "RuntimeError" exception in case of error.
         """
         seriesTitle = self.series[srId].title
-        for bookNode in self.tree.get_children(srId):
-            self.tree.move(bookNode, '', 'end')
-        del(self.series[srId])
-        self.tree.delete(srId)
+        __, index = self._get_position(srId)
+        self.commandLog.push((
+            'ungroup',
+            srId,
+            self.series[srId],
+            index,
+            self.treeFilter.get_children(srId),
+        ))
+        self._ungroup_series(srId)
         return f'{_("Series removed from the collection")}: "{seriesTitle}".'
 
         raise RuntimeError(f'{_("Cannot remove series")}: "{seriesTitle}".')
@@ -246,115 +791,691 @@ class Collection:
         Raise the "RuntimeError" exception in case of error.
         """
         seriesTitle = self.series[srId].title
-        for bkId in self.tree.get_children(srId):
-            del self.books[bkId]
-        del(self.series[srId])
-        self.tree.delete(srId)
+        members = []
+        for bkId in self.treeFilter.get_children(srId):
+            members.append((bkId, self.books[bkId]))
+        self._log_insertion('remove', srId, tuple(members))
+        self._delete_element(srId)
         return f'{_("Series removed from the collection")}: "{seriesTitle}".'
 
         raise RuntimeError(f'{_("Cannot remove series")}: "{seriesTitle}".')
 
     def reset_tree(self):
         """Clear the displayed tree."""
+        self.treeFilter.clear()
         for child in self.tree.get_children(''):
             self.tree.delete(child)
 
+    def restore_version(self, versionId):
+        """Replace the collection's content with a saved version.
+        
+        Positional arguments:
+            versionId -- str: ID of a version in the history.
+        
+        The restored content is not written, and the undo history 
+        is cleared. When written, the restored version becomes
+        the latest version, so no version is lost.
+        Return a message.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        try:
+            records = list(self.history.get_records(versionId))
+        except (OSError, ValueError) as ex:
+            raise RuntimeError(
+                f'{_("Cannot restore version")}: '
+                f'"{versionId}" - {str(ex)}'
+            )
+
+        base = self._base
+        self.read(preloaded=(records, {'fingerprint': self._fingerprint}, []))
+        self._base = base
+        # Changes by other processes are still merged when writing.
+
+        timestamp = self.history.get_timestamp(versionId)
+        return (
+            f'{_("Version restored")}: '
+            f'{timestamp.isoformat(sep=" ", timespec="seconds")}.'
+        )
+
+    def set_desc(self, elementId, desc):
+        """Change the description of a book or series.
+        
+        Return True, if the description is changed, otherwise return False.
+        """
+        oldDesc = self._get_element(elementId).desc
+        if desc == oldDesc:
+            return False
+
+        self.commandLog.push(('desc', elementId, oldDesc, desc))
+        self._get_element(elementId).desc = desc
+        return True
+
+    def set_root(self, name, directory):
+        """Define a named root directory, or move an existing one.
+        
+        Moving a root does not change any stored book path,
+        so the books stored relative to it follow the root.
+        Only their "missing" state is updated.
+        A new root takes over the books located in its directory.
+        Return a message.
+        """
+        isNew = not name in self.pathResolver.roots
+        self.pathResolver.set_root(name, directory)
+        for bkId, book in self.books.items():
+            if isNew:
+                root, path = self.pathResolver.get_location(book.filePath)
+                book.set_location(self.pathResolver, root, path)
+            elif book.root == name:
+                self._update_missing_state(bkId)
+        return f'{_("Root directory set")}: "{name}" = "{norm_path(directory)}".'
+
+    def set_tags(self, bkId, tags):
+        """Change the tags of a book.
+        
+        Positional arguments:
+            bkId -- str: book ID.
+            tags -- list of str: the new tags.
+        
+        Return True, if the tags are changed, otherwise return False.
+        """
+        oldTags = self.books[bkId].tags
+        if tags == oldTags:
+            return False
+
+        self.commandLog.push(('tags', bkId, oldTags, list(tags)))
+        self._set_tags(bkId, tags)
+        return True
+
+    def set_title(self, elementId, title):
+        """Change the title of a book or series.
+        
+        Return True, if the title is changed, otherwise return False.
+        """
+        oldTitle = self._get_element(elementId).title
+        if title == oldTitle:
+            return False
+
+        self.commandLog.push(('title', elementId, oldTitle, title))
+        self._set_title(elementId, title)
+        return True
+
+    def sort(self, parent=None, sortBy='title', reverse=False):
+        """Sort books and series.
+        
+        Optional arguments:
+            parent -- str: ID of the series to sort. 
+                      If None, sort the top level and all series.
+            sortBy -- str: 'title' or 'modified'.
+            reverse -- bool: if True, sort in descending order.
+        
+        Titles are sorted with cached locale-aware collation keys.
+        Elements without modification date are placed at the end.
+        Each sorted child list is applied to the tree at once.
+        An active filter is cleared before sorting.
+        Return a message.
+        """
+        self.treeFilter.clear()
+        if parent is None:
+            parents = ['']
+            parents.extend(self.tree.get_children(''))
+        else:
+            parents = [parent]
+        oldOrder = {}
+        newOrder = {}
+        for node in parents:
+            if node and not node.startswith(SERIES_PREFIX):
+                continue
+
+            children = list(self.tree.get_children(node))
+            oldOrder[node] = tuple(children)
+            if sortBy == 'modified':
+                dated = []
+                undated = []
+                for elementId in children:
+                    stats = self._get_element(elementId).stats
+                    if stats is None or stats.modified is None:
+                        undated.append(elementId)
+                    else:
+                        dated.append((stats.modified, elementId))
+                dated.sort(reverse=reverse)
+                children = [elementId for __, elementId in dated]
+                children.extend(undated)
+            else:
+                children.sort(
+                    key=lambda elementId: self.collationKeys.get_key(
+                        elementId,
+                        self._get_element(elementId).title,
+                    ),
+                    reverse=reverse,
+                )
+            self.tree.set_children(node, *children)
+            newOrder[node] = tuple(children)
+        self._publish(ChangeBus.STRUCTURE, '')
+        self.commandLog.push(('order', oldOrder, newOrder))
+        if parent:
+            return f'{_("Series sorted")}: "{self.series[parent].title}".'
+
+        return f'{_("Collection sorted")}.'
+
+    def split_series(self, srId, filePath):
+        """Move a series with its books into a new collection file.
+        
+        Positional arguments:
+            srId -- str: ID of the series to move.
+            filePath -- str: path of the new collection file.
+        
+        The records are streamed to the new file, which is compressed, 
+        if its name says so. The element IDs are kept.
+        The book paths are stored relative to the new file's location,
+        or to the roots the books refer to.
+        Then the series is removed from this collection. 
+        This can be undone, but the new file is kept.
+        Return a message.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        if os.path.exists(filePath):
+            raise RuntimeError(
+                f'{_("File already exists")}: "{norm_path(filePath)}".'
+            )
+
+        newDir = os.path.dirname(os.path.abspath(filePath))
+        newResolver = PathResolver(newDir)
+        members = self.treeFilter.get_children(srId)
+        rootNames = set(self.books[bkId].root for bkId in members)
+        for name in self.pathResolver.roots:
+            if not name in rootNames:
+                continue
+
+            directory = self.pathResolver.resolve(name, '.')
+            try:
+                directory = os.path.relpath(directory, newDir).replace(os.sep, '/')
+            except ValueError:
+                # There is no relative path, e.g. on another drive.
+                pass
+            newResolver.set_root(name, directory)
+        self._write_records(
+            filePath,
+            self._iter_series_records(srId, newResolver),
+        )
+        seriesTitle = self.series[srId].title
+        self.remove_series_with_books(srId)
+        return (
+            f'{_("Series moved to a new collection")}: '
+            f'"{seriesTitle}" ({len(members)} {_("books")}) '
+            f'-> "{norm_path(filePath)}".'
+        )
+
+    def undo(self):
+        """Reverse the last edit.
+        
+        An active filter is cleared before.
+        Return a message, or None if there is nothing to undo.
+        """
+        command = self.commandLog.pop_undo()
+        if command is None:
+            return None
+
+        self.treeFilter.clear()
+        self._execute(command, undo=True)
+        return f'{_("Undo")}: {self.COMMAND_NAMES[command[0]]}.'
+
     def write(self):
         """Write the collection's attributes to a nvcx XML file. 
         
         The nvcx file is located at filePath. 
-        Overwrite existing file without confirmation.
+        While writing, the file is locked against other processes.
+        If another process has changed the file since it was read
+        or written by this instance, the changes are merged 
+        into the collection instead of being overwritten. 
+        In this case, the collection is rebuilt, the undo history
+        is cleared, and mergeConflicts lists the elements changed 
+        on both sides. If the changed file cannot be read, 
+        nothing is written.
+        The version written is stored in the history.
         Return a message.
         Raise the "RuntimeError" exception in case of error.
         """
+        with FileLock(self.filePath):
+            self.mergeConflicts = None
+            if self._is_changed_externally():
+                self._merge_external_changes()
+            self._base = self._write_file()
+            self._fingerprint = self._get_fingerprint(self.filePath)
+        self.upgradePending = False
+        if self.mergeConflicts is None:
+            return f'"{norm_path(self.filePath)}" written.'
 
-        def walk_tree(node, xmlNode):
-            # Transform the Treeview nodes to XML Elementtree nodes.
-            for elementId in self.tree.get_children(node):
-                if elementId.startswith(BOOK_PREFIX):
-                    xmlBook = ET.SubElement(xmlNode, 'BOOK')
-                    xmlBook.set('id', elementId)
-                    xmlBookTitle = ET.SubElement(xmlBook, 'Title')
-                    if self.books[elementId].title:
-                        xmlBookTitle.text = self.books[elementId].title
-                    if self.books[elementId].desc:
-                        xmlBookDesc = ET.SubElement(xmlBook, 'Desc')
-                        for paragraph in self.books[
-                            elementId
-                        ].desc.split('\n'):
-                            ET.SubElement(
-                                xmlBookDesc,
-                                'p',
-                            ).text = paragraph.strip()
-                    xmlBookPath = ET.SubElement(xmlBook, 'Path')
-                    xmlBookPath.text = self.books[elementId].filePath
-                elif elementId.startswith(SERIES_PREFIX):
-                    xmlSeries = ET.SubElement(xmlNode, 'SERIES')
-                    xmlSeries.set('id', elementId)
-                    xmlSeriesTitle = ET.SubElement(xmlSeries, 'Title')
-                    if self.series[elementId].title:
-                        xmlSeriesTitle.text = self.series[elementId].title
-                    if self.series[elementId].desc:
-                        xmlSeriesDesc = ET.SubElement(xmlSeries, 'Desc')
-                        for paragraph in self.series[elementId
-                                                     ].desc.split('\n'):
-                            ET.SubElement(
-                                xmlSeriesDesc,
-                                'p',
-                            ).text = paragraph.strip()
-                    walk_tree(elementId, xmlSeries)
-
-        xmlRoot = ET.Element('nvcx')
-        xmlRoot.set('version', f'{self.MAJOR_VERSION}.{self.MINOR_VERSION}')
-        walk_tree('', xmlRoot)
-
-        indent(xmlRoot)
-        xmlTree = ET.ElementTree(xmlRoot)
-        backedUp = False
-        if os.path.isfile(self.filePath):
-            try:
-                os.replace(self.filePath, f'{self.filePath}.bak')
-            except:
-                raise RuntimeError(
-                    f'{_("Cannot overwrite file")}: '
-                    f'"{norm_path(self.filePath)}".'
-                )
+        message = (
+            f'"{norm_path(self.filePath)}" {_("written")}; '
+            f'{_("merged with changes by another process")}'
+        )
+        if self.mergeConflicts:
+            message = f'{message} ({len(self.mergeConflicts)} {_("conflicts")})'
+        return f'{message}; {_("undo history cleared")}.'
+
+    def _add_to_series(self, srId, book):
+        # Add a member book to the series aggregates.
+        self.series[srId].stats.add_member(book.stats, book.isMissing)
+        self._show_stats(srId)
+
+    def _check_book_file(self, book):
+        # Update the book's missing state.
+        bookFile = book.filePath
+        book.isMissing = not (bookFile and os.path.isfile(bookFile))
+
+    def _delete_element(self, elementId):
+        # Remove a book, or a series with all its members.
+        if elementId.startswith(BOOK_PREFIX):
+            parent = self.treeFilter.get_parent(elementId)
+            if parent:
+                self._remove_from_series(parent, self.books[elementId])
+            del self.books[elementId]
+            self.collationKeys.discard(elementId)
+            self.titleIndex.discard(elementId)
+            self.tagIndex.discard(elementId)
+            self.treeFilter.remove_node(elementId)
+            self.tree.delete(elementId)
+            self._publish(ChangeBus.STRUCTURE, elementId)
+            return
+
+        members = self.treeFilter.get_children(elementId)
+        for bkId in members:
+            del self.books[bkId]
+            self.collationKeys.discard(bkId)
+            self.titleIndex.discard(bkId)
+            self.tagIndex.discard(bkId)
+            self._publish(ChangeBus.STRUCTURE, bkId)
+        del(self.series[elementId])
+        self.collationKeys.discard(elementId)
+        self.titleIndex.discard(elementId)
+        self.treeFilter.remove_node(elementId)
+        self.tree.delete(elementId)
+        for bkId in members:
+            # Hidden members are detached, so they are deleted separately.
+            if self.tree.exists(bkId):
+                self.tree.delete(bkId)
+        self._publish(ChangeBus.STRUCTURE, elementId)
+
+    def _execute(self, command, undo):
+        # Reverse or repeat an edit command.
+        # The filter must be cleared before.
+        commandType = command[0]
+        if commandType in ('add', 'remove'):
+            __, elementId, element, parent, index, members = command
+            if (commandType == 'add') == undo:
+                self._delete_element(elementId)
+            else:
+                self._insert_element(elementId, element, parent, index, members)
+        elif commandType == 'ungroup':
+            __, srId, series, index, members = command
+            if undo:
+                self._insert_element(srId, series, '', index)
+                for bkId in members:
+                    self._move_element(bkId, srId, 'end')
+            else:
+                self._ungroup_series(srId)
+        elif commandType == 'move':
+            __, nodeId, oldParent, oldIndex, newParent, newIndex = command
+            if undo:
+                self._move_element(nodeId, oldParent, oldIndex)
             else:
-                backedUp = True
+                self._move_element(nodeId, newParent, newIndex)
+        elif commandType == 'title':
+            __, elementId, oldTitle, newTitle = command
+            self._set_title(elementId, oldTitle if undo else newTitle)
+        elif commandType == 'desc':
+            __, elementId, oldDesc, newDesc = command
+            self._get_element(elementId).desc = oldDesc if undo else newDesc
+        elif commandType == 'tags':
+            __, bkId, oldTags, newTags = command
+            self._set_tags(bkId, oldTags if undo else newTags)
+        elif commandType == 'relocate':
+            __, relocations = command
+            for bkId, oldRoot, oldPath, newRoot, newPath in relocations:
+                if undo:
+                    self._set_location(bkId, oldRoot, oldPath)
+                else:
+                    self._set_location(bkId, newRoot, newPath)
+        elif commandType == 'order':
+            __, oldOrder, newOrder = command
+            for node, children in (oldOrder if undo else newOrder).items():
+                self.tree.set_children(node, *children)
+            self._publish(ChangeBus.STRUCTURE, '')
+        elif commandType in ('merge', 'import'):
+            __, commands = command
+            if undo:
+                commands = reversed(commands)
+            for subcommand in commands:
+                self._execute(subcommand, undo)
+
+    def _get_book_tags(self, book):
+        # Return the tree tags for displaying a book.
+        if book.isMissing:
+            return 'MISSING'
+
+        return ''
+
+    def _get_element(self, elementId):
+        # Return the Book or Series instance of elementId.
+        if elementId.startswith(BOOK_PREFIX):
+            return self.books[elementId]
+
+        return self.series[elementId]
+
+    @classmethod
+    def _get_fingerprint(cls, filePath):
+        # Return a digest of the content of the file at filePath.
+        # Return None, if the file cannot be read.
         try:
-            xmlTree.write(self.filePath, encoding='utf-8')
+            digest = hashlib.blake2b(digest_size=16)
+            with open(filePath, 'rb') as f:
+                while True:
+                    chunk = f.read(NvcxValidator.CHUNK_SIZE)
+                    if not chunk:
+                        break
 
-            # Postprocess the xml file created by ElementTree
-            self._postprocess_xml_file(self.filePath)
-        except:
-            if backedUp:
-                os.replace(f'{self.filePath}.bak', self.filePath)
+                    digest.update(chunk)
+        except OSError:
+            return None
+
+        return digest.digest()
+
+    def _get_next_number(self, elements, prefix):
+        # Return the number following the highest ID number with prefix.
+        highest = 0
+        for elementId in elements:
+            number = elementId[len(prefix):]
+            if elementId.startswith(prefix) and number.isdecimal():
+                highest = max(highest, int(number))
+        return highest + 1
+
+    def _get_path_key(self, book):
+        # Return a key that identifies the book's project file.
+        filePath = book.filePath
+        if filePath is None:
+            # The root is unknown.
+            return book.root, book.path
+
+        return os.path.normcase(os.path.normpath(filePath))
+
+    def _get_position(self, nodeId):
+        # Return a tuple (parent ID, index) in the unfiltered tree.
+        parent = self.treeFilter.get_parent(nodeId)
+        return parent, self.treeFilter.get_children(parent).index(nodeId)
+
+    def _get_record(self, elementId, parent, position):
+        # Return the record of a book or series.
+        element = self._get_element(elementId)
+        record = {
+            'type': 'BOOK' if elementId.startswith(BOOK_PREFIX) else 'SERIES',
+            'id': elementId,
+            'parent': parent,
+            'position': position,
+            'title': element.title or '',
+            'desc': None,
+        }
+        desc = element.desc
+        if desc:
+            # Paragraphs are saved stripped.
+            record['desc'] = '\n'.join(
+                paragraph.strip() for paragraph in desc.split('\n')
+            )
+        if elementId.startswith(BOOK_PREFIX):
+            record['tags'] = list(element.tags) or None
+            record['path'] = element.path
+            record['root'] = element.root
+        return record
+
+    @classmethod
+    def _get_record_desc(cls, record):
+        # Return the record's description without empty paragraphs, or None.
+        desc = record['desc']
+        if desc is None:
+            return None
+
+        paragraphs = []
+        for paragraph in desc.split('\n'):
+            if paragraph:
+                paragraphs.append(paragraph)
+        return '\n'.join(paragraphs)
+
+    def _get_violation_report(self, violations, filePath=None):
+        # Return an error message listing the DTD violations
+        # of the collection file, or of the file at filePath.
+        if filePath is None:
+            filePath = self.filePath
+        lines = [
+            f'{_("Invalid collection file")}: "{norm_path(filePath)}".'
+        ]
+        for lineNumber, message in violations[:self.MAX_REPORTED_VIOLATIONS]:
+            lines.append(f'{_("Line")} {lineNumber}: {message}.')
+        if len(violations) > self.MAX_REPORTED_VIOLATIONS:
+            lines.append(
+                f'({len(violations) - self.MAX_REPORTED_VIOLATIONS} '
+                f'{_("more")})'
+            )
+        return '\n'.join(lines)
+
+    def _init_history(self):
+        # Store the file's version, if the history is empty,
+        # e.g. for files written before the history was introduced.
+        if self.history.get_versions() or not os.path.isfile(self.filePath):
+            return
+
+        try:
+            records, __, __ = self.preload(self.filePath)
+            self.history.add_version(records)
+        except (RuntimeError, OSError):
+            pass
+
+    def _insert_element(self, elementId, element, parent, index, members=()):
+        # Insert a Book or Series instance and its members into the tree.
+        if elementId.startswith(BOOK_PREFIX):
+            self.books[elementId] = element
+            self._check_book_file(element)
+            self.tagIndex.add(elementId, element.tags)
+            tags = self._get_book_tags(element)
+        else:
+            self.series[elementId] = element
+            element.stats = SeriesStats()
+            tags = 'SERIES'
+        self.titleIndex.add(elementId, element.title)
+        self.tree.insert(
+            parent,
+            index,
+            elementId,
+            text=element.title,
+            tags=tags,
+            open=True,
+        )
+        self.treeFilter.update_node(elementId)
+        self._publish(ChangeBus.STRUCTURE, elementId)
+        if elementId.startswith(BOOK_PREFIX):
+            if parent:
+                self._add_to_series(parent, element)
+            if element.stats is not None:
+                self._show_stats(elementId)
+        else:
+            self._show_stats(elementId)
+        for bkId, book in members:
+            self._insert_element(bkId, book, elementId, 'end')
+
+    def _is_changed_externally(self):
+        # Return True, if the file was changed by another process
+        # since it was read or written by this instance.
+        if self._fingerprint is None:
+            return False
+
+        fingerprint = self._get_fingerprint(self.filePath)
+        return fingerprint is not None and fingerprint != self._fingerprint
+
+    def _iter_series_records(self, srId, pathResolver):
+        # Generate the records of a series and its books for a new file
+        # whose book paths are resolved by pathResolver.
+        for name, directory in pathResolver.roots.items():
+            yield {'type': 'ROOT', 'id': name, 'path': directory}
+
+        yield self._get_record(srId, '', 0)
+
+        for position, bkId in enumerate(self.treeFilter.get_children(srId)):
+            record = self._get_record(bkId, srId, position)
+            filePath = self.books[bkId].filePath
+            if filePath is not None:
+                record['root'], record['path'] = pathResolver.get_location(filePath)
+            yield record
+
+    def _log_insertion(self, commandType, elementId, members):
+        # Record adding or removing an element that is in the tree.
+        parent, index = self._get_position(elementId)
+        self.commandLog.push((
+            commandType,
+            elementId,
+            self._get_element(elementId),
+            parent,
+            index,
+            members,
+        ))
+
+    def _merge_external_changes(self):
+        # Merge the file's changes into the collection, and rebuild it.
+        # Raise the "RuntimeError" exception, if the changed file 
+        # cannot be read, so the other process's changes are not lost.
+        try:
+            theirs, fileInfo, violations = self.preload(self.filePath)
+        except RuntimeError as ex:
             raise RuntimeError(
-                f'{_("Cannot write file")}: '
-                f'"{norm_path(self.filePath)}".'
+                f'{_("Cannot merge the changes by another process")}: {str(ex)}'
             )
 
-        return f'"{norm_path(self.filePath)}" written.'
+        if violations:
+            raise RuntimeError(
+                f'{_("Cannot merge the changes by another process")}: '
+                f'{self._get_violation_report(violations)}'
+            )
 
-    def _postprocess_xml_file(self, filePath):
-        """Postprocess an xml file created by ElementTree.
-        
-        Positional argument:
-            filePath -- str: path to xml file.
-        
-        Read the xml file, put a header on top. Overwrite the .nvcx xml file.
-        Raise the "RuntimeError" exception in case of error. 
-        
-        Note: The path is given as an argument rather than using self.filePath. 
-        So this routine can be used for novelibre-generated xml files 
-        other than .nvcx as well. 
-        """
-        with open(filePath, 'r', encoding='utf-8') as f:
-            text = f.read()
-            text = strip_illegal_characters(text)
+        records, self.mergeConflicts = CollectionMerger.merge(
+            self._base,
+            list(self.iter_records()),
+            theirs,
+        )
+        self.read(preloaded=(records, fileInfo, []))
+
+    def _move_element(self, nodeId, parent, index):
+        # Move a node and update the series statistics.
+        oldParent = self.treeFilter.get_parent(nodeId)
+        self.tree.move(nodeId, parent, index)
+        self.treeFilter.update_node(nodeId)
+        self._publish(ChangeBus.STRUCTURE, nodeId)
+        if oldParent == parent or not nodeId.startswith(BOOK_PREFIX):
+            return
+
+        if oldParent:
+            self._remove_from_series(oldParent, self.books[nodeId])
+        if parent:
+            self._add_to_series(parent, self.books[nodeId])
+
+    def _publish(self, eventType, elementId):
+        # Publish a change of the displayed element data.
+        if self.changeBus.has_subscribers():
+            self.changeBus.publish(eventType, elementId)
+        else:
+            self.refresh_nodes({elementId: {eventType}})
+
+    def _remove_from_series(self, srId, book):
+        # Remove a member book from the series aggregates.
+        self.series[srId].stats.remove_member(book.stats, book.isMissing)
+        self._show_stats(srId)
+
+    def _set_book_stats(self, bkId, stats):
+        # Replace a book's statistics and update the series totals.
+        book = self.books[bkId]
+        parent = self.treeFilter.get_parent(bkId)
+        if parent:
+            self.series[parent].stats.remove_member(book.stats, book.isMissing)
+        book.stats = stats
+        if parent:
+            self._add_to_series(parent, book)
+        self._show_stats(bkId)
+
+    def _set_location(self, bkId, root, path):
+        # Change a book's stored path, and check the project file.
+        self.books[bkId].set_location(self.pathResolver, root, path)
+        self._update_missing_state(bkId)
+
+    def _set_tags(self, bkId, tags):
+        # Change a book's tags in the model and in the tag index.
+        self.books[bkId].tags = list(tags)
+        self.tagIndex.add(bkId, tags)
+
+    def _set_title(self, elementId, title):
+        # Change a title in the model and in the tree.
+        self._get_element(elementId).title = title
+        self.collationKeys.discard(elementId)
+        self.titleIndex.add(elementId, title)
+        self._publish(ChangeBus.TITLE, elementId)
+
+    def _show_stats(self, nodeId):
+        # Have the statistics displayed in the tree's columns.
+        self._publish(ChangeBus.STATS, nodeId)
+
+    def _ungroup_series(self, srId):
+        # Move the members of a series to the top level and delete the series.
+        for bookNode in self.treeFilter.get_children(srId):
+            self.tree.move(bookNode, '', 'end')
+            self.treeFilter.update_node(bookNode)
+            self._publish(ChangeBus.STRUCTURE, bookNode)
+        del(self.series[srId])
+        self.collationKeys.discard(srId)
+        self.titleIndex.discard(srId)
+        self.treeFilter.remove_node(srId)
+        self.tree.delete(srId)
+        self._publish(ChangeBus.STRUCTURE, srId)
+
+    def _update_missing_state(self, bkId):
+        # Check the book's project file, and update the series' missing count.
+        book = self.books[bkId]
+        wasMissing = book.isMissing
+        self._check_book_file(book)
+        self._publish(ChangeBus.STATE, bkId)
+        parent = self.treeFilter.get_parent(bkId)
+        if parent and book.isMissing != wasMissing:
+            self.series[parent].stats.set_missing(wasMissing, book.isMissing)
+            self._show_stats(parent)
+
+    def _write_file(self):
+        # Write the collection file, and store the version in the history.
+        # Return a CollectionSnapshot of the records written.
+        self._init_history()
+        records = list(self.iter_records())
+        self._write_records(self.filePath, records)
         try:
-            with open(filePath, 'w', encoding='utf-8') as f:
-                f.write(f'{self.XML_HEADER}{text}')
-        except:
-            raise RuntimeError(f'{_("Cannot write file")}: "{norm_path(filePath)}".')
+            self.history.add_version(records)
+        except OSError:
+            # The file is written anyway.
+            pass
+        return CollectionSnapshot(records)
 
+    @classmethod
+    def _write_records(cls, filePath, records):
+        # Stream the records to a temporary file, compressed if the name says so.
+        # Then replace the file at filePath.
+        tempPath = f'{filePath}.tmp'
+        try:
+            with NvcxCompression.open_write(
+                tempPath,
+                compressed=NvcxCompression.has_compressed_name(filePath),
+            ) as f:
+                writer = NvcxWriter(f, cls.MAJOR_VERSION, cls.MINOR_VERSION)
+                for record in records:
+                    writer.write_record(record)
+                writer.close()
+            os.replace(tempPath, filePath)
+        except:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            raise RuntimeError(
+                f'{_("Cannot write file")}: '
+                f'"{norm_path(filePath)}".'
+            )
@@ -0,0 +1,648 @@
+"""Provide a class for the headless command line interface.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+import json
+import os
+from pathlib import Path
+
+from nvcollection.book_locator import BookLocator
+from nvcollection.collection import Collection
+from nvcollection.headless_tree import HeadlessTree
+from nvcollection.ndjson_converter import NdjsonConverter
+from nvcollection.nvcollection_globals import BOOK_PREFIX
+from nvcollection.nvcollection_globals import SERIES_PREFIX
+from nvcollection.nvcollection_locale import _
+from nvcollection.novx_metadata_writer import NovxMetadataWriter
+from nvcollection.nvcx_compression import NvcxCompression
+from nvcollection.nvcx_validator import NvcxValidator
+from nvcollection.stats_cache import StatsCache
+from nvlib.model.data.novel import Novel
+from nvlib.model.data.nv_tree import NvTree
+from nvlib.model.novx.novx_file import NovxFile
+from nvlib.novx_globals import norm_path
+
+
+class CollectionCli:
+    """Command line interface for processing collection files without a display.
+
+    Each command prints one JSON object per processed file
+    to stdout, in the order of the arguments.
+    Commands that accept several collection files process them
+    in parallel worker processes.
+
+    Exit status:
+        0 -- all files processed successfully.
+        1 -- at least one file is invalid, or an error occurred.
+        2 -- invalid command line arguments.
+    """
+    PROG = 'python -m nvcollection'
+    CONFIG_DIR = '.novx/config'
+    # novelibre configuration directory, relative to the home directory.
+
+    MULTI_FILE_COMMANDS = ('validate', 'list', 'stats', 'refresh', 'export', 'import')
+    # Commands that process each of their file arguments independently.
+
+    @classmethod
+    def main(cls, args=None):
+        """Run the command given by args and return the exit status.
+
+        Optional arguments:
+            args -- list of command line arguments. Default: sys.argv.
+        """
+        options = cls._get_parser().parse_args(args)
+        if options.command in cls.MULTI_FILE_COMMANDS:
+            filePaths = options.files
+        else:
+            filePaths = [options.collection]
+        process = partial(cls._process_file, options)
+        if len(filePaths) > 1 and options.jobs != 1:
+            with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+                status = cls._print_results(executor.map(process, filePaths))
+        else:
+            status = cls._print_results(map(process, filePaths))
+        return status
+
+    @classmethod
+    def _add(cls, filePath, options):
+        # Add project files as books; create the collection, if necessary.
+        collection = cls._get_collection(filePath, mustExist=False)
+        parent = options.series
+        if parent and not parent in collection.series:
+            raise RuntimeError(f'{_("Series not found")}: "{parent}".')
+
+        added = []
+        existing = []
+        failed = []
+        for projectPath in options.projects:
+            book = NovxFile(projectPath)
+            book.novel = Novel(tree=NvTree())
+            try:
+                book.read()
+                bkId = collection.add_book(book, parent)
+            except Exception as ex:
+                failed.append({'path': projectPath, 'error': str(ex)})
+                continue
+
+            if bkId is None:
+                existing.append(projectPath)
+            else:
+                added.append(bkId)
+        result = {'added': added, 'existing': existing, 'failed': failed}
+        if added or not os.path.isfile(filePath):
+            result['message'] = collection.write()
+        return not failed, result
+
+    @classmethod
+    def _export(cls, filePath, options):
+        # Convert a collection file to NDJSON.
+        basePath = filePath
+        if NvcxCompression.has_compressed_name(basePath):
+            basePath = os.path.splitext(basePath)[0]
+        ndjsonPath = f'{os.path.splitext(basePath)[0]}.ndjson'
+        return True, {
+            'message': NdjsonConverter.export_collection(filePath, ndjsonPath),
+        }
+
+    @classmethod
+    def _get_collection(cls, filePath, mustExist=True):
+        # Return a Collection instance with a headless tree.
+        collection = Collection(filePath, HeadlessTree())
+        if collection.filePath is None:
+            raise RuntimeError(
+                f'{_("File type is not supported")}: "{norm_path(filePath)}".'
+            )
+
+        if mustExist or os.path.isfile(filePath):
+            collection.read()
+        return collection
+
+    @classmethod
+    def _get_elements(cls, collection, withStats=False):
+        # Return a list of dictionaries describing the books and series
+        # in tree order.
+        elements = []
+        for node in collection.tree.get_children(''):
+            nodes = [(node, '')]
+            nodes.extend(
+                (child, node) for child in collection.tree.get_children(node)
+            )
+            for elementId, parent in nodes:
+                if elementId.startswith(BOOK_PREFIX):
+                    book = collection.books[elementId]
+                    data = {
+                        'type': 'BOOK',
+                        'id': elementId,
+                        'parent': parent,
+                        'title': book.title,
+                        'path': book.path,
+                        'root': book.root,
+                        'filePath': book.filePath,
+                        'missing': book.isMissing,
+                        'tags': list(book.tags),
+                    }
+                    stats = book.stats
+                else:
+                    series = collection.series[elementId]
+                    data = {
+                        'type': 'SERIES',
+                        'id': elementId,
+                        'parent': parent,
+                        'title': series.title,
+                        'books': series.stats.books,
+                        'missing': series.stats.missing,
+                    }
+                    stats = series.stats
+                if withStats:
+                    data.update(cls._get_stats_data(stats))
+                elements.append(data)
+        return elements
+
+    @classmethod
+    def _get_parser(cls):
+        # Return the command line parser.
+        parser = argparse.ArgumentParser(
+            prog=cls.PROG,
+            description=_('Process novelibre collection files without a display.'),
+        )
+        parser.add_argument(
+            '-j', '--jobs',
+            type=cls._positive_int,
+            default=None,
+            help=_('number of worker processes (default: number of cores)'),
+        )
+        subparsers = parser.add_subparsers(dest='command', required=True)
+
+        for command, helpText in (
+            ('validate', _('check collection files against the DTD')),
+            ('list', _('list the books and series of collection files')),
+            ('stats', _('list the manuscript statistics of collection files')),
+            ('refresh', _('update titles and descriptions from the project files')),
+            ('export', _('convert collection files to NDJSON files')),
+        ):
+            subparser = subparsers.add_parser(command, help=helpText)
+            subparser.add_argument(
+                'files',
+                nargs='+',
+                metavar='collection',
+                help=_('collection file path'),
+            )
+            if command == 'list':
+                subparser.add_argument(
+                    '-f', '--filter',
+                    default='',
+                    help=_('list only the matching books and series, e.g. "#fantasy -#draft"'),
+                )
+
+        subparser = subparsers.add_parser(
+            'import',
+            help=_('convert NDJSON files to collection files'),
+        )
+        subparser.add_argument(
+            'files',
+            nargs='+',
+            metavar='ndjson',
+            help=_('NDJSON file path'),
+        )
+
+        subparser = subparsers.add_parser(
+            'add',
+            help=_('add project files as books to a collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'projects',
+            nargs='+',
+            metavar='project',
+            help=_('novelibre project file path'),
+        )
+        subparser.add_argument(
+            '-s', '--series',
+            default='',
+            help=_('ID of the series to add the books to'),
+        )
+
+        subparser = subparsers.add_parser(
+            'remove',
+            help=_('remove books or series from a collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'elements',
+            nargs='+',
+            metavar='id',
+            help=_('ID of a book or series'),
+        )
+        subparser.add_argument(
+            '-b', '--with-books',
+            action='store_true',
+            help=_('remove the series members as well'),
+        )
+
+        subparser = subparsers.add_parser(
+            'push',
+            help=_('write titles and descriptions into the project files'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'elements',
+            nargs='*',
+            metavar='id',
+            help=_('ID of a book or series (default: all books)'),
+        )
+
+        subparser = subparsers.add_parser(
+            'merge',
+            help=_('add the series and books of other collections to a collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'sources',
+            nargs='+',
+            metavar='source',
+            help=_('path of a collection file to merge'),
+        )
+
+        subparser = subparsers.add_parser(
+            'split',
+            help=_('move a series with its books into a new collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument('series', help=_('ID of the series to move'))
+        subparser.add_argument('output', help=_('path of the new collection file'))
+
+        subparser = subparsers.add_parser(
+            'relocate',
+            help=_('find the project files of missing books in directories'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'directories',
+            nargs='+',
+            metavar='directory',
+            help=_('directory to search, including its subdirectories'),
+        )
+        subparser.add_argument(
+            '--stats-cache',
+            default=cls._get_stats_cache_path(),
+            metavar='file',
+            help=_('statistics cache file with the last known file sizes (default: the plugin\'s cache)'),
+        )
+
+        subparser = subparsers.add_parser(
+            'tag',
+            help=_('add or remove book tags'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument(
+            'elements',
+            nargs='+',
+            metavar='id',
+            help=_('ID of a book or series'),
+        )
+        subparser.add_argument(
+            '-a', '--add',
+            action='append',
+            default=[],
+            metavar='tag',
+            help=_('tag to add'),
+        )
+        subparser.add_argument(
+            '-r', '--remove',
+            action='append',
+            default=[],
+            metavar='tag',
+            help=_('tag to remove'),
+        )
+
+        subparser = subparsers.add_parser(
+            'history',
+            help=_('list the saved versions of a collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+
+        subparser = subparsers.add_parser(
+            'restore',
+            help=_('restore a saved version of a collection'),
+        )
+        subparser.add_argument('collection', help=_('collection file path'))
+        subparser.add_argument('version', help=_('version ID, as listed by "history"'))
+        return parser
+
+    @classmethod
+    def _get_stats_cache_path(cls):
+        # Return the path of the plugin's statistics cache file.
+        try:
+            homeDir = str(Path.home()).replace('\\', '/')
+        except RuntimeError:
+            return None
+
+        return f'{homeDir}/{cls.CONFIG_DIR}/{StatsCache.FILENAME}'
+
+    @classmethod
+    def _get_stats_data(cls, stats):
+        # Return a dictionary with the values of a BookStats instance.
+        if stats is None:
+            return {'words': None, 'chapters': None, 'sections': None, 'modified': None}
+
+        if stats.modified is None:
+            modified = None
+        else:
+            modified = datetime.fromtimestamp(stats.modified).isoformat(timespec='seconds')
+        return {
+            'words': stats.words,
+            'chapters': stats.chapters,
+            'sections': stats.sections,
+            'modified': modified,
+        }
+
+    @classmethod
+    def _history(cls, filePath, options):
+        # List the saved versions of a collection, the latest first.
+        collection = Collection(filePath, HeadlessTree())
+        if collection.filePath is None:
+            raise RuntimeError(
+                f'{_("File type is not supported")}: "{norm_path(filePath)}".'
+            )
+
+        versions = []
+        for versionId in collection.history.get_versions():
+            books, series = collection.history.get_summary(versionId)
+            timestamp = collection.history.get_timestamp(versionId)
+            versions.append({
+                'version': versionId,
+                'time': timestamp.isoformat(timespec='seconds'),
+                'books': books,
+                'series': series,
+            })
+        return True, {'versions': versions}
+
+    @classmethod
+    def _import(cls, filePath, options):
+        # Convert an NDJSON file to a collection file.
+        nvcxPath = f'{os.path.splitext(filePath)[0]}.{Collection.EXTENSION}'
+        return True, {
+            'message': NdjsonConverter.import_collection(filePath, nvcxPath),
+        }
+
+    @classmethod
+    def _list(cls, filePath, options):
+        # List the roots, series, and books of a collection.
+        collection = cls._get_collection(filePath)
+        collection.filter_titles(options.filter)
+        return True, {
+            'roots': dict(collection.pathResolver.roots),
+            'elements': cls._get_elements(collection),
+        }
+
+    @classmethod
+    def _merge(cls, filePath, options):
+        # Add the series and books of other collection files;
+        # create the collection, if necessary.
+        collection = cls._get_collection(filePath, mustExist=False)
+        result = {
+            'merged': [
+                collection.merge_collection(sourcePath)
+                for sourcePath in options.sources
+            ],
+        }
+        result['message'] = collection.write()
+        return True, result
+
+    @classmethod
+    def _positive_int(cls, value):
+        # Return value as a positive integer; argparse type function.
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise argparse.ArgumentTypeError(
+                f'{_("must be a positive integer")}: "{value}"'
+            )
+
+        return number
+
+    @classmethod
+    def _print_results(cls, results):
+        # Print the results as JSON lines, and return the exit status.
+        status = 0
+        for result in results:
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            if not result['ok']:
+                status = 1
+        return status
+
+    @classmethod
+    def _process_file(cls, options, filePath):
+        # Run the command on a single file, and return a result dictionary.
+        # This method runs in a worker process.
+        result = {'file': filePath}
+        try:
+            ok, data = getattr(cls, f'_{options.command}')(filePath, options)
+        except Exception as ex:
+            result['ok'] = False
+            result['error'] = str(ex)
+        else:
+            result['ok'] = ok
+            result.update(data)
+        return result
+
+    @classmethod
+    def _push(cls, filePath, options):
+        # Write the books' titles and descriptions into the project files.
+        collection = cls._get_collection(filePath)
+        if options.elements:
+            bkIds = []
+            for elementId in options.elements:
+                if elementId in collection.books:
+                    bkIds.append(elementId)
+                elif elementId in collection.series:
+                    bkIds.extend(collection.tree.get_children(elementId))
+                else:
+                    raise RuntimeError(f'{_("Element not found")}: "{elementId}".')
+        else:
+            bkIds = list(collection.books)
+        items = []
+        bkIdsByPath = {}
+        for bkId in bkIds:
+            book = collection.books[bkId]
+            if book.filePath is not None:
+                items.append((book.filePath, book.title, book.desc))
+                bkIdsByPath[book.filePath] = bkId
+        updated, skipped, failed = NovxMetadataWriter.push_all(items)
+        return not failed, {
+            'updated': [bkIdsByPath[path] for path in updated],
+            'unchanged': [bkIdsByPath[path] for path in skipped],
+            'failed': [
+                {'id': bkIdsByPath[path], 'error': error}
+                for path, error in failed
+            ],
+        }
+
+    @classmethod
+    def _refresh(cls, filePath, options):
+        # Update the books' titles and descriptions from the project files.
+        collection = cls._get_collection(filePath)
+        updated = []
+        missing = []
+        failed = []
+        for bkId, book in collection.books.items():
+            if book.isMissing:
+                missing.append(bkId)
+                continue
+
+            novxFile = NovxFile(book.filePath)
+            novxFile.novel = Novel(tree=NvTree())
+            try:
+                novxFile.read()
+            except Exception as ex:
+                failed.append({'id': bkId, 'error': str(ex)})
+                continue
+
+            if collection.pull_metadata(bkId, novxFile.novel):
+                updated.append(bkId)
+        result = {'updated': updated, 'missing': missing, 'failed': failed}
+        if updated or collection.upgradePending:
+            result['message'] = collection.write()
+        return not failed, result
+
+    @classmethod
+    def _relocate(cls, filePath, options):
+        # Point missing books to their moved project files.
+        collection = cls._get_collection(filePath)
+        bkIdsByPath = {}
+        for bkId, book in collection.books.items():
+            if book.isMissing and book.filePath is not None:
+                bkIdsByPath.setdefault(book.filePath, []).append(bkId)
+        locator = BookLocator()
+        sizes = {}
+        if bkIdsByPath:
+            locator.add_directories(options.directories)
+            # Use the last known file sizes for telling candidates apart,
+            # like the plugin does. The cache is not changed.
+            statsCache = StatsCache(options.stats_cache)
+            for bookPath in bkIdsByPath:
+                size = statsCache.get_size(bookPath)
+                if size is not None:
+                    sizes[bookPath] = size
+        newPaths, ambiguous = locator.locate(bkIdsByPath, sizes)
+        relocated = collection.relocate_books(newPaths)
+        result = {
+            'relocated': relocated,
+            'ambiguous': [bkId for path in ambiguous for bkId in bkIdsByPath[path]],
+            'missing': [
+                bkId for bkId, book in collection.books.items() if book.isMissing
+            ],
+        }
+        if relocated or collection.upgradePending:
+            result['message'] = collection.write()
+        return True, result
+
+    @classmethod
+    def _remove(cls, filePath, options):
+        # Remove books or series from a collection.
+        collection = cls._get_collection(filePath)
+        removed = []
+        failed = []
+        for elementId in options.elements:
+            if elementId.startswith(BOOK_PREFIX) and elementId in collection.books:
+                collection.remove_book(elementId)
+            elif elementId.startswith(SERIES_PREFIX) and elementId in collection.series:
+                if options.with_books:
+                    collection.remove_series_with_books(elementId)
+                else:
+                    collection.remove_series(elementId)
+            else:
+                failed.append({'id': elementId, 'error': _('Element not found')})
+                continue
+
+            removed.append(elementId)
+        result = {'removed': removed, 'failed': failed}
+        if removed:
+            result['message'] = collection.write()
+        return not failed, result
+
+    @classmethod
+    def _restore(cls, filePath, options):
+        # Write a saved version as the latest version of the collection.
+        collection = cls._get_collection(filePath, mustExist=False)
+        result = {'restored': collection.restore_version(options.version)}
+        result['message'] = collection.write()
+        return True, result
+
+    @classmethod
+    def _split(cls, filePath, options):
+        # Move a series with its books into a new collection file.
+        collection = cls._get_collection(filePath)
+        if not options.series in collection.series:
+            raise RuntimeError(f'{_("Series not found")}: "{options.series}".')
+
+        result = {'split': collection.split_series(options.series, options.output)}
+        result['message'] = collection.write()
+        return True, result
+
+    @classmethod
+    def _stats(cls, filePath, options):
+        # Collect the manuscript statistics of the books and series.
+        collection = cls._get_collection(filePath)
+        collection.apply_stats(StatsCache().collect(
+            book.filePath for book in collection.books.values()
+            if book.filePath is not None
+        ))
+        elements = cls._get_elements(collection, withStats=True)
+        total = {'words': 0, 'chapters': 0, 'sections': 0}
+        for data in elements:
+            if data['type'] == 'BOOK' and data['words'] is not None:
+                for key in total:
+                    total[key] += data[key]
+        return True, {'total': total, 'elements': elements}
+
+    @classmethod
+    def _tag(cls, filePath, options):
+        # Add and remove tags of books, or of a series' books.
+        collection = cls._get_collection(filePath)
+        bkIds = []
+        for elementId in options.elements:
+            if elementId in collection.books:
+                bkIds.append(elementId)
+            elif elementId in collection.series:
+                bkIds.extend(collection.tree.get_children(elementId))
+            else:
+                raise RuntimeError(f'{_("Element not found")}: "{elementId}".')
+
+        removed = set(tag.casefold() for tag in options.remove)
+        updated = []
+        for bkId in bkIds:
+            tags = [
+                tag for tag in collection.books[bkId].tags
+                if not tag.casefold() in removed
+            ]
+            keys = set(tag.casefold() for tag in tags)
+            for tag in options.add:
+                if not tag.casefold() in keys:
+                    tags.append(tag)
+                    keys.add(tag.casefold())
+            if collection.set_tags(bkId, tags):
+                updated.append(bkId)
+        result = {'updated': updated}
+        if updated:
+            result['message'] = collection.write()
+        return True, result
+
+    @classmethod
+    def _validate(cls, filePath, options):
+        # Check a collection file against the DTD.
+        violations = NvcxValidator.validate_file(filePath)
+        return not violations, {
+            'violations': [
+                {'line': lineNumber, 'message': message}
+                for lineNumber, message in violations
+            ],
+        }
@@ -0,0 +1,214 @@
+"""Provide a class for a content-addressed history of collection versions.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from datetime import datetime
+from datetime import timedelta
+import hashlib
+import json
+import os
+
+
+class CollectionHistory:
+    """Saved versions of a collection file.
+
+    The history is stored in a directory next to the collection file.
+    Each root, series, and book record is stored once as an object
+    named after the digest of its content.
+    A version is a small manifest listing the digests of its records
+    in document order. So records unchanged between versions
+    cost neither disk space nor write operations.
+
+    The oldest versions are discarded beyond MAX_VERSIONS.
+    Objects no longer referenced are removed in the same pass.
+    """
+    SUFFIX = 'history'
+    MAX_VERSIONS = 200
+    PRUNE_BATCH = 20
+    # Versions beyond MAX_VERSIONS are discarded in batches,
+    # because removing unused objects reads all manifests.
+
+    OBJECTS_DIR = 'objects'
+    VERSIONS_DIR = 'versions'
+    VERSION_FORMAT = '%Y%m%d%H%M%S%f'
+    # Version IDs are timestamps with microseconds, sorting by time.
+
+    def __init__(self, filePath):
+        """Positional arguments:
+            filePath -- str: path to the collection file.
+        """
+        self.directory = f'{filePath}.{self.SUFFIX}'
+        self._objects = None
+        # Set of the stored object digests; read on demand.
+
+    def add_version(self, records):
+        """Store a version of the collection.
+
+        Positional arguments:
+            records -- iterable of records in document order,
+                       as generated by NvcxOpener.iter_records().
+
+        Return the version ID, or None if the records are
+        the same as in the latest version.
+        Raise the "OSError" exception, if the version cannot be stored.
+        """
+        digests = []
+        books = 0
+        series = 0
+        for record in records:
+            digests.append(self._store_object(record))
+            if record['type'] == 'BOOK':
+                books += 1
+            elif record['type'] == 'SERIES':
+                series += 1
+        versions = self.get_versions()
+        if versions:
+            latest = self._read_manifest(versions[0])
+            if latest['records'] == digests:
+                return None
+
+        versionId = datetime.now().strftime(self.VERSION_FORMAT)
+        if versions and versionId <= versions[0]:
+            # The clock is coarse or was set back.
+            versionId = (
+                self.get_timestamp(versions[0]) + timedelta(microseconds=1)
+            ).strftime(self.VERSION_FORMAT)
+        self._write_file(
+            self._get_manifest_path(versionId),
+            json.dumps({
+                'books': books,
+                'series': series,
+                'records': digests,
+            }),
+        )
+        if len(versions) + 1 > self.MAX_VERSIONS + self.PRUNE_BATCH:
+            self._prune()
+        return versionId
+
+    @classmethod
+    def get_timestamp(cls, versionId):
+        """Return the time of a version as a datetime instance."""
+        return datetime.strptime(versionId, cls.VERSION_FORMAT)
+
+    def get_records(self, versionId):
+        """Generate the records of a version in document order.
+
+        Positions are added according to the document order.
+        Raise the "OSError" exception, if the version cannot be read.
+        """
+        positions = {}
+        for digest in self._read_manifest(versionId)['records']:
+            with open(self._get_object_path(digest), 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            if record['type'] != 'ROOT':
+                parent = record.get('parent', '') or ''
+                record['position'] = positions.get(parent, 0)
+                positions[parent] = record['position'] + 1
+            yield record
+
+    def get_summary(self, versionId):
+        """Return a tuple (number of books, number of series) of a version.
+
+        Raise the "OSError" exception, if the version cannot be read.
+        """
+        manifest = self._read_manifest(versionId)
+        return manifest['books'], manifest['series']
+
+    def get_versions(self):
+        """Return a list of the stored version IDs, the latest first."""
+        try:
+            fileNames = os.listdir(os.path.join(self.directory, self.VERSIONS_DIR))
+        except OSError:
+            return []
+
+        versions = []
+        for fileName in fileNames:
+            versionId, extension = os.path.splitext(fileName)
+            if extension == '.json':
+                versions.append(versionId)
+        versions.sort(reverse=True)
+        return versions
+
+    @classmethod
+    def _get_digest(cls, data):
+        # Return the hexadecimal digest of a serialized record.
+        return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _get_manifest_path(self, versionId):
+        return os.path.join(self.directory, self.VERSIONS_DIR, f'{versionId}.json')
+
+    def _get_object_path(self, digest):
+        # Objects are spread across subdirectories named after
+        # the first two digits, keeping the directories small.
+        return os.path.join(self.directory, self.OBJECTS_DIR, digest[:2], digest)
+
+    def _get_objects(self):
+        # Return the set of stored object digests.
+        if self._objects is None:
+            self._objects = set()
+            objectsDir = os.path.join(self.directory, self.OBJECTS_DIR)
+            try:
+                subdirectories = os.listdir(objectsDir)
+            except OSError:
+                subdirectories = []
+            for subdirectory in subdirectories:
+                try:
+                    self._objects.update(
+                        fileName for fileName in
+                        os.listdir(os.path.join(objectsDir, subdirectory))
+                        if not fileName.endswith('.tmp')
+                    )
+                except OSError:
+                    pass
+        return self._objects
+
+    def _prune(self):
+        # Discard the oldest versions and the objects no longer referenced.
+        versions = self.get_versions()
+        for versionId in versions[self.MAX_VERSIONS:]:
+            try:
+                os.remove(self._get_manifest_path(versionId))
+            except OSError:
+                pass
+        used = set()
+        for versionId in versions[:self.MAX_VERSIONS]:
+            try:
+                used.update(self._read_manifest(versionId)['records'])
+            except (OSError, ValueError):
+                # Keep everything, if a version cannot be read.
+                return
+
+        objects = self._get_objects()
+        for digest in objects - used:
+            try:
+                os.remove(self._get_object_path(digest))
+            except OSError:
+                pass
+        objects.intersection_update(used)
+
+    def _read_manifest(self, versionId):
+        with open(self._get_manifest_path(versionId), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _store_object(self, record):
+        # Store a record, if not yet stored, and return its digest.
+        # Positions are not stored, so moving an element
+        # does not change the records of its siblings.
+        data = {key: value for key, value in record.items() if key != 'position'}
+        data = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        digest = self._get_digest(data)
+        objects = self._get_objects()
+        if not digest in objects:
+            self._write_file(self._get_object_path(digest), data)
+            objects.add(digest)
+        return digest
+
+    def _write_file(self, filePath, data):
+        # Write a file atomically, creating the directory, if necessary.
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        tempPath = f'{filePath}.tmp'
+        with open(tempPath, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tempPath, filePath)
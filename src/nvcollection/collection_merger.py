@@ -0,0 +1,270 @@
+"""Provide a class for three-way merging of collection records.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from nvcollection.collection_snapshot import CollectionSnapshot
+from nvcollection.nvcollection_globals import BOOK_PREFIX
+from nvcollection.nvcollection_globals import SERIES_PREFIX
+from nvlib.model.data.id_generator import new_id
+
+
+class CollectionMerger:
+    """Three-way merge of two versions of a collection.
+
+    Both versions are compared with their common base.
+    A change made on one side only is taken over.
+    If both sides changed the same root, or the same field of an
+    element, in different ways, our change is kept, and the conflict
+    is reported. An element deleted on one side, but changed on the
+    other side, is kept.
+
+    Elements added on both sides with the same ID are told apart:
+    a book with the same location is considered the same book,
+    otherwise our element gets a new ID.
+    Books added on both sides with the same location are merged as well.
+
+    Changes of the child order are taken over from the side
+    that changed the order of the common elements,
+    preferring our side. Elements placed by the other side
+    are inserted behind their predecessors.
+    """
+    FIELDS = ('parent', 'title', 'desc', 'root', 'path', 'tags')
+    # Order of the element fields in a CollectionSnapshot.
+
+    @classmethod
+    def merge(cls, base, ours, theirs):
+        """Return a tuple (merged records, conflicts).
+
+        Positional arguments:
+            base -- CollectionSnapshot of the common ancestor.
+            ours -- list of our records in document order.
+            theirs -- list of their records in document order.
+
+        Records are dictionaries as generated by NvcxOpener.iter_records().
+        The merged records are in document order.
+        conflicts is a list of the root names and element IDs
+        changed in different ways on both sides.
+        """
+        theirSnapshot = CollectionSnapshot(theirs)
+        ours = cls._remap_ids(base, ours, theirSnapshot)
+        ourSnapshot = CollectionSnapshot(ours)
+        ourRecords = {record['id']: record for record in ours if record['type'] != 'ROOT'}
+        theirRecords = {record['id']: record for record in theirs if record['type'] != 'ROOT'}
+        conflicts = []
+
+        # Merge the roots.
+        records = []
+        rootNames = list(ourSnapshot.roots)
+        rootNames.extend(name for name in theirSnapshot.roots if not name in ourSnapshot.roots)
+        for name in rootNames:
+            directory = cls._merge_value(
+                name,
+                base.roots.get(name, None),
+                ourSnapshot.roots.get(name, None),
+                theirSnapshot.roots.get(name, None),
+                conflicts,
+            )
+            if directory is not None:
+                records.append({'type': 'ROOT', 'id': name, 'path': directory})
+
+        # Merge the elements.
+        merged = {}
+        # Dictionary:
+        #   keyword -- element ID
+        #   value -- merged record without position
+        elementIds = list(ourSnapshot.elements)
+        elementIds.extend(
+            elementId for elementId in theirSnapshot.elements
+            if not elementId in ourSnapshot.elements
+        )
+        for elementId in elementIds:
+            baseElement = base.elements.get(elementId, None)
+            ourElement = ourSnapshot.elements.get(elementId, None)
+            theirElement = theirSnapshot.elements.get(elementId, None)
+            if ourElement is None or theirElement is None:
+                # Added, or deleted, on one side.
+                if ourElement is None:
+                    element, record = theirElement, theirRecords[elementId]
+                else:
+                    element, record = ourElement, ourRecords[elementId]
+                if element == baseElement:
+                    continue
+
+                if baseElement is not None:
+                    conflicts.append(elementId)
+                merged[elementId] = cls._get_record(record, element)
+                continue
+
+            element = tuple(
+                cls._merge_value(
+                    elementId,
+                    baseElement[i] if baseElement is not None else None,
+                    ourElement[i],
+                    theirElement[i],
+                    conflicts,
+                )
+                for i in range(len(cls.FIELDS))
+            )
+            descIndex = cls.FIELDS.index('desc')
+            if element[descIndex] == ourElement[descIndex]:
+                record = ourRecords[elementId]
+            else:
+                record = theirRecords[elementId]
+            merged[elementId] = cls._get_record(record, element)
+
+        # Books whose series is gone are moved to the top level.
+        children = {'': set()}
+        for elementId, record in merged.items():
+            if elementId.startswith(SERIES_PREFIX):
+                record['parent'] = ''
+                children.setdefault(elementId, set())
+        for elementId, record in merged.items():
+            if not record['parent'] in children:
+                record['parent'] = ''
+            children[record['parent']].add(elementId)
+
+        # Merge the child order, and put out the records.
+        conflicts = list(dict.fromkeys(conflicts))
+        for position, elementId in enumerate(cls._merge_order(
+            children[''],
+            base.children.get('', []),
+            ourSnapshot.children.get('', []),
+            theirSnapshot.children.get('', []),
+        )):
+            record = merged[elementId]
+            record['position'] = position
+            records.append(record)
+            if not elementId.startswith(SERIES_PREFIX):
+                continue
+
+            for memberPosition, bkId in enumerate(cls._merge_order(
+                children[elementId],
+                base.children.get(elementId, []),
+                ourSnapshot.children.get(elementId, []),
+                theirSnapshot.children.get(elementId, []),
+            )):
+                record = merged[bkId]
+                record['position'] = memberPosition
+                records.append(record)
+        return records, conflicts
+
+    @classmethod
+    def _get_record(cls, record, element):
+        # Return a merged record with the element's fields.
+        # The description text is taken from record.
+        parent, title, __, root, path, tags = element
+        newRecord = {
+            'type': record['type'],
+            'id': record['id'],
+            'parent': parent,
+            'title': title,
+            'desc': record.get('desc', None),
+        }
+        if record['type'] == 'BOOK':
+            newRecord['path'] = path
+            newRecord['root'] = root
+            newRecord['tags'] = list(tags) if tags else None
+        return newRecord
+
+    @classmethod
+    def _get_sort_key(cls, elementId):
+        # Return a key for sorting IDs by their prefix and number.
+        prefix = elementId.rstrip('0123456789')
+        number = elementId[len(prefix):]
+        return prefix, int(number) if number else 0
+
+    @classmethod
+    def _merge_order(cls, members, baseOrder, ourOrder, theirOrder):
+        # Return the list of members in the merged order.
+        common = set(baseOrder).intersection(ourOrder, theirOrder)
+        baseCommon = [node for node in baseOrder if node in common]
+        theirCommon = [node for node in theirOrder if node in common]
+        ourCommon = [node for node in ourOrder if node in common]
+        if theirCommon != baseCommon and ourCommon == baseCommon:
+            primaryOrder, secondaryOrder = theirOrder, ourOrder
+        else:
+            primaryOrder, secondaryOrder = ourOrder, theirOrder
+        result = [node for node in primaryOrder if node in members]
+        placed = set(result)
+        for i, node in enumerate(secondaryOrder):
+            if not node in members or node in placed:
+                continue
+
+            # Insert the node behind its nearest placed predecessor.
+            index = 0
+            for predecessor in reversed(secondaryOrder[:i]):
+                if predecessor in placed:
+                    index = result.index(predecessor) + 1
+                    break
+
+            result.insert(index, node)
+            placed.add(node)
+
+        # Members moved here from a deleted series.
+        result.extend(sorted(members - placed, key=cls._get_sort_key))
+        return result
+
+    @classmethod
+    def _merge_value(cls, name, baseValue, ourValue, theirValue, conflicts):
+        # Return the merged value.
+        # In case of conflict, append name to conflicts and return ourValue.
+        if ourValue == theirValue or theirValue == baseValue:
+            return ourValue
+
+        if ourValue == baseValue:
+            return theirValue
+
+        conflicts.append(name)
+        return ourValue
+
+    @classmethod
+    def _remap_ids(cls, base, ours, theirSnapshot):
+        # Return our records with the IDs of elements added on both sides
+        # made distinct, or matched with their book of the same location.
+        theirBooks = {}
+        # Dictionary:
+        #   keyword -- tuple (root, path) of a book added on their side
+        #   value -- book ID
+        for elementId, element in theirSnapshot.elements.items():
+            if elementId.startswith(BOOK_PREFIX) and not elementId in base.elements:
+                theirBooks[element[3:5]] = elementId
+        usedIds = set(base.elements)
+        usedIds.update(theirSnapshot.elements)
+        usedIds.update(record['id'] for record in ours if record['type'] != 'ROOT')
+        idMap = {}
+        for record in ours:
+            elementId = record['id']
+            if record['type'] == 'ROOT' or elementId in base.elements:
+                continue
+
+            if record['type'] == 'BOOK':
+                theirId = theirBooks.get(
+                    (record.get('root', None), record.get('path', None)),
+                    None,
+                )
+                if theirId is not None:
+                    if theirId != elementId:
+                        idMap[elementId] = theirId
+                    continue
+
+            if elementId in theirSnapshot.elements:
+                if record['type'] == 'SERIES':
+                    prefix = SERIES_PREFIX
+                else:
+                    prefix = BOOK_PREFIX
+                newId = new_id(usedIds, prefix=prefix)
+                usedIds.add(newId)
+                idMap[elementId] = newId
+        if not idMap:
+            return ours
+
+        remapped = []
+        for record in ours:
+            if record['type'] != 'ROOT':
+                record = dict(record)
+                record['id'] = idMap.get(record['id'], record['id'])
+                record['parent'] = idMap.get(record['parent'], record['parent'])
+            remapped.append(record)
+        return remapped
@@ -0,0 +1,151 @@
+"""Provide a class for preloading recently used collections.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+from nvcollection.collection import Collection
+from nvcollection.desc_store import DescStore
+
+
+class CollectionPreloader:
+    """Background parser for recently used collection files.
+
+    The files are parsed and validated in a background thread,
+    most important first, and their books' statistics are collected 
+    into the stats cache. The results are kept for the most recently 
+    preloaded files, and are valid as long as the file is not changed.
+    Long descriptions of the preloaded records are kept 
+    in a DescStore per file instead of memory.
+    """
+    MAX_ENTRIES = 3
+
+    def __init__(self, statsCache=None):
+        """Optional arguments:
+            statsCache -- StatsCache instance to be warmed up.
+        """
+        self._statsCache = statsCache
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # LRU cache:
+        #   keyword -- normalized collection file path
+        #   value -- tuple (mtime_ns, size, data, DescStore instance),
+        #            where data is returned by Collection.preload(),
+        #            with long descriptions replaced by DescStore keys
+
+    def get(self, filePath):
+        """Return the preloaded data of the collection file at filePath.
+
+        Return None, if the file is not preloaded, or changed since.
+        """
+        key, fileStat = self._get_file_stat(filePath)
+        if fileStat is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None or entry[:2] != (fileStat.st_mtime_ns, fileStat.st_size):
+                return None
+
+            __, __, (records, fileInfo, violations), descStore = entry
+            records = [self._restore_desc(record, descStore) for record in records]
+        return records, dict(fileInfo), violations
+
+    def preload(self, filePaths):
+        """Start preloading the collection files in the background.
+
+        Positional arguments:
+            filePaths -- list of collection file paths, most important first.
+        """
+        self._executor.submit(self._preload_files, list(filePaths))
+
+    def shutdown(self):
+        """Stop the background thread after the current file."""
+        self._executor.shutdown(wait=False)
+
+    def _get_file_stat(self, filePath):
+        # Return a tuple (normalized path, os.stat_result).
+        # The stat result is None, if the file cannot be accessed.
+        key = os.path.normcase(os.path.abspath(filePath))
+        try:
+            return key, os.stat(filePath)
+
+        except OSError:
+            return key, None
+
+    def _preload_files(self, filePaths):
+        # Parse the files not yet preloaded, and warm up the stats cache.
+        # Keep at most MAX_ENTRIES results, the most important file
+        # being the most recently used one.
+        filePaths = filePaths[:self.MAX_ENTRIES]
+        keys = []
+        for filePath in filePaths:
+            key, fileStat = self._get_file_stat(filePath)
+            if fileStat is None:
+                continue
+
+            keys.append(key)
+            with self._lock:
+                entry = self._entries.get(key, None)
+                if entry is not None and entry[:2] == (fileStat.st_mtime_ns, fileStat.st_size):
+                    # Keep it from being removed by the files that follow.
+                    self._entries.move_to_end(key)
+                    continue
+
+            try:
+                records, fileInfo, violations = Collection.preload(filePath)
+            except RuntimeError:
+                continue
+
+            if self._statsCache is not None:
+                self._statsCache.collect(
+                    Collection.get_book_paths(filePath, records)
+                )
+            descStore = DescStore()
+            records = [self._store_desc(record, descStore) for record in records]
+            with self._lock:
+                oldEntry = self._entries.pop(key, None)
+                if oldEntry is not None:
+                    oldEntry[3].clear()
+                self._entries[key] = (
+                    fileStat.st_mtime_ns,
+                    fileStat.st_size,
+                    (records, fileInfo, violations),
+                    descStore,
+                )
+                self._remove_lru_entries()
+        with self._lock:
+            for key in reversed(keys):
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+
+    def _remove_lru_entries(self):
+        # Remove the least recently used entries exceeding MAX_ENTRIES.
+        # The caller must hold the lock.
+        while len(self._entries) > self.MAX_ENTRIES:
+            __, entry = self._entries.popitem(last=False)
+            entry[3].clear()
+
+    def _restore_desc(self, record, descStore):
+        # Return the record with the description loaded from descStore.
+        descKey = record.get('descKey', None)
+        if descKey is None:
+            return record
+
+        record = dict(record, desc=descStore.get(descKey))
+        del record['descKey']
+        return record
+
+    def _store_desc(self, record, descStore):
+        # Return the record with a long description kept in descStore.
+        desc = record.get('desc', None)
+        if desc is None or len(desc) < descStore.MIN_LENGTH:
+            return record
+
+        return dict(record, desc=None, descKey=descStore.put(desc))
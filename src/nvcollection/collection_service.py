@@ -8,7 +8,9 @@ import os
 from pathlib import Path
 import sys
 
+from nvcollection.collection_preloader import CollectionPreloader
 from nvcollection.collection_view import CollectionView
+from nvcollection.stats_cache import StatsCache
 from nvlib.controller.sub_controller import SubController
 import tkinter as tk
 
@@ -18,11 +20,16 @@ class CollectionService(SubController):
     INI_FILEPATH = '.novx/config'
     SETTINGS = dict(
         last_open='',
+        recent_collections='',
         window_geometry='610x300',
         right_frame_width=350,
     )
-    OPTIONS = {}
+    OPTIONS = dict(
+        table_view=False,
+    )
     ICON = 'collection'
+    WARM_UP_DELAY = 2000
+    # Milliseconds between the start of novelibre and preloading.
 
     def __init__(self, model, view, controller):
         self._mdl = model
@@ -44,6 +51,8 @@ class CollectionService(SubController):
         self.prefs = {}
         self.prefs.update(self.configuration.settings)
         self.prefs.update(self.configuration.options)
+        self.statsCache = StatsCache(f'{configDir}/{StatsCache.FILENAME}')
+        self.preloader = CollectionPreloader(self.statsCache)
         globalPrefs = self._ctrl.get_preferences()
         self.prefs['color_text_fg'] = globalPrefs['color_text_fg']
         self.prefs['color_text_bg'] = globalPrefs['color_text_bg']
@@ -59,6 +68,9 @@ class CollectionService(SubController):
 
         self.collectionView = None
 
+        # Preload the recent collections when novelibre is up and running.
+        self._ui.root.after(self.WARM_UP_DELAY, self._warm_up)
+
     def on_quit(self):
         """Write back the configuration file.
         
@@ -75,6 +87,8 @@ class CollectionService(SubController):
             elif keyword in self.configuration.settings:
                 self.configuration.settings[keyword] = self.prefs[keyword]
         self.configuration.write()
+        self.preloader.shutdown()
+        self.statsCache.save()
 
     def start_manager(self):
         if self.collectionView:
@@ -90,7 +104,17 @@ class CollectionService(SubController):
             self._ui,
             self._ctrl,
             self.prefs,
+            self.statsCache,
+            self.preloader,
         )
         if self.icon:
             self.collectionView.iconphoto(False, self.icon)
 
+    def _warm_up(self):
+        # Preload the most recently used collections in the background.
+        if self.collectionView and self.collectionView.isOpen:
+            return
+
+        self.preloader.preload(
+            CollectionView.get_recent_collections(self.prefs)
+        )
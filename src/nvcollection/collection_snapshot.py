@@ -0,0 +1,106 @@
+"""Provide a class for a compact snapshot of a collection's hierarchy.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import hashlib
+
+
+class CollectionSnapshot:
+    """State of a collection's roots, series, and books at one point in time.
+
+    A snapshot holds what is needed to detect changes in a three-way merge.
+    Descriptions are represented by a digest, so the memory usage
+    does not depend on the description lengths.
+    """
+
+    def __init__(self, records=()):
+        """Optional arguments:
+            records -- iterable of records in document order,
+                       as generated by NvcxOpener.iter_records().
+        """
+        self.roots = {}
+        # Dictionary:
+        #   keyword -- root name
+        #   value -- root directory
+
+        self.elements = {}
+        # Dictionary:
+        #   keyword -- series or book ID
+        #   value -- tuple (parent ID, title, description digest, root, path, tags)
+
+        self.children = {'': []}
+        # Dictionary:
+        #   keyword -- parent ID, or '' for the top level
+        #   value -- list of child IDs in document order
+
+        for record in records:
+            self.add_record(record)
+
+    @classmethod
+    def get_desc_digest(cls, desc):
+        """Return a digest of the description as it is saved.
+
+        Return None, if there is no description to save.
+        """
+        if desc is None:
+            return None
+
+        paragraphs = []
+        for paragraph in desc.split('\n'):
+            paragraph = paragraph.strip()
+            if paragraph:
+                paragraphs.append(paragraph)
+        if not paragraphs:
+            return None
+
+        return hashlib.blake2b(
+            '\n'.join(paragraphs).encode('utf-8'),
+            digest_size=16,
+        ).digest()
+
+    def add(self, elementId, parent, title, desc, root=None, path=None, tags=None):
+        """Add a series or book after the elements added before.
+
+        Positional arguments:
+            elementId -- str: series or book ID.
+            parent -- str: parent series ID; empty on the top level.
+            title -- str: title.
+            desc -- str: description, or None.
+
+        Optional arguments:
+            root -- str: name of the root the path refers to; books only.
+            path -- str: stored project file path; books only.
+            tags -- list of str: tags; books only.
+
+        A duplicate ID is ignored.
+        """
+        if elementId in self.elements:
+            return
+
+        self.elements[elementId] = (
+            parent,
+            title,
+            self.get_desc_digest(desc),
+            root,
+            path,
+            tuple(tags) if tags else None,
+        )
+        self.children.setdefault(parent, []).append(elementId)
+
+    def add_record(self, record):
+        """Add a root, series, or book record."""
+        if record['type'] == 'ROOT':
+            self.roots[record['id']] = record['path']
+            return
+
+        self.add(
+            record['id'],
+            record.get('parent', '') or '',
+            record.get('title', None),
+            record.get('desc', None),
+            record.get('root', None),
+            record.get('path', None),
+            record.get('tags', None),
+        )
@@ -4,22 +4,29 @@ Copyright (c) Peter Triesberger
 For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
+from concurrent.futures import ThreadPoolExecutor
 import os
 from tkinter import filedialog
 from tkinter import ttk
 
+from nvcollection.book_locator import BookLocator
+from nvcollection.book_table import BookTable
 from nvcollection.collection import Collection
 from nvcollection.nvcollection_globals import BOOK_PREFIX
 from nvcollection.nvcollection_globals import FEATURE
 from nvcollection.nvcollection_globals import HELP_PAGE
 from nvcollection.nvcollection_globals import SERIES_PREFIX
 from nvcollection.nvcollection_locale import _
+from nvcollection.novx_metadata_writer import NovxMetadataWriter
 from nvcollection.platform.platform_settings import KEYS
 from nvcollection.platform.platform_settings import MOUSE
 from nvcollection.platform.platform_settings import PLATFORM
+from nvcollection.project_prefetcher import ProjectPrefetcher
 from nvlib.controller.sub_controller import SubController
 from nvlib.gui.widgets.index_card import IndexCard
+from nvlib.novx_globals import list_to_string
 from nvlib.novx_globals import norm_path
+from nvlib.novx_globals import string_to_list
 import tkinter as tk
 
 
@@ -28,13 +35,77 @@ class CollectionView(tk.Toplevel, SubController):
     MIN_HEIGHT = 300
     MIN_WIDTH = 610
     HEIGHT_BIAS = 20
-
-    def __init__(self, model, view, controller, prefs):
+    STATS_POLL_INTERVAL = 100
+    # Milliseconds between checks for background statistics results.
+    FILTER_DELAY = 300
+    # Milliseconds between the last keystroke and filtering.
+    PREFETCH_DELAY = 300
+    # Milliseconds between selecting a book and prefetching its project.
+    TYPE_AHEAD_TIMEOUT = 1000
+    # Milliseconds after the last keystroke when type-ahead starts over.
+    MAX_RECENT = 8
+    # Number of collections in the "Recent collections" menu.
+    MAX_HISTORY = 20
+    # Number of versions in the "Restore saved version" menu.
+    MAX_REPORTED_FAILURES = 10
+    # Number of failures listed after a batch operation.
+    MAX_LISTED_BOOKS = 10
+    # Number of books listed when asking for confirmation.
+
+    COLUMNS = (
+        ('words', _('Words'), 70),
+        ('chapters', _('Chapters'), 70),
+        ('sections', _('Sections'), 70),
+        ('modified', _('Modified'), 90),
+        ('books', _('Books'), 90),
+    )
+    # Statistics columns of the tree: (ID, heading, width).
+
+    @classmethod
+    def get_recent_collections(cls, prefs):
+        """Return a list of the recently used collection file paths.
+        
+        The most recent comes first.
+        """
+        recentCollections = []
+        if prefs['last_open']:
+            recentCollections.append(prefs['last_open'])
+        for filePath in prefs['recent_collections'].split(os.pathsep):
+            if filePath and not filePath in recentCollections:
+                recentCollections.append(filePath)
+        return recentCollections[:cls.MAX_RECENT]
+
+    def __init__(
+            self,
+            model,
+            view,
+            controller,
+            prefs,
+            statsCache,
+            preloader,
+    ):
         super().__init__()
         self._mdl = model
         self._ui = view
         self._ctrl = controller
         self.prefs = prefs
+        self._statsCache = statsCache
+        self._preloader = preloader
+        self._statsExecutor = ThreadPoolExecutor(max_workers=1)
+        self._statsFuture = None
+        self._duplicatesFuture = None
+        self._relocateFuture = None
+        self._pushFuture = None
+        self._filterJob = None
+        self._prefetcher = ProjectPrefetcher()
+        self._prefetchJob = None
+        self._pendingChanges = {}
+        # Dictionary:
+        #   keyword -- element ID
+        #   value -- set of ChangeBus event types not yet displayed
+        self._changeJob = None
+        self._typeAheadText = ''
+        self._typeAheadTime = 0
         self.isModified = False
         self.element = None
         self.nodeId = None
@@ -74,6 +145,19 @@ class CollectionView(tk.Toplevel, SubController):
         self._statusBar.pack(expand=False, fill='both', side='bottom')
         self._statusBar.bind(MOUSE.LEFT_CLICK, self._restore_status)
 
+        #--- Filter bar.
+        self._filterBar = ttk.Frame(self)
+        self._filterBar.pack(expand=False, fill='x', padx=2, pady=2)
+        ttk.Label(self._filterBar, text=_('Filter')).pack(side='left', padx=3)
+        self._filterText = tk.StringVar()
+        self._filterText.trace_add('write', self._on_filter_change)
+        self._filterEntry = ttk.Entry(
+            self._filterBar,
+            textvariable=self._filterText,
+        )
+        self._filterEntry.pack(side='left', expand=True, fill='x')
+        self._filterEntry.bind('<Escape>', self._clear_filter)
+
         #--- Main window.
         self._mainWindow = ttk.Frame(self)
         self._mainWindow.pack(
@@ -83,6 +167,20 @@ class CollectionView(tk.Toplevel, SubController):
             expand=True,
         )
 
+        #--- Tags bar for the selected book.
+        self._tagsBar = ttk.Frame(self._mainWindow)
+        self._tagsBar.pack(side='bottom', expand=False, fill='x', pady=2)
+        ttk.Label(self._tagsBar, text=_('Tags')).pack(side='left', padx=3)
+        self._tagsText = tk.StringVar()
+        self._tagsEntry = ttk.Entry(
+            self._tagsBar,
+            textvariable=self._tagsText,
+            state='disabled',
+        )
+        self._tagsEntry.pack(side='left', expand=True, fill='x')
+        self._tagsEntry.bind('<Return>', self._apply_changes)
+        self._tagsEntry.bind('<FocusOut>', self._apply_changes)
+
         #--- The collection itself.
         self._collection = None
 
@@ -90,7 +188,17 @@ class CollectionView(tk.Toplevel, SubController):
         self._treeView = ttk.Treeview(
             self._mainWindow,
             selectmode='browse',
+            columns=[column for column, __, __ in self.COLUMNS],
         )
+        for column, heading, width in self.COLUMNS:
+            self._treeView.heading(column, text=heading)
+            self._treeView.column(
+                column,
+                width=width,
+                minwidth=width,
+                stretch=False,
+                anchor='e',
+            )
         scrollY = ttk.Scrollbar(
             self._treeView,
             orient='vertical',
@@ -109,6 +217,15 @@ class CollectionView(tk.Toplevel, SubController):
         self._treeView.bind('<Delete>', self._remove_node)
         self._treeView.bind('<Shift-Delete>', self._remove_series_with_books)
         self._treeView.bind(MOUSE.MOVE_NODE, self._move_node)
+        self._treeView.bind('<KeyPress>', self._type_ahead)
+
+        #--- Flat table of books, alternatively to the tree.
+        self._bookTable = BookTable(
+            self._mainWindow,
+            self._select_book,
+            self._open_book,
+        )
+        self._tableMode = tk.BooleanVar(value=prefs['table_view'])
 
         #--- "Index card" in the right frame.
         self._indexCard = IndexCard(self._mainWindow,
@@ -142,6 +259,12 @@ class CollectionView(tk.Toplevel, SubController):
             label=_('Open...'),
             command=self._open_collection,
         )
+        self._recentMenu = tk.Menu(self._fileMenu, tearoff=0)
+        self._fileMenu.add_cascade(
+            label=_('Recent collections'),
+            menu=self._recentMenu,
+        )
+        self._update_recent_menu()
         self._fileMenu.add_command(
             label=_('Save'),
             state='disabled',
@@ -152,6 +275,27 @@ class CollectionView(tk.Toplevel, SubController):
             state='disabled',
             command=self._close_collection,
             )
+        self._historyMenu = tk.Menu(
+            self._fileMenu,
+            tearoff=0,
+            postcommand=self._update_history_menu,
+        )
+        self._fileMenu.add_cascade(
+            label=_('Restore saved version'),
+            menu=self._historyMenu,
+            state='disabled',
+        )
+        self._fileMenu.add_separator()
+        self._fileMenu.add_command(
+            label=_('Merge collection...'),
+            command=self._merge_collection,
+        )
+        self._fileMenu.add_separator()
+        self._fileMenu.add_command(
+            label=_('Set projects folder...'),
+            command=self._set_projects_root,
+        )
+        self._fileMenu.add_separator()
         if PLATFORM == 'win':
             self._fileMenu.add_command(
                 label=_('Exit'),
@@ -165,6 +309,23 @@ class CollectionView(tk.Toplevel, SubController):
                 command=self.on_quit,
             )
 
+        # Edit menu.
+        self._editMenu = tk.Menu(self._mainMenu, tearoff=0)
+        self._mainMenu.add_cascade(
+            label=_('Edit'),
+            menu=self._editMenu,
+        )
+        self._editMenu.add_command(
+            label=_('Undo'),
+            accelerator=KEYS.UNDO[1],
+            command=self._undo,
+        )
+        self._editMenu.add_command(
+            label=_('Redo'),
+            accelerator=KEYS.REDO[1],
+            command=self._redo,
+        )
+
         # Series menu.
         self._seriesMenu = tk.Menu(self._mainMenu, tearoff=0)
         self._mainMenu.add_cascade(
@@ -183,6 +344,10 @@ class CollectionView(tk.Toplevel, SubController):
             label=_('Remove selected series and books'),
             command=self._remove_series_with_books,
         )
+        self._seriesMenu.add_command(
+            label=_('Move selected series to a new collection...'),
+            command=self._split_series,
+        )
 
         # Book menu.
         self._bookMenu = tk.Menu(self._mainMenu, tearoff=0)
@@ -206,6 +371,73 @@ class CollectionView(tk.Toplevel, SubController):
             label=_('Update project data from the selected book'),
             command=self._update_project,
         )
+        self._bookMenu.add_command(
+            label=_('Update project files from the selected book or series'),
+            command=self._push_metadata,
+        )
+        self._bookMenu.add_separator()
+        self._bookMenu.add_command(
+            label=_('Refresh statistics'),
+            command=self._refresh_stats,
+        )
+        self._bookMenu.add_command(
+            label=_('Find duplicate books'),
+            command=self._find_duplicates,
+        )
+        self._bookMenu.add_command(
+            label=_('Find moved books'),
+            command=self._find_moved_books,
+        )
+
+        # Sort menu.
+        self._sortMenu = tk.Menu(self._mainMenu, tearoff=0)
+        self._mainMenu.add_cascade(
+            label=_('Sort'),
+            menu=self._sortMenu,
+        )
+        self._sortMenu.add_command(
+            label=_('Sort collection by title'),
+            command=lambda: self._sort(sortBy='title'),
+        )
+        self._sortMenu.add_command(
+            label=_('Sort collection by modification date'),
+            command=lambda: self._sort(sortBy='modified', reverse=True),
+        )
+        self._sortMenu.add_separator()
+        self._sortMenu.add_command(
+            label=_('Sort selected series by title'),
+            command=lambda: self._sort(
+                sortBy='title',
+                selectedSeries=True,
+            ),
+        )
+        self._sortMenu.add_command(
+            label=_('Sort selected series by modification date'),
+            command=lambda: self._sort(
+                sortBy='modified',
+                reverse=True,
+                selectedSeries=True,
+            ),
+        )
+
+        # View menu.
+        self._viewMenu = tk.Menu(self._mainMenu, tearoff=0)
+        self._mainMenu.add_cascade(
+            label=_('View'),
+            menu=self._viewMenu,
+        )
+        self._viewMenu.add_radiobutton(
+            label=_('Tree'),
+            variable=self._tableMode,
+            value=False,
+            command=self._set_view_mode,
+        )
+        self._viewMenu.add_radiobutton(
+            label=_('Table of books'),
+            variable=self._tableMode,
+            value=True,
+            command=self._set_view_mode,
+        )
 
         # Help
         self._mainMenu.add_command(
@@ -219,7 +451,10 @@ class CollectionView(tk.Toplevel, SubController):
         if PLATFORM != 'win':
             self.bind(KEYS.QUIT_PROGRAM[0], self.on_quit)
         self.bind(KEYS.OPEN_HELP[0], self._open_help)
+        self.bind(KEYS.UNDO[0], self._undo)
+        self.bind(KEYS.REDO[0], self._redo)
         self.bind('<Escape>', self._restore_status)
+        self._set_view_mode()
         self._open_last_collection()
 
     def on_quit(self, event=None):
@@ -238,6 +473,12 @@ class CollectionView(tk.Toplevel, SubController):
         except Exception as ex:
             self._show_cannot_save_error(str(ex))
         finally:
+            self._statsExecutor.shutdown(wait=False)
+            if self._prefetchJob is not None:
+                self.after_cancel(self._prefetchJob)
+            if self._changeJob is not None:
+                self.after_cancel(self._changeJob)
+            self._prefetcher.shutdown()
             self.destroy()
             self.isOpen = False
 
@@ -270,6 +511,7 @@ class CollectionView(tk.Toplevel, SubController):
                 self._set_status(f'!{str(ex)}')
             else:
                 if bkId is not None:
+                    self._refresh_stats()
                     self._set_status(
                         f'{_("Book added to the collection")}: '
                         f'"{book.novel.title}".'
@@ -279,6 +521,18 @@ class CollectionView(tk.Toplevel, SubController):
                         f'!{_("Book already exists")}: "{book.novel.title}".'
                     )
 
+    def _add_recent_collection(self, fileName):
+        # Put fileName on top of the "Recent collections" list.
+        recentCollections = [fileName]
+        key = os.path.normcase(os.path.abspath(fileName))
+        for filePath in self.get_recent_collections(self.prefs):
+            if os.path.normcase(os.path.abspath(filePath)) != key:
+                recentCollections.append(filePath)
+        self.prefs['recent_collections'] = os.pathsep.join(
+            recentCollections[:self.MAX_RECENT]
+        )
+        self._update_recent_menu()
+
     def _add_series(self, event=None):
         self._apply_changes()
         try:
@@ -300,18 +554,33 @@ class CollectionView(tk.Toplevel, SubController):
             title = self._indexCard.title.get()
             if title or self.element.title:
                 if self.element.title != title:
-                    self.element.title = title.strip()
-                    self._collection.tree.item(
-                        self.nodeId,
-                        text=self.element.title,
-                    )
+                    self._collection.set_title(self.nodeId, title.strip())
                     self.isModified = True
             if self._indexCard.bodyBox.hasChanged:
-                self.element.desc = self._indexCard.bodyBox.get_text()
-                self.isModified = True
+                if self._collection.set_desc(
+                    self.nodeId,
+                    self._indexCard.bodyBox.get_text(),
+                ):
+                    self.isModified = True
+            if self.nodeId in self._collection.books:
+                if self._collection.set_tags(
+                    self.nodeId,
+                    string_to_list(self._tagsText.get()),
+                ):
+                    self.isModified = True
         except AttributeError:
             pass
 
+    def _apply_filter(self):
+        # Show only the nodes matching the filter text.
+        self._filterJob = None
+        if self._collection is not None:
+            self._collection.filter_titles(self._filterText.get())
+
+    def _clear_filter(self, event=None):
+        self._filterText.set('')
+        return 'break'
+
     def _close_collection(self, event=None):
         # Close the collection without saving and reset the user interface.
         if self.isModified and self._ui.ask_yes_no(
@@ -324,13 +593,29 @@ class CollectionView(tk.Toplevel, SubController):
         self._apply_changes()
         self._indexCard.title.set('')
         self._indexCard.bodyBox.clear()
+        self._tagsText.set('')
+        self._tagsEntry.config(state='disabled')
         self._collection.reset_tree()
+
+        # Have the file ready for switching back.
+        self._preloader.preload([self._collection.filePath])
         self._collection = None
+        if self._tableMode.get():
+            self._bookTable.set_collection(None)
+        if self._changeJob is not None:
+            self.after_cancel(self._changeJob)
+            self._changeJob = None
+        self._pendingChanges = {}
+        self._statsFuture = None
+        self._duplicatesFuture = None
+        self._relocateFuture = None
+        self._pushFuture = None
         self.title('')
         self._show_status('')
         self._show_path('')
         self._fileMenu.entryconfig(_('Save'), state='disabled')
         self._fileMenu.entryconfig(_('Close'), state='disabled')
+        self._fileMenu.entryconfig(_('Restore saved version'), state='disabled')
         self.lift()
         self.focus()
 
@@ -341,6 +626,7 @@ class CollectionView(tk.Toplevel, SubController):
         self._apply_changes()
         fileTypes = [
             (_('novelibre collection'), Collection.EXTENSION),
+            (_('Compressed novelibre collection'), Collection.COMPRESSED_EXTENSION),
         ]
         fileName = filedialog.asksaveasfilename(
             filetypes=fileTypes,
@@ -355,13 +641,116 @@ class CollectionView(tk.Toplevel, SubController):
             self._close_collection()
 
         self._collection = Collection(fileName, self._treeView)
+        self._collection.changeBus.subscribe(self._on_collection_change)
+        if self._tableMode.get():
+            self._bookTable.set_collection(self._collection)
         self.prefs['last_open'] = fileName
         self._show_path(f'{norm_path(self._collection.filePath)}')
         self._set_title()
         self._fileMenu.entryconfig(_('Save'), state='normal')
         self._fileMenu.entryconfig(_('Close'), state='normal')
+        self._fileMenu.entryconfig(_('Restore saved version'), state='normal')
         return True
 
+    def _find_duplicates(self, event=None):
+        # Hash the books' project files in the background.
+        # Cached results make this fast for unchanged files.
+        self._apply_changes()
+        if self._collection is None or self._duplicatesFuture is not None:
+            return
+
+        filePaths = [
+            book.filePath for book in self._collection.books.values()
+            if book.filePath is not None
+        ]
+        self._show_status(f'{_("Searching for duplicate books")}...')
+        self._duplicatesFuture = self._statsExecutor.submit(
+            self._statsCache.collect_digests,
+            filePaths,
+        )
+        self._poll_duplicates(self._collection)
+
+    def _find_moved_books(self, event=None):
+        # Index the project files below a directory in the background,
+        # and look up the new locations of the missing books.
+        self._apply_changes()
+        if self._collection is None or self._relocateFuture is not None:
+            return
+
+        filePaths = set(
+            book.filePath for book in self._collection.books.values()
+            if book.isMissing and book.filePath is not None
+        )
+        if not filePaths:
+            self._set_status(f'{_("No missing books")}.')
+            return
+
+        initDir = self._collection.pathResolver.roots.get(
+            Collection.PROJECTS_ROOT,
+            os.path.dirname(self._collection.filePath),
+        )
+        directory = filedialog.askdirectory(
+            initialdir=initDir,
+            parent=self,
+        )
+        self.lift()
+        self.focus()
+        if not directory:
+            return
+
+        sizes = {}
+        for filePath in filePaths:
+            size = self._statsCache.get_size(filePath)
+            if size is not None:
+                sizes[filePath] = size
+        self._show_status(f'{_("Searching for moved books")}...')
+        self._relocateFuture = self._statsExecutor.submit(
+            self._locate_books,
+            directory,
+            filePaths,
+            sizes,
+        )
+        self._poll_relocate(self._collection)
+
+    def _is_editing(self):
+        # Return True, if a text input widget has the focus.
+        return isinstance(self.focus_get(), (tk.Entry, tk.Text, ttk.Entry))
+
+    def _locate_books(self, directory, filePaths, sizes):
+        # Return the new file paths and the ambiguous file paths.
+        # This runs in a background thread.
+        locator = BookLocator()
+        locator.add_directories([directory])
+        return locator.locate(filePaths, sizes)
+
+    def _merge_collection(self, event=None):
+        # Add the series and books of another collection file.
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        fileName = self._select_collection('')
+        self.lift()
+        self.focus()
+        if not fileName:
+            return
+
+        if (os.path.normcase(os.path.abspath(fileName))
+            == os.path.normcase(os.path.abspath(self._collection.filePath))
+        ):
+            self._set_status(f'!{_("Cannot merge a collection with itself")}.')
+            return
+
+        try:
+            self._set_status(self._collection.merge_collection(fileName))
+        except RuntimeError as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        self.isModified = True
+        self._apply_filter()
+        self._refresh_stats()
+
     def _move_node(self, event):
         # Move a selected node in the collection tree.
         tv = event.widget
@@ -371,17 +760,39 @@ class CollectionView(tk.Toplevel, SubController):
             return
 
         if node[:2] == targetNode[:2]:
-            tv.move(node, tv.parent(targetNode), tv.index(targetNode))
+            self._collection.move_node(
+                node,
+                tv.parent(targetNode),
+                tv.index(targetNode),
+            )
             self.isModified = True
         elif (node.startswith(BOOK_PREFIX)
               and targetNode.startswith(SERIES_PREFIX)
         ):
             if tv.get_children(targetNode):
-                tv.move(node, tv.parent(targetNode), tv.index(targetNode))
+                self._collection.move_node(
+                    node,
+                    tv.parent(targetNode),
+                    tv.index(targetNode),
+                )
             else:
-                tv.move(node, targetNode, 0)
+                self._collection.move_node(node, targetNode, 0)
             self.isModified = True
 
+    def _on_collection_change(self, eventType, elementId):
+        # Queue a change of the displayed element data.
+        # All changes queued are displayed when the application is idle,
+        # so bulk changes end up in one tree update.
+        self._pendingChanges.setdefault(elementId, set()).add(eventType)
+        if self._changeJob is None:
+            self._changeJob = self.after_idle(self._refresh_changed_nodes)
+
+    def _on_filter_change(self, *args):
+        # Filter with a delay, so that fast typing is not slowed down.
+        if self._filterJob is not None:
+            self.after_cancel(self._filterJob)
+        self._filterJob = self.after(self.FILTER_DELAY, self._apply_filter)
+
     def _on_select_node(self, event=None):
         self._apply_changes()
         try:
@@ -396,6 +807,9 @@ class CollectionView(tk.Toplevel, SubController):
             pass
         else:
             self._set_element_view()
+            self._schedule_prefetch()
+            if self._tableMode.get():
+                self._bookTable.see(self.nodeId)
 
     def _open_book(self, event=None):
         """Make the application open the selected book's project."""
@@ -433,17 +847,25 @@ class CollectionView(tk.Toplevel, SubController):
         self.isModified = False
         self.prefs['last_open'] = fileName
         self._collection = Collection(fileName, self._treeView)
+        self._collection.changeBus.subscribe(self._on_collection_change)
         try:
-            self._collection.read()
+            self._collection.read(self._preloader.get(fileName))
         except RuntimeError as ex:
             self._close_collection()
             self._set_status(f'!{str(ex)}')
             return False
 
+        self._add_recent_collection(fileName)
+        if self._tableMode.get():
+            self._bookTable.set_collection(self._collection)
+
         self._show_path(f'{norm_path(self._collection.filePath)}')
         self._set_title()
         self._fileMenu.entryconfig(_('Save'), state='normal')
         self._fileMenu.entryconfig(_('Close'), state='normal')
+        self._fileMenu.entryconfig(_('Restore saved version'), state='normal')
+        self._apply_filter()
+        self._refresh_stats()
         return True
 
     def _open_help(self, event=None):
@@ -454,6 +876,265 @@ class CollectionView(tk.Toplevel, SubController):
         if self._open_collection(fileName=self.prefs['last_open']):
             self.isOpen = True
 
+    def _poll_duplicates(self, collection):
+        # Offer merging the duplicate books, when the digests are available.
+        if self._duplicatesFuture is None or collection is not self._collection:
+            return
+
+        if not self._duplicatesFuture.done():
+            self.after(self.STATS_POLL_INTERVAL, self._poll_duplicates, collection)
+            return
+
+        future = self._duplicatesFuture
+        self._duplicatesFuture = None
+        try:
+            duplicates = self._collection.find_duplicates(future.result())
+        except Exception as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        if not duplicates:
+            self._set_status(f'{_("No duplicate books found")}.')
+            return
+
+        mergedCount = 0
+        for identical, bkIds in duplicates:
+            if identical:
+                message = _('Merge the entries of these identical books?')
+            else:
+                message = _('Merge the entries of these books with the same text?')
+            details = []
+            for bkId in bkIds:
+                book = self._collection.books[bkId]
+                details.append(f'{book.title}\n{norm_path(book.filePath)}')
+            if self._ui.ask_yes_no(
+                message=message,
+                detail='\n\n'.join(details),
+                title=FEATURE,
+                parent=self,
+            ):
+                self._collection.merge_books(bkIds)
+                self.isModified = True
+                mergedCount += 1
+        if mergedCount:
+            self._apply_filter()
+            self._refresh_element_view()
+        self._set_status(
+            f'{_("Duplicate books found")}: {len(duplicates)}, '
+            f'{_("merged")}: {mergedCount}.'
+        )
+
+    def _poll_push(self, collection, openProjects):
+        # Show a summary, when the project files are written.
+        if self._pushFuture is None or collection is not self._collection:
+            return
+
+        if not self._pushFuture.done():
+            self.after(self.STATS_POLL_INTERVAL, self._poll_push, collection, openProjects)
+            return
+
+        future = self._pushFuture
+        self._pushFuture = None
+        try:
+            updated, skipped, failed = future.result()
+        except Exception as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        message = (
+            f'{_("Project files updated")}: {len(updated) + openProjects}, '
+            f'{_("unchanged")}: {len(skipped)}, '
+            f'{_("failed")}: {len(failed)}.'
+        )
+        if updated:
+            # The modification dates have changed.
+            self._refresh_stats()
+        if not failed:
+            self._set_status(message)
+            return
+
+        self._set_status(f'!{message}')
+        lines = [error for __, error in failed[:self.MAX_REPORTED_FAILURES]]
+        if len(failed) > self.MAX_REPORTED_FAILURES:
+            lines.append(
+                f'({len(failed) - self.MAX_REPORTED_FAILURES} {_("more")})'
+            )
+        self._ui.show_error(
+            message=_('Some project files could not be updated'),
+            detail='\n'.join(lines),
+            parent=self,
+        )
+
+    def _poll_relocate(self, collection):
+        # Offer relocating the missing books, when the search is done.
+        if self._relocateFuture is None or collection is not self._collection:
+            return
+
+        if not self._relocateFuture.done():
+            self.after(self.STATS_POLL_INTERVAL, self._poll_relocate, collection)
+            return
+
+        future = self._relocateFuture
+        self._relocateFuture = None
+        try:
+            newPaths, ambiguous = future.result()
+        except Exception as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        if not newPaths:
+            self._set_status(
+                f'{_("No moved books found")}; '
+                f'{_("ambiguous")}: {len(ambiguous)}.'
+            )
+            return
+
+        details = []
+        for book in self._collection.books.values():
+            if book.isMissing and book.filePath in newPaths:
+                details.append(f'{book.title}\n{norm_path(newPaths[book.filePath])}')
+        if len(details) > self.MAX_LISTED_BOOKS:
+            moreBooks = len(details) - self.MAX_LISTED_BOOKS
+            details = details[:self.MAX_LISTED_BOOKS]
+            details.append(f'({moreBooks} {_("more")})')
+        if not self._ui.ask_yes_no(
+            message=_('Relocate these books?'),
+            detail='\n\n'.join(details),
+            title=FEATURE,
+            parent=self,
+        ):
+            return
+
+        relocated = self._collection.relocate_books(newPaths)
+        if relocated:
+            self.isModified = True
+            self._refresh_element_view()
+            self._refresh_stats()
+        self._set_status(
+            f'{_("Books relocated")}: {len(relocated)}, '
+            f'{_("ambiguous")}: {len(ambiguous)}.'
+        )
+
+    def _poll_stats(self, collection):
+        # Apply the background statistics results, if available.
+        if self._statsFuture is None or collection is not self._collection:
+            return
+
+        if not self._statsFuture.done():
+            self.after(self.STATS_POLL_INTERVAL, self._poll_stats, collection)
+            return
+
+        future = self._statsFuture
+        self._statsFuture = None
+        try:
+            self._show_status(self._collection.apply_stats(future.result()))
+        except Exception as ex:
+            self._set_status(f'!{str(ex)}')
+
+    def _prefetch_book(self):
+        # Have the selected book's project read in the background,
+        # so it opens quickly.
+        self._prefetchJob = None
+        if self._collection is None:
+            return
+
+        book = self._collection.books.get(self.nodeId, None)
+        if book is not None and book.filePath is not None:
+            self._prefetcher.prefetch(book.filePath)
+
+    def _push_metadata(self, event=None):
+        # Write the titles and descriptions of the selected book,
+        # or of the selected series' books, into the project files.
+        # This is done in the background.
+        self._apply_changes()
+        if self._collection is None or self._pushFuture is not None:
+            return
+
+        if self.nodeId in self._collection.series:
+            bkIds = self._collection.treeFilter.get_children(self.nodeId)
+        elif self.nodeId in self._collection.books:
+            bkIds = [self.nodeId]
+        else:
+            return
+
+        openProject = None
+        if self._mdl.novel is not None:
+            openProject = self._mdl.prjFile.filePath
+        openProjects = 0
+        items = []
+        for bkId in bkIds:
+            book = self._collection.books[bkId]
+            if book.filePath is None:
+                continue
+
+            if book.filePath == openProject:
+                # Saving the open project would overwrite the file.
+                book.push_metadata(self._mdl.novel)
+                openProjects += 1
+                continue
+
+            items.append((book.filePath, book.title, book.desc))
+        self._show_status(f'{_("Updating project files")}...')
+        self._pushFuture = self._statsExecutor.submit(
+            NovxMetadataWriter.push_all,
+            items,
+        )
+        self._poll_push(self._collection, openProjects)
+
+    def _refresh_changed_nodes(self):
+        # Display the queued changes in the tree.
+        self._changeJob = None
+        changes = self._pendingChanges
+        self._pendingChanges = {}
+        if self._collection is not None:
+            self._collection.refresh_nodes(changes)
+            if self._tableMode.get():
+                self._bookTable.refresh(changes)
+
+    def _refresh_element_view(self):
+        # View the selected element again after the tree has changed.
+        if self.nodeId in self._collection.books:
+            self.element = self._collection.books[self.nodeId]
+        elif self.nodeId in self._collection.series:
+            self.element = self._collection.series[self.nodeId]
+        else:
+            self.element = None
+            self.nodeId = None
+            self._indexCard.title.set('')
+            self._indexCard.bodyBox.clear()
+            self._tagsText.set('')
+            self._tagsEntry.config(state='disabled')
+            return
+
+        self._set_element_view()
+
+    def _refresh_stats(self, event=None):
+        # Collect the book statistics in the background.
+        # Cached results make this fast for unchanged files.
+        if self._collection is None or self._statsFuture is not None:
+            return
+
+        filePaths = [book.filePath for book in self._collection.books.values()]
+        self._statsFuture = self._statsExecutor.submit(
+            self._statsCache.collect,
+            filePaths,
+        )
+        self._poll_stats(self._collection)
+
+    def _redo(self, event=None):
+        if event is not None and self._is_editing():
+            # Let the text widget handle the key.
+            return
+
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        self._show_undo_result(
+            self._collection.redo(),
+            _('Nothing to redo'),
+        )
+
     def _remove_book(self, event=None):
         self._apply_changes()
         try:
@@ -556,23 +1237,75 @@ class CollectionView(tk.Toplevel, SubController):
         # Overwrite error message with the status before."""
         self._show_status(self.statusText)
 
+    def _restore_version(self, versionId):
+        # Replace the collection's content with a saved version.
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        if self.isModified:
+            detail = _('There are unsaved changes')
+        else:
+            detail = _('The restored version is saved as the latest version')
+        if not self._ui.ask_yes_no(
+            message=_('Restore the saved version?'),
+            detail=detail,
+            title=FEATURE,
+            parent=self,
+        ):
+            return
+
+        try:
+            message = self._collection.restore_version(versionId)
+        except RuntimeError as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        self.isModified = True
+        self._apply_filter()
+        self._refresh_stats()
+        self._refresh_element_view()
+        self._set_status(message)
+
     def _save_collection(self, event=None):
         """Save the collection."""
         if self._collection is None:
             return
 
-        if not self.isModified:
+        if not self.isModified and not self._collection.upgradePending:
             self._set_status(f"{_('No changes to save')}.")
             return
 
         self._apply_changes()
         try:
-            self._collection.write()
+            message = self._collection.write()
         except Exception as ex:
             self._show_cannot_save_error(str(ex))
         else:
             self.isModified = False
-            self._set_status(f"{_('Collection saved')}.")
+            if self._collection.mergeConflicts is None:
+                self._set_status(f"{_('Collection saved')}.")
+                return
+
+            # The collection was rebuilt with another process's changes.
+            self._apply_filter()
+            self._refresh_stats()
+            self._refresh_element_view()
+            if self._collection.mergeConflicts:
+                message = f'!{message}'
+            self._set_status(message)
+
+    def _schedule_prefetch(self):
+        # Prefetch with a delay, so that browsing the tree
+        # does not start reading every book passed.
+        if self._prefetchJob is not None:
+            self.after_cancel(self._prefetchJob)
+        self._prefetchJob = self.after(self.PREFETCH_DELAY, self._prefetch_book)
+
+    def _select_book(self, bkId):
+        # Select the book chosen in the table in the tree as well,
+        # so the commands apply to it.
+        self._treeView.selection_set(bkId)
 
     def _select_collection(self, fileName):
         # Return a collection file path.
@@ -587,6 +1320,7 @@ class CollectionView(tk.Toplevel, SubController):
         if not fileName or not os.path.isfile(fileName):
             fileTypes = [
                 (_('novelibre collection'), Collection.EXTENSION),
+                (_('Compressed novelibre collection'), Collection.COMPRESSED_EXTENSION),
             ]
             fileName = filedialog.askopenfilename(
                 filetypes=fileTypes,
@@ -600,12 +1334,43 @@ class CollectionView(tk.Toplevel, SubController):
         return fileName
 
     def _set_element_view(self, event=None):
-        # View the selected element's title and description.
+        # View the selected element's title, description, and tags.
         self._indexCard.bodyBox.clear()
         if self.element.desc:
             self._indexCard.bodyBox.set_text(self.element.desc)
         if self.element.title:
             self._indexCard.title.set(self.element.title)
+        if self.nodeId in self._collection.books:
+            self._tagsText.set(list_to_string(self.element.tags))
+            self._tagsEntry.config(state='normal')
+        else:
+            self._tagsText.set('')
+            self._tagsEntry.config(state='disabled')
+
+    def _set_projects_root(self, event=None):
+        # Define or move the root directory of the collection's projects.
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        initDir = self._collection.pathResolver.roots.get(
+            Collection.PROJECTS_ROOT,
+            os.path.dirname(self._collection.filePath),
+        )
+        directory = filedialog.askdirectory(
+            initialdir=initDir,
+            parent=self,
+        )
+        self.lift()
+        self.focus()
+        if not directory:
+            return
+
+        self._set_status(
+            self._collection.set_root(Collection.PROJECTS_ROOT, directory)
+        )
+        self.isModified = True
+        self._refresh_stats()
 
     def _set_status(self, statusMsg):
         # Display the status message at the status bar.
@@ -626,6 +1391,29 @@ class CollectionView(tk.Toplevel, SubController):
             collectionTitle = _('Untitled collection')
         self.title(f'{collectionTitle} - {FEATURE}')
 
+    def _set_view_mode(self):
+        # Show either the tree, or the flat table of books.
+        self.prefs['table_view'] = self._tableMode.get()
+        if self._tableMode.get():
+            self._treeView.pack_forget()
+            self._bookTable.pack(
+                side='left',
+                expand=True,
+                fill='both',
+                before=self._indexCard,
+            )
+            self._bookTable.set_collection(self._collection)
+            self._bookTable.see(self.nodeId)
+        else:
+            self._bookTable.pack_forget()
+            self._bookTable.set_collection(None)
+            self._treeView.pack(
+                side='left',
+                expand=True,
+                fill='both',
+                before=self._indexCard,
+            )
+
     def _show_cannot_save_error(self, errorMsg):
         self._ui.show_error(
             message=_('Cannot save the collection'),
@@ -646,6 +1434,167 @@ class CollectionView(tk.Toplevel, SubController):
         self._statusBar.config(fg='black')
         self._statusBar.config(text=statusMsg)
 
+    def _show_undo_result(self, message, failMessage):
+        # Update the view after undo or redo.
+        if message is None:
+            self._set_status(f'!{failMessage}.')
+            return
+
+        self.isModified = True
+        self._apply_filter()
+        self._refresh_element_view()
+        self._set_status(message)
+
+    def _sort(self, sortBy='title', reverse=False, selectedSeries=False):
+        # Sort the whole collection, or the selected series.
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        parent = None
+        if selectedSeries:
+            try:
+                parent = self._collection.tree.selection()[0]
+            except IndexError:
+                return
+
+            if not parent.startswith(SERIES_PREFIX):
+                return
+
+        self._set_status(
+            self._collection.sort(
+                parent=parent,
+                sortBy=sortBy,
+                reverse=reverse,
+            )
+        )
+        self._apply_filter()
+        self.isModified = True
+
+    def _split_series(self, event=None):
+        # Move the selected series with its books into a new collection file.
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        try:
+            nodeId = self._collection.tree.selection()[0]
+        except IndexError:
+            return
+
+        if not nodeId.startswith(SERIES_PREFIX):
+            return
+
+        fileTypes = [
+            (_('novelibre collection'), Collection.EXTENSION),
+            (_('Compressed novelibre collection'), Collection.COMPRESSED_EXTENSION),
+        ]
+        fileName = filedialog.asksaveasfilename(
+            filetypes=fileTypes,
+            defaultextension=fileTypes[0][1],
+            initialdir=os.path.dirname(self._collection.filePath),
+            parent=self,
+        )
+        self.lift()
+        self.focus()
+        if not fileName:
+            return
+
+        try:
+            self._set_status(self._collection.split_series(nodeId, fileName))
+        except RuntimeError as ex:
+            self._set_status(f'!{str(ex)}')
+            return
+
+        self.isModified = True
+        self._refresh_element_view()
+
+    def _type_ahead(self, event):
+        # Select the next book or series whose title starts with the typed text.
+        if self._collection is None:
+            return
+
+        if not event.char or not event.char.isprintable() or event.state & 0x000C:
+            # Let the tree handle control keys and shortcuts.
+            return
+
+        if event.time - self._typeAheadTime > self.TYPE_AHEAD_TIMEOUT:
+            self._typeAheadText = ''
+        if event.char == ' ' and not self._typeAheadText:
+            return
+
+        self._typeAheadTime = event.time
+        self._typeAheadText += event.char
+        text = self._typeAheadText
+        if text == text[0] * len(text):
+            # Repeating a character steps through the matching titles.
+            prefix = text[0]
+            after = self.nodeId
+        else:
+            prefix = text
+            after = None
+            if (self.element is not None
+                and (self.element.title or '').casefold().startswith(prefix.casefold())
+            ):
+                return 'break'
+
+        for elementId in self._collection.titleIndex.find(prefix, after):
+            if not self._collection.treeFilter.is_hidden(elementId):
+                self._treeView.see(elementId)
+                self._treeView.focus(elementId)
+                self._treeView.selection_set(elementId)
+                break
+        return 'break'
+
+    def _undo(self, event=None):
+        if event is not None and self._is_editing():
+            # Let the text widget handle the key.
+            return
+
+        self._apply_changes()
+        if self._collection is None:
+            return
+
+        self._show_undo_result(
+            self._collection.undo(),
+            _('Nothing to undo'),
+        )
+
+    def _update_history_menu(self):
+        # Rebuild the "Restore saved version" submenu.
+        self._historyMenu.delete(0, 'end')
+        if self._collection is None:
+            return
+
+        history = self._collection.history
+        for versionId in history.get_versions()[:self.MAX_HISTORY]:
+            try:
+                books, series = history.get_summary(versionId)
+                timestamp = history.get_timestamp(versionId)
+            except (OSError, ValueError):
+                continue
+
+            self._historyMenu.add_command(
+                label=(
+                    f'{timestamp.isoformat(sep=" ", timespec="seconds")} - '
+                    f'{books} {_("Books")}, {series} {_("Series")}'
+                ),
+                command=lambda versionId=versionId: self._restore_version(
+                    versionId,
+                ),
+            )
+
+    def _update_recent_menu(self):
+        # Rebuild the "Recent collections" submenu.
+        self._recentMenu.delete(0, 'end')
+        for filePath in self.get_recent_collections(self.prefs):
+            self._recentMenu.add_command(
+                label=norm_path(filePath),
+                command=lambda filePath=filePath: self._open_collection(
+                    fileName=filePath,
+                ),
+            )
+
     def _update_collection(self, event=None):
         self._apply_changes()
         if self._mdl.novel is None:
@@ -660,7 +1609,7 @@ class CollectionView(tk.Toplevel, SubController):
             return
 
         self._ui.refresh()
-        if self._collection.books[self.nodeId].pull_metadata(self._mdl.novel):
+        if self._collection.pull_metadata(self.nodeId, self._mdl.novel):
             self.isModified = True
             self._set_element_view()
 
@@ -679,4 +1628,3 @@ class CollectionView(tk.Toplevel, SubController):
 
         self._apply_changes()
         self._collection.books[self.nodeId].push_metadata(self._mdl.novel)
-
@@ -0,0 +1,66 @@
+"""Provide a class for the collection's undo/redo stacks.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from collections import deque
+
+
+class CommandLog:
+    """Undo and redo stacks of reversible edit commands.
+
+    A command is a small tuple describing one edit,
+    with the command type as first item.
+    See Collection for the command types.
+    Only the changed data is stored, so the memory usage
+    depends on the number of edits, not on the collection size.
+    """
+    MAX_COMMANDS = 1000
+    # The oldest commands are dropped beyond this limit.
+
+    def __init__(self):
+        self._undoStack = deque(maxlen=self.MAX_COMMANDS)
+        self._redoStack = []
+
+    @property
+    def canRedo(self):
+        return bool(self._redoStack)
+
+    @property
+    def canUndo(self):
+        return bool(self._undoStack)
+
+    def clear(self):
+        """Discard all commands."""
+        self._undoStack.clear()
+        self._redoStack.clear()
+
+    def pop_redo(self):
+        """Return the last undone command, or None.
+
+        The command is moved to the undo stack.
+        """
+        if not self._redoStack:
+            return None
+
+        command = self._redoStack.pop()
+        self._undoStack.append(command)
+        return command
+
+    def pop_undo(self):
+        """Return the last command, or None.
+
+        The command is moved to the redo stack.
+        """
+        if not self._undoStack:
+            return None
+
+        command = self._undoStack.pop()
+        self._redoStack.append(command)
+        return command
+
+    def push(self, command):
+        """Add a new command and discard the undone ones."""
+        self._undoStack.append(command)
+        self._redoStack.clear()
@@ -0,0 +1,60 @@
+"""Provide a class for keeping descriptions out of memory.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from collections import OrderedDict
+import tempfile
+
+
+class DescStore:
+    """Sidecar store for the descriptions of a collection.
+
+    Long descriptions are written to an anonymous temporary file
+    when the collection is read, and loaded on first access.
+    Only the most recently loaded descriptions are kept in memory.
+    """
+    MIN_LENGTH = 64
+    # Shorter descriptions are kept in memory.
+
+    MAX_LOADED = 64
+    # Maximum number of loaded descriptions.
+
+    def __init__(self):
+        self._file = None
+        self._loaded = OrderedDict()
+        # LRU cache:
+        #   keyword -- key as returned by put()
+        #   value -- str: description
+
+    def clear(self):
+        """Discard all stored descriptions."""
+        self._loaded.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def get(self, key):
+        """Return the description stored under key."""
+        desc = self._loaded.get(key, None)
+        if desc is not None:
+            self._loaded.move_to_end(key)
+            return desc
+
+        offset, length = key
+        self._file.seek(offset)
+        desc = self._file.read(length).decode('utf-8')
+        self._loaded[key] = desc
+        if len(self._loaded) > self.MAX_LOADED:
+            self._loaded.popitem(last=False)
+        return desc
+
+    def put(self, desc):
+        """Store a description and return its key."""
+        if self._file is None:
+            self._file = tempfile.TemporaryFile()
+        data = desc.encode('utf-8')
+        offset = self._file.seek(0, 2)
+        self._file.write(data)
+        return (offset, len(data))
@@ -0,0 +1,114 @@
+"""Provide a class for advisory file locking.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import os
+import socket
+import time
+
+from nvcollection.nvcollection_locale import _
+from nvlib.novx_globals import norm_path
+
+
+class FileLock:
+    """Advisory lock on a file, shared with other processes and hosts.
+
+    The lock is a file next to the locked file, created exclusively,
+    so it also works on network shares. It only protects against
+    processes that use the same locking.
+    A lock file older than STALE_AGE is considered left over
+    from a crashed process, and is removed.
+
+    Usage:
+        with FileLock(filePath):
+            ...
+    """
+    EXTENSION = 'lock'
+
+    TIMEOUT = 10.0
+    # Seconds to wait for another process to release the lock.
+
+    STALE_AGE = 60.0
+    # Seconds after which a lock is considered stale.
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, filePath):
+        """Positional arguments:
+            filePath -- str: path to the file to lock.
+        """
+        self.filePath = filePath
+        self.lockPath = f'{filePath}.{self.EXTENSION}'
+        self._isLocked = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def acquire(self):
+        """Create the lock file, waiting for other processes if necessary.
+
+        Raise the "RuntimeError" exception, if the lock
+        is not released within TIMEOUT.
+        """
+        deadline = time.monotonic() + self.TIMEOUT
+        while True:
+            try:
+                fd = os.open(self.lockPath, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._remove_stale_lock():
+                    continue
+
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f'{_("File is locked by another process")}: '
+                        f'"{norm_path(self.filePath)}".'
+                    )
+
+                time.sleep(self.POLL_INTERVAL)
+            except OSError:
+                # The directory does not allow locking, e.g. it is read-only.
+                # Writing the file will fail anyway, if applicable.
+                return
+
+            else:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(f'{socket.gethostname()} {os.getpid()}\n')
+                self._isLocked = True
+                return
+
+    def release(self):
+        """Remove the lock file, if created by this instance."""
+        if not self._isLocked:
+            return
+
+        self._isLocked = False
+        try:
+            os.remove(self.lockPath)
+        except OSError:
+            pass
+
+    def _remove_stale_lock(self):
+        # Remove the lock file, if it is older than STALE_AGE.
+        # Return True, if the lock file is removed or gone.
+        try:
+            age = time.time() - os.path.getmtime(self.lockPath)
+        except OSError:
+            return True
+
+        if age < self.STALE_AGE:
+            return False
+
+        try:
+            os.remove(self.lockPath)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+
+        return True
@@ -0,0 +1,151 @@
+"""Provide a class for a tree structure without a display.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class HeadlessTree:
+    """Replacement for the ttk.Treeview holding the collection's structure.
+
+    Provides the Treeview methods used by the Collection model,
+    so that collections can be processed without a display.
+    Item options and tags are stored, but have no visible effect.
+    """
+
+    def __init__(self):
+        self._children = {'': []}
+        # Dictionary:
+        #   keyword -- item ID, or '' for the top level
+        #   value -- list of child item IDs
+
+        self._parents = {}
+        # Dictionary:
+        #   keyword -- item ID
+        #   value -- parent item ID, or None if the item is detached
+
+        self._options = {}
+        # Dictionary:
+        #   keyword -- item ID
+        #   value -- dictionary of the item options
+
+        self._tags = {}
+
+    def delete(self, *items):
+        """Delete the items with all their descendants."""
+        for item in items:
+            self._unlink(item)
+            self._delete_item(item)
+
+    def detach(self, *items):
+        """Unlink the items from the tree, but keep them."""
+        for item in items:
+            self._unlink(item)
+            self._parents[item] = None
+
+    def exists(self, item):
+        return item in self._options
+
+    def get_children(self, item=''):
+        return tuple(self._children[item])
+
+    def index(self, item):
+        parent = self._parents[item]
+        if parent is None:
+            return 0
+
+        return self._children[parent].index(item)
+
+    def insert(self, parent, index, iid, **options):
+        """Create a new item and return its ID."""
+        if iid in self._options:
+            raise ValueError(f'Item {iid} already exists')
+
+        self._options[iid] = options
+        self._children[iid] = []
+        self._link(iid, parent, index)
+        return iid
+
+    def item(self, item, option=None, **options):
+        """Query or modify the options of an item."""
+        if options:
+            self._options[item].update(options)
+            return None
+
+        if option is not None:
+            return self._options[item].get(option, '')
+
+        return dict(self._options[item])
+
+    def move(self, item, parent, index):
+        """Move an item to the position index in the list of parent's children."""
+        self._unlink(item)
+        self._link(item, parent, index)
+
+    def next(self, item):
+        parent = self._parents[item]
+        if parent is None:
+            return ''
+
+        siblings = self._children[parent]
+        index = siblings.index(item) + 1
+        if index < len(siblings):
+            return siblings[index]
+
+        return ''
+
+    def parent(self, item):
+        parent = self._parents[item]
+        if parent is None:
+            return ''
+
+        return parent
+
+    def prev(self, item):
+        parent = self._parents[item]
+        if parent is None:
+            return ''
+
+        siblings = self._children[parent]
+        index = siblings.index(item)
+        if index > 0:
+            return siblings[index - 1]
+
+        return ''
+
+    def selection(self):
+        return ()
+
+    def set_children(self, item, *newChildren):
+        """Replace the children of item; the old children are detached."""
+        for child in self._children[item]:
+            self._parents[child] = None
+        self._children[item] = []
+        for child in newChildren:
+            self.move(child, item, 'end')
+
+    def tag_configure(self, tagName, **options):
+        self._tags.setdefault(tagName, {}).update(options)
+
+    def _delete_item(self, item):
+        # Forget an unlinked item and its descendants.
+        for child in self._children.pop(item):
+            self._delete_item(child)
+        del self._parents[item]
+        del self._options[item]
+
+    def _link(self, item, parent, index):
+        # Insert an unlinked item into the list of parent's children.
+        siblings = self._children[parent]
+        if index == 'end':
+            siblings.append(item)
+        else:
+            siblings.insert(max(int(index), 0), item)
+        self._parents[item] = parent
+
+    def _unlink(self, item):
+        # Remove an item from its parent's list of children.
+        parent = self._parents.get(item, None)
+        if parent is not None:
+            self._children[parent].remove(item)
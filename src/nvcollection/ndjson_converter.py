@@ -0,0 +1,148 @@
+"""Provide a class for streaming NDJSON import and export of collections.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import json
+import os
+
+from nvcollection.collection import Collection
+from nvcollection.nvcollection_locale import _
+from nvcollection.nvcx_compression import NvcxCompression
+from nvcollection.nvcx_writer import NvcxWriter
+from nvlib.novx_globals import norm_path
+
+
+class NdjsonConverter:
+    """Converter between nvcx collection files and NDJSON.
+
+    NDJSON files have one JSON object per line,
+    one record per root, series, or book, in document order.
+    See NvcxOpener.iter_records() for the record keys.
+
+    Both directions are generator pipelines that process
+    one record at a time, so the memory usage does not depend
+    on the collection size.
+    """
+
+    @classmethod
+    def export_collection(cls, nvcxPath, ndjsonPath):
+        """Write the records of the nvcx file at nvcxPath to ndjsonPath.
+
+        Return a message.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        records = Collection.fileOpener.iter_records(
+            nvcxPath,
+            Collection.MAJOR_VERSION,
+            Collection.MINOR_VERSION,
+        )
+        count = cls._write_file(ndjsonPath, cls.dump_records(records))
+        return f'{count} {_("records exported to")} "{norm_path(ndjsonPath)}".'
+
+    @classmethod
+    def import_collection(cls, ndjsonPath, nvcxPath):
+        """Write the records of the NDJSON file at ndjsonPath to nvcxPath.
+
+        The records must be in document order.
+        The nvcx file is compressed, if its name says so.
+        Overwrite an existing nvcx file without confirmation.
+        Return a message.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        tempPath = f'{nvcxPath}.tmp'
+        count = 0
+        try:
+            with NvcxCompression.open_write(
+                tempPath,
+                compressed=NvcxCompression.has_compressed_name(nvcxPath),
+            ) as f:
+                writer = NvcxWriter(
+                    f,
+                    Collection.MAJOR_VERSION,
+                    Collection.MINOR_VERSION,
+                )
+                for record in cls.load_records(ndjsonPath):
+                    writer.write_record(record)
+                    count += 1
+                writer.close()
+            os.replace(tempPath, nvcxPath)
+        except Exception as ex:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            if isinstance(ex, RuntimeError):
+                raise
+
+            raise RuntimeError(
+                f'{_("Cannot write file")}: '
+                f'"{norm_path(nvcxPath)}" - {str(ex)}'
+            )
+
+        return f'{count} {_("records imported to")} "{norm_path(nvcxPath)}".'
+
+    @classmethod
+    def dump_records(cls, records):
+        """Generate NDJSON lines from records."""
+        for record in records:
+            yield f'{json.dumps(record, ensure_ascii=False)}\n'
+
+    @classmethod
+    def load_records(cls, ndjsonPath):
+        """Generate records from the NDJSON file at ndjsonPath.
+
+        Empty lines are skipped.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        try:
+            with open(ndjsonPath, 'r', encoding='utf-8') as f:
+                for lineNumber, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    record = json.loads(line)
+                    if (not isinstance(record, dict)
+                        or record.get('type', None) not in ('ROOT', 'SERIES', 'BOOK')
+                        or not record.get('id', None)
+                    ):
+                        raise ValueError(
+                            f'{_("Invalid record in line")} {lineNumber}'
+                        )
+
+                    yield record
+
+        except (OSError, ValueError) as ex:
+            raise RuntimeError(
+                f'{_("Cannot process file")}: '
+                f'"{norm_path(ndjsonPath)}" - {str(ex)}'
+            )
+
+    @classmethod
+    def _write_file(cls, filePath, lines):
+        # Write lines to filePath through a temporary file.
+        # Return the number of lines written.
+        tempPath = f'{filePath}.tmp'
+        count = 0
+        try:
+            with open(tempPath, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    f.write(line)
+                    count += 1
+            os.replace(tempPath, filePath)
+        except Exception as ex:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            if isinstance(ex, RuntimeError):
+                raise
+
+            raise RuntimeError(
+                f'{_("Cannot write file")}: '
+                f'"{norm_path(filePath)}" - {str(ex)}'
+            )
+
+        return count
@@ -0,0 +1,268 @@
+"""Provide a class for writing book metadata into novelibre project files.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+from xml.parsers import expat
+
+from nvcollection.nvcollection_locale import _
+from nvlib.novx_globals import norm_path
+import xml.etree.ElementTree as ET
+
+
+class NovxMetadataWriter:
+    """Writer for the title and description of .novx project files.
+
+    Only the PROJECT element's Title and Desc are replaced.
+    The rest of the file, including the XML prolog, comments,
+    and processing instructions, is kept byte for byte, 
+    so the projects do not need to be opened in novelibre.
+    Each file is written to a temporary file that replaces the original,
+    so a project file is never left half-written.
+    Files whose metadata already matches are not written.
+    """
+    MAX_WORKERS = 8
+    INDENT = '  '
+    TAG = re.compile(
+        rb'''<(?:/\s*)?[^\s/>]+(?:\s+[^\s=/>]+\s*=\s*(?:"[^"]*"|'[^']*'))*\s*/?>'''
+    )
+    # Start, end, or empty-element tag.
+
+    @classmethod
+    def push_all(cls, items):
+        """Write metadata into several project files by parallel workers.
+
+        Positional arguments:
+            items -- iterable of tuples (project file path, title, description).
+
+        Return a tuple (updated paths, skipped paths, failures),
+        where failures is a list of tuples (file path, error message).
+        This method may run in a background thread.
+        """
+        items = list(items)
+        updated = []
+        skipped = []
+        failed = []
+        with ThreadPoolExecutor(max_workers=cls.MAX_WORKERS) as executor:
+            results = executor.map(cls._push, items)
+            for (filePath, __, __), (written, error) in zip(items, results):
+                if error is not None:
+                    failed.append((filePath, error))
+                elif written:
+                    updated.append(filePath)
+                else:
+                    skipped.append(filePath)
+        return updated, skipped, failed
+
+    @classmethod
+    def write_metadata(cls, filePath, title, desc):
+        """Write title and description into the project file at filePath.
+
+        Return True, if the file is written,
+        or False, if its metadata already matches.
+        Raise the "RuntimeError" exception in case of error.
+        """
+        try:
+            with open(filePath, 'rb') as f:
+                data = f.read()
+            project = cls._get_project(data)
+        except Exception as ex:
+            raise RuntimeError(
+                f'{_("Cannot process file")}: '
+                f'"{norm_path(filePath)}" - {str(ex)}'
+            )
+
+        if project is None:
+            raise RuntimeError(
+                f'{_("No valid novelibre project")}: "{norm_path(filePath)}".'
+            )
+
+        edits = cls._get_edits(data, project, title, desc)
+        if not edits:
+            return False
+
+        for start, end, replacement in sorted(edits, reverse=True):
+            data = data[:start] + replacement.encode('utf-8') + data[end:]
+        tempPath = f'{filePath}.tmp'
+        try:
+            with open(tempPath, 'wb') as f:
+                f.write(data)
+            os.replace(tempPath, filePath)
+        except OSError:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            raise RuntimeError(
+                f'{_("Cannot write file")}: '
+                f'"{norm_path(filePath)}".'
+            )
+
+        return True
+
+    @classmethod
+    def _get_desc(cls, xmlDesc):
+        # Return the description as a string, or None.
+        if xmlDesc is None:
+            return None
+
+        return '\n'.join(
+            ''.join(xmlParagraph.itertext())
+            for xmlParagraph in xmlDesc.iterfind('p')
+        )
+
+    @classmethod
+    def _get_edits(cls, data, project, title, desc):
+        # Return a list of tuples (start, end, replacement) for the data.
+        # The list is empty, if the metadata already matches.
+        start, end, children = project
+        elements = {}
+        for tag, elementStart, elementEnd in children:
+            elements.setdefault(tag, (elementStart, elementEnd))
+        # Only the first Title and Desc elements count.
+
+        indent = f'\n{cls.INDENT * 2}'
+        edits = []
+        insertions = []
+        # Elements to insert after the PROJECT start tag.
+
+        oldTitle = None
+        if 'Title' in elements:
+            titleStart, titleEnd = elements['Title']
+            oldTitle = ET.fromstring(data[titleStart:titleEnd]).text
+        if title and title != oldTitle:
+            xmlTitle = ET.Element('Title')
+            xmlTitle.text = title
+            newTitle = ET.tostring(xmlTitle, encoding='unicode')
+            if 'Title' in elements:
+                edits.append((titleStart, titleEnd, newTitle))
+            else:
+                insertions.append(newTitle)
+
+        xmlDesc = None
+        if 'Desc' in elements:
+            descStart, descEnd = elements['Desc']
+            xmlDesc = ET.fromstring(data[descStart:descEnd])
+        if cls._normalize(desc) != cls._normalize(cls._get_desc(xmlDesc)):
+            if desc:
+                xmlDesc = ET.Element('Desc')
+                for paragraph in desc.split('\n'):
+                    ET.SubElement(xmlDesc, 'p').text = paragraph
+                ET.indent(xmlDesc, space=cls.INDENT, level=2)
+                newDesc = ET.tostring(xmlDesc, encoding='unicode')
+                if 'Desc' in elements:
+                    edits.append((descStart, descEnd, newDesc))
+                else:
+                    # Insert after the Title and Author elements.
+                    position = None
+                    for tag, __, elementEnd in children:
+                        if tag in ('Title', 'Author'):
+                            position = elementEnd
+                    if position is None:
+                        insertions.append(newDesc)
+                    else:
+                        edits.append((position, position, f'{indent}{newDesc}'))
+            elif 'Desc' in elements:
+                # Remove the element with the preceding line break and indentation.
+                while descStart > 0 and data[descStart - 1:descStart].isspace():
+                    descStart -= 1
+                edits.append((descStart, descEnd, ''))
+
+        if not insertions:
+            return edits
+
+        content = ''.join(f'{indent}{element}' for element in insertions)
+        startTag = cls.TAG.match(data, start)
+        if startTag.group().endswith(b'/>'):
+            # Empty PROJECT element.
+            startTag = startTag.group()[:-2].rstrip().decode('utf-8')
+            edits.append((
+                start,
+                end,
+                f'{startTag}>{content}\n{cls.INDENT}</PROJECT>',
+            ))
+        elif data[startTag.end():end].strip():
+            edits.append((startTag.end(), startTag.end(), content))
+        else:
+            # No content but whitespace.
+            edits.append((startTag.end(), end, f'{content}\n{cls.INDENT}'))
+        return edits
+
+    @classmethod
+    def _get_element_end(cls, data, start, endIndex):
+        # Return the byte index after the element starting at start.
+        # endIndex is the parser's position at the end of the element.
+        startTag = cls.TAG.match(data, start)
+        if startTag.group().endswith(b'/>'):
+            return startTag.end()
+
+        return cls.TAG.match(data, endIndex).end()
+
+    @classmethod
+    def _get_project(cls, data):
+        # Return a tuple (start, end, children) for the PROJECT element,
+        # or None, if the data is not a novelibre project.
+        #   start -- byte index of the start tag.
+        #   end -- byte index of the end tag, or after the empty-element tag.
+        #   children -- list of tuples (tag, start, end) with the byte range
+        #               of each child element.
+        parser = expat.ParserCreate()
+        rootTags = []
+        openElements = []
+        # List of tuples (tag, start).
+
+        projects = []
+        children = []
+
+        def start_element(tag, attrs):
+            if not openElements:
+                rootTags.append(tag)
+            openElements.append((tag, parser.CurrentByteIndex))
+
+        def end_element(tag):
+            __, start = openElements.pop()
+            if projects:
+                # Only the first PROJECT element counts.
+                return
+
+            if len(openElements) == 1 and tag == 'PROJECT':
+                projects.append((start, parser.CurrentByteIndex, children))
+            elif len(openElements) == 2 and openElements[-1][0] == 'PROJECT':
+                children.append((
+                    tag,
+                    start,
+                    cls._get_element_end(data, start, parser.CurrentByteIndex),
+                ))
+
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.Parse(data, True)
+        if rootTags != ['novx'] or not projects:
+            return None
+
+        return projects[0]
+
+    @classmethod
+    def _normalize(cls, desc):
+        # Return the description without empty paragraphs, for comparison.
+        if not desc:
+            return ''
+
+        return '\n'.join(
+            paragraph.strip() for paragraph in desc.split('\n')
+            if paragraph.strip()
+        )
+
+    @classmethod
+    def _push(cls, item):
+        # Return a tuple (written, error message) for a worker thread.
+        filePath, title, desc = item
+        try:
+            return cls.write_metadata(filePath, title, desc), None
+
+        except RuntimeError as ex:
+            return False, str(ex)
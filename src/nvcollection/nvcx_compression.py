@@ -0,0 +1,71 @@
+"""Provide a class for transparent compression of nvcx files.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import gzip
+
+
+class NvcxCompression:
+    """Open nvcx files with or without gzip compression.
+
+    When reading, compressed files are detected by their content,
+    regardless of the file name. When writing, the file is compressed
+    if its name has the EXTENSION suffix.
+    Data is compressed and decompressed on the fly,
+    so there is no temporary uncompressed copy.
+    """
+    EXTENSION = 'gz'
+    MAGIC = b'\x1f\x8b'
+    # First bytes of a gzip file.
+
+    COMPRESS_LEVEL = 6
+    # Trade-off between speed and file size.
+
+    @classmethod
+    def has_compressed_name(cls, filePath):
+        """Return True, if filePath has the compressed file suffix."""
+        return filePath.lower().endswith(f'.{cls.EXTENSION}')
+
+    @classmethod
+    def is_compressed(cls, filePath):
+        """Return True, if the file at filePath is gzip compressed.
+
+        Raise the "OSError" exception, if the file cannot be read.
+        """
+        with open(filePath, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @classmethod
+    def open_read(cls, filePath):
+        """Return a binary file object with the uncompressed content.
+
+        Raise the "OSError" exception, if the file cannot be read.
+        """
+        if cls.is_compressed(filePath):
+            return gzip.open(filePath, 'rb')
+
+        return open(filePath, 'rb')
+
+    @classmethod
+    def open_write(cls, filePath, compressed=None):
+        """Return a text file object for writing utf-8 encoded XML.
+
+        Optional arguments:
+            compressed -- bool: if True, compress the file.
+                          If None, compress it if the name says so.
+
+        Raise the "OSError" exception, if the file cannot be created.
+        """
+        if compressed is None:
+            compressed = cls.has_compressed_name(filePath)
+        if compressed:
+            return gzip.open(
+                filePath,
+                'wt',
+                compresslevel=cls.COMPRESS_LEVEL,
+                encoding='utf-8',
+            )
+
+        return open(filePath, 'w', encoding='utf-8')
@@ -4,6 +4,9 @@ Copyright (c) Peter Triesberger
 For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
+from nvcollection.nvcx_compression import NvcxCompression
+from nvcollection.parser.etree_parser import EtreeParser
+from nvcollection.parser.expat_parser import ExpatParser
 from nvlib.novx_globals import norm_path
 from nvlib.nv_locale import _
 import xml.etree.ElementTree as ET
@@ -12,6 +15,35 @@ import xml.etree.ElementTree as ET
 class NvcxOpener:
     """nvcx XML data reader, verifier, and preprocessor."""
 
+    UPGRADES = {
+        (1, 0): (1, 1),
+        (1, 1): (1, 2),
+        (1, 2): (1, 3),
+    }
+    # Migration path for legacy files.
+    #   keyword -- file version
+    #   value -- version after applying the _migrate_<major>_<minor> method
+
+    PARSERS = (ExpatParser, EtreeParser)
+    # Parser backends, in order of preference.
+    # The ElementTree backend is the fallback.
+
+    parser = None
+    # Parser backend class to use for iter_records().
+    # If None, the first available backend of PARSERS is used.
+
+    @classmethod
+    def get_parser(cls):
+        """Return the parser backend class to use."""
+        if cls.parser is not None:
+            return cls.parser
+
+        for parser in cls.PARSERS:
+            if parser.is_available():
+                return parser
+
+        return EtreeParser
+
     @classmethod
     def get_xml_root(cls, filePath, majorVersion, minorVersion):
         """Return a reference to the XML root of the nvcx file at filePath.
@@ -20,7 +52,8 @@ class NvcxOpener:
         Check the file version and preprocess the data, if applicable.
         """
         try:
-            xmlTree = ET.parse(filePath)
+            with NvcxCompression.open_read(filePath) as f:
+                xmlTree = ET.parse(f)
         except Exception as ex:
             raise RuntimeError(
                 f'{_("Cannot process file")}: '
@@ -28,6 +61,94 @@ class NvcxOpener:
             )
 
         xmlRoot = xmlTree.getroot()
+        cls._check_root(xmlRoot, filePath, majorVersion, minorVersion)
+        return xmlRoot
+
+    @classmethod
+    def iter_records(
+            cls,
+            filePath,
+            majorVersion,
+            minorVersion,
+            fileInfo=None,
+            validator=None,
+    ):
+        """Generate the root, series, and book records of the nvcx file.
+        
+        Positional arguments:
+            majorVersion, minorVersion -- int: supported DTD version.
+
+        Optional arguments:
+            fileInfo -- dict: if given, the root element's tag 
+                        and attributes are stored there.
+            validator -- NvcxValidator instance: if given, the file 
+                         is validated while it is parsed. 
+                         The violations are available when 
+                         all records are generated.
+
+        The file is parsed incrementally by the parser backend,
+        so the memory usage does not depend on the collection size.
+        Compressed files are decompressed on the fly.
+        
+        Series and book records are dictionaries with the keys:
+            type -- str: 'SERIES' or 'BOOK'.
+            id -- str: series or book ID.
+            parent -- str: parent series ID; empty on the top level.
+            position -- int: index within the parent.
+            title -- str: title; None if there is no Title element.
+            desc -- str: paragraphs separated by newlines; 
+                    None if there is no Desc element.
+            path -- str: project file path; books only.
+            root -- str: name of the root the path is relative to;
+                    None if the path is relative to the collection file
+                    or absolute; books only.
+            tags -- list of str: tags; None if there is no Tags element;
+                    books only.
+        Root records are dictionaries with the keys:
+            type -- str: 'ROOT'.
+            id -- str: root name.
+            path -- str: root directory.
+        Records are generated in document order.
+        Records from legacy files are migrated on the fly;
+        in this case, fileInfo['upgraded'] is set True.
+
+        Raise the "RuntimeError" exception in case of error.
+        """
+        migrations = []
+
+        def check_root(xmlRoot):
+            if fileInfo is not None:
+                fileInfo['tag'] = xmlRoot.tag
+                fileInfo.update(xmlRoot.attrib)
+            migrations.extend(
+                cls._check_root(xmlRoot, filePath, majorVersion, minorVersion)
+            )
+            if fileInfo is not None:
+                fileInfo['upgraded'] = bool(migrations)
+
+        try:
+            for record in cls.get_parser()(validator).iter_records(
+                filePath,
+                check_root,
+            ):
+                for migrate in migrations:
+                    record = migrate(record)
+                yield record
+
+        except RuntimeError:
+            raise
+
+        except Exception as ex:
+            raise RuntimeError(
+                f'{_("Cannot process file")}: '
+                f'"{norm_path(filePath)}" - {str(ex)}'
+            )
+
+    @classmethod
+    def _check_root(cls, xmlRoot, filePath, majorVersion, minorVersion):
+        # Raise an exception if the root element is not valid
+        # or not compatible with the supported DTD.
+        # Return a list of record transforms for legacy files.
         if not xmlRoot.tag in ('nvcx', 'COLLECTION'):
             msg = _("No valid xml root element found in file")
             raise RuntimeError(f'{msg}: "{norm_path(filePath)}".')
@@ -36,10 +157,12 @@ class NvcxOpener:
             xmlRoot,
             filePath,
         )
+        migrations = []
         fileMajorVersion, fileMinorVersion = cls._upgrade_file_version(
             xmlRoot,
             fileMajorVersion,
             fileMinorVersion,
+            migrations,
         )
         cls._check_version(
             fileMajorVersion,
@@ -48,7 +171,7 @@ class NvcxOpener:
             majorVersion,
             minorVersion,
         )
-        return xmlRoot
+        return migrations
 
     @classmethod
     def _check_version(
@@ -79,16 +202,27 @@ class NvcxOpener:
             xmlRoot,
             fileMajorVersion,
             fileMinorVersion,
+            migrations,
     ):
-        # Convert the data from legacy files
+        # Chain the record transforms for legacy files to migrations.
         # Return the version number adjusted, if applicable.
+        while (fileMajorVersion, fileMinorVersion) in cls.UPGRADES:
+            migrations.append(
+                getattr(cls, f'_migrate_{fileMajorVersion}_{fileMinorVersion}')
+            )
+            fileMajorVersion, fileMinorVersion = cls.UPGRADES[
+                (fileMajorVersion, fileMinorVersion)
+            ]
         return fileMajorVersion, fileMinorVersion
 
     @classmethod
     def _get_file_version(cls, xmlRoot, filePath):
         # Return the major and minor file version as integers.
+        # Legacy files with a "COLLECTION" root may have no version.
         # Raise an exception if there is none.
-        # Update xmlRoot.
+        if xmlRoot.tag == 'COLLECTION' and not 'version' in xmlRoot.attrib:
+            return 1, 0
+
         try:
             (
                 fileMajorVersionStr,
@@ -102,3 +236,22 @@ class NvcxOpener:
 
         return fileMajorVersion, fileMinorVersion
 
+    @classmethod
+    def _migrate_1_0(cls, record):
+        # Convert a record from version 1.0 to 1.1.
+        # The versions differ only in the root element's tag,
+        # so the record is passed on unchanged.
+        return record
+
+    @classmethod
+    def _migrate_1_1(cls, record):
+        # Convert a record from version 1.1 to 1.2.
+        # Version 1.2 adds optional root directories;
+        # the paths of version 1.1 remain valid.
+        return record
+
+    @classmethod
+    def _migrate_1_2(cls, record):
+        # Convert a record from version 1.2 to 1.3.
+        # Version 1.3 adds optional book tags.
+        return record
@@ -0,0 +1,413 @@
+"""Provide a class for structural validation of nvcx files.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import re
+from xml.parsers import expat
+
+from nvcollection.nvcollection_globals import BOOK_PREFIX
+from nvcollection.nvcollection_globals import SERIES_PREFIX
+from nvcollection.nvcollection_locale import _
+from nvcollection.nvcx_compression import NvcxCompression
+
+
+class NvcxValidator:
+    """Single-pass nvcx validator.
+
+    The validator is driven by the parser events of the nvcx
+    parser backend, so the file is checked against the DTD while it 
+    is parsed for reading, in linear time. For validating a file
+    without reading it, the raw data can be fed in chunks instead.
+    Memory usage depends only on the nesting depth
+    and the number of IDs.
+
+    Text in element-only content is reported at the line
+    of the next tag, so all backends report the same lines,
+    as long as no tag spans several lines.
+
+    The DTD declarations are compiled into state machines once
+    per DTD version, and shared by all instances.
+    """
+    CHUNK_SIZE = 65536
+
+    DTD = {
+        '1.3': '''
+            <!ELEMENT nvcx (ROOT*, (SERIES | BOOK)*)>
+            <!ATTLIST nvcx version NMTOKEN #FIXED "1.3">
+            <!ELEMENT ROOT (#PCDATA)>
+            <!ATTLIST ROOT name NMTOKEN #REQUIRED>
+            <!ELEMENT SERIES (Title?, Desc?, BOOK*)>
+            <!ATTLIST SERIES id ID #REQUIRED>
+            <!ELEMENT Title (#PCDATA)>
+            <!ELEMENT Desc (p*)>
+            <!ELEMENT p (#PCDATA)>
+            <!ELEMENT BOOK (Title?, Desc?, Tags?, Path)>
+            <!ATTLIST BOOK id ID #REQUIRED>
+            <!ELEMENT Tags (#PCDATA)>
+            <!ELEMENT Path (#PCDATA)>
+            <!ATTLIST Path root NMTOKEN #IMPLIED>
+            ''',
+        '1.2': '''
+            <!ELEMENT nvcx (ROOT*, (SERIES | BOOK)*)>
+            <!ATTLIST nvcx version NMTOKEN #FIXED "1.2">
+            <!ELEMENT ROOT (#PCDATA)>
+            <!ATTLIST ROOT name NMTOKEN #REQUIRED>
+            <!ELEMENT SERIES (Title?, Desc?, BOOK*)>
+            <!ATTLIST SERIES id ID #REQUIRED>
+            <!ELEMENT Title (#PCDATA)>
+            <!ELEMENT Desc (p*)>
+            <!ELEMENT p (#PCDATA)>
+            <!ELEMENT BOOK (Title?, Desc?, Path)>
+            <!ATTLIST BOOK id ID #REQUIRED>
+            <!ELEMENT Path (#PCDATA)>
+            <!ATTLIST Path root NMTOKEN #IMPLIED>
+            ''',
+        '1.1': '''
+            <!ELEMENT nvcx (SERIES | BOOK)*>
+            <!ATTLIST nvcx version NMTOKEN #FIXED "1.1">
+            <!ELEMENT SERIES (Title?, Desc?, BOOK*)>
+            <!ATTLIST SERIES id ID #REQUIRED>
+            <!ELEMENT Title (#PCDATA)>
+            <!ELEMENT Desc (p*)>
+            <!ELEMENT p (#PCDATA)>
+            <!ELEMENT BOOK (Title?, Desc?, Path)>
+            <!ATTLIST BOOK id ID #REQUIRED>
+            <!ELEMENT Path (#PCDATA)>
+            ''',
+        '1.0': '''
+            <!ELEMENT COLLECTION (SERIES | BOOK)*>
+            <!ATTLIST COLLECTION version NMTOKEN #FIXED "1.0">
+            <!ELEMENT SERIES (Title?, Desc?, BOOK*)>
+            <!ATTLIST SERIES id ID #REQUIRED>
+            <!ELEMENT Title (#PCDATA)>
+            <!ELEMENT Desc (p*)>
+            <!ELEMENT p (#PCDATA)>
+            <!ELEMENT BOOK (Title?, Desc?, Path)>
+            <!ATTLIST BOOK id ID #REQUIRED>
+            <!ELEMENT Path (#PCDATA)>
+            ''',
+    }
+    # DTD declarations per file version.
+    # They must match the files in the dtd directory, which are
+    # not part of the plugin package; this is checked by a test.
+    # The first declared element is the root element.
+
+    LATEST_VERSION = '1.3'
+
+    ID_PREFIXES = {'SERIES': SERIES_PREFIX, 'BOOK': BOOK_PREFIX}
+    # The plugin identifies element types by their ID prefixes.
+
+    _rules = {}
+    # Cache of compiled DTDs.
+    #   keyword -- file version
+    #   value -- tuple (content models, attribute lists)
+
+    @classmethod
+    def validate_file(cls, filePath):
+        """Return a list of (line number, message) tuples.
+
+        An empty list means the file at filePath is valid.
+        Raise the "OSError" exception, if the file cannot be read.
+        """
+        validator = cls()
+        with NvcxCompression.open_read(filePath) as f:
+            while True:
+                chunk = f.read(cls.CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                validator.feed(chunk)
+        return validator.close()
+
+    @classmethod
+    def compile_dtd(cls, dtd):
+        """Return a tuple (content models, attribute lists) for the DTD.
+
+        Positional arguments:
+            dtd -- str: DTD declarations.
+
+        The content models are a dictionary with a state machine
+        per element; the first declared element is the root element.
+        The attribute lists are a dictionary with a dictionary
+        per element: (type, default, fixed value) per attribute name.
+        """
+        models = {}
+        for tag, model in re.findall(r'<!ELEMENT\s+(\S+)\s+([^>]+)>', dtd):
+            models[tag] = cls._compile_model(model.strip())
+        attributes = {}
+        for tag, declarations in re.findall(r'<!ATTLIST\s+(\S+)\s+([^>]+)>', dtd):
+            attributes[tag] = {}
+            for name, attrType, default, value in re.findall(
+                r'(\S+)\s+(\S+)\s+(#REQUIRED|#IMPLIED|#FIXED|)\s*(?:"([^"]*)")?',
+                declarations,
+            ):
+                attributes[tag][name] = (attrType, default, value)
+        return models, attributes
+
+    def __init__(self):
+        self.violations = []
+        # List of (line number, message) tuples.
+
+        self._parser = None
+        # expat parser, if the raw data is fed to the validator.
+
+        self._models = None
+        self._attributes = None
+        self._stack = []
+        # Open elements: list of [tag, content model, state, text flag] lists.
+
+        self._ids = set()
+        self._isBroken = False
+        self._textPending = False
+        # True, if text not allowed in the open element is to be reported.
+
+    def character_data(self, data):
+        """Check text of the open element."""
+        if self._isBroken or not self._stack:
+            return
+
+        __, model, __, textFound = self._stack[-1]
+        if textFound or model is None or model == '#PCDATA':
+            return
+
+        if data.strip():
+            self._textPending = True
+            # Report each element once.
+            self._stack[-1][3] = True
+
+    def close(self):
+        """Finish validation and return the list of violations."""
+        if self._parser is not None and not self._isBroken:
+            try:
+                self._parser.Parse(b'', True)
+            except expat.ExpatError as ex:
+                self._add_violation(str(ex), ex.lineno)
+        return self.violations
+
+    def end_element(self, tag, lineNumber):
+        """Check the content of the element closed at lineNumber."""
+        if self._isBroken:
+            return
+
+        self._report_text(lineNumber)
+        tag, model, state, __ = self._stack.pop()
+        if model is None or model == '#PCDATA':
+            return
+
+        __, accepting = model
+        if not state in accepting:
+            self._add_violation(
+                f'{_("Incomplete content in element")} "{tag}"',
+                lineNumber,
+            )
+
+    def feed(self, data):
+        """Parse and validate the next chunk of the file's raw data.
+        
+        This is for validating a file that is not read by a parser backend.
+        """
+        if self._isBroken:
+            return
+
+        if self._parser is None:
+            self._parser = expat.ParserCreate()
+            self._parser.buffer_text = True
+            self._parser.StartElementHandler = self._on_start_element
+            self._parser.EndElementHandler = self._on_end_element
+            self._parser.CharacterDataHandler = self.character_data
+        try:
+            self._parser.Parse(data, False)
+        except expat.ExpatError as ex:
+            # The file is not well-formed; further checks are pointless.
+            self._add_violation(str(ex), ex.lineno)
+            self._isBroken = True
+
+    def start_element(self, tag, attrs, lineNumber):
+        """Check an element opened at lineNumber, and its attributes."""
+        if self._isBroken:
+            return
+
+        self._report_text(lineNumber)
+        if not self._stack:
+            version = attrs.get('version', None)
+            if version is None and tag == 'COLLECTION':
+                version = '1.0'
+            elif not version in self.DTD:
+                # The version attribute is checked against the latest DTD.
+                version = self.LATEST_VERSION
+            self._models, self._attributes = self._get_rules(version)
+            if next(iter(self._models)) != tag:
+                self._add_violation(
+                    f'{_("No valid xml root element found")}: "{tag}"',
+                    lineNumber,
+                )
+                self._isBroken = True
+                return
+
+        else:
+            parentTag, parentModel, state, __ = self._stack[-1]
+            if parentModel == '#PCDATA':
+                self._add_violation(
+                    f'{_("Element")} "{tag}" {_("not allowed in element")} '
+                    f'"{parentTag}"',
+                    lineNumber,
+                )
+            elif parentModel is not None:
+                transitions, __ = parentModel
+                nextState = transitions.get((state, tag), None)
+                if nextState is None:
+                    self._add_violation(
+                        f'{_("Element")} "{tag}" {_("not allowed here in element")} '
+                        f'"{parentTag}"',
+                        lineNumber,
+                    )
+                else:
+                    self._stack[-1][2] = nextState
+        model = self._models.get(tag, None)
+        if model is None:
+            self._add_violation(f'{_("Undeclared element")} "{tag}"', lineNumber)
+        self._check_attributes(tag, attrs, lineNumber)
+        self._stack.append([tag, model, 0, False])
+
+    def _add_violation(self, message, lineNumber):
+        self.violations.append((lineNumber, message))
+
+    def _check_attributes(self, tag, attrs, lineNumber):
+        attributes = self._attributes.get(tag, {})
+        for name in attrs:
+            if not name in attributes:
+                self._add_violation(
+                    f'{_("Undeclared attribute")} "{name}" '
+                    f'{_("in element")} "{tag}"',
+                    lineNumber,
+                )
+        for name, (attrType, default, value) in attributes.items():
+            if not name in attrs:
+                if default == '#REQUIRED':
+                    self._add_violation(
+                        f'{_("Missing attribute")} "{name}" '
+                        f'{_("in element")} "{tag}"',
+                        lineNumber,
+                    )
+                continue
+
+            if default == '#FIXED' and attrs[name] != value:
+                self._add_violation(
+                    f'{_("Attribute")} "{name}" {_("must be")} "{value}" '
+                    f'{_("in element")} "{tag}"',
+                    lineNumber,
+                )
+            if attrType == 'ID':
+                self._check_id(tag, attrs[name], lineNumber)
+
+    def _check_id(self, tag, elementId, lineNumber):
+        if elementId in self._ids:
+            self._add_violation(f'{_("Duplicate ID")} "{elementId}"', lineNumber)
+            return
+
+        self._ids.add(elementId)
+        prefix = self.ID_PREFIXES.get(tag, None)
+        if prefix and not re.fullmatch(f'{prefix}[0-9]+', elementId):
+            self._add_violation(
+                f'{_("Invalid ID")} "{elementId}" {_("in element")} "{tag}"',
+                lineNumber,
+            )
+
+    def _on_end_element(self, tag):
+        # expat handler, if the raw data is fed.
+        self.end_element(tag, self._parser.CurrentLineNumber)
+
+    def _on_start_element(self, tag, attrs):
+        # expat handler, if the raw data is fed.
+        self.start_element(tag, attrs, self._parser.CurrentLineNumber)
+
+    def _report_text(self, lineNumber):
+        # Report text found in the open element before the tag at lineNumber.
+        if self._textPending:
+            self._add_violation(
+                f'{_("Text not allowed in element")} "{self._stack[-1][0]}"',
+                lineNumber,
+            )
+            self._textPending = False
+
+    @classmethod
+    def _compile_model(cls, model):
+        # Return the content model as a state machine:
+        # a tuple (transitions, accepting states), or '#PCDATA'.
+        # Supported: a sequence of names or name choices,
+        # each with an optional quantifier, or a quantified choice.
+        model = model.replace(' ', '')
+        if model == '(#PCDATA)':
+            return '#PCDATA'
+
+        if model == 'EMPTY':
+            return ({}, {0})
+
+        match = re.fullmatch(r'\((.*)\)([?*+]?)', model)
+        body, quantifier = match.group(1), match.group(2)
+        if '|' in body and not '(' in body:
+            particles = [(frozenset(body.split('|')), quantifier)]
+        else:
+            particles = []
+            for item in re.findall(r'(\([^)]*\)|[\w.-]+)([?*+]?)', body):
+                names, itemQuantifier = item
+                particles.append(
+                    (frozenset(names.strip('()').split('|')), itemQuantifier)
+                )
+
+        # State 2*i: before particle i.
+        # State 2*i+1: particle i matched, and it may repeat.
+        def step(state, tag):
+            # Return the state after reading tag, or None.
+            index, matched = divmod(state, 2)
+            if matched:
+                if tag in particles[index][0]:
+                    return state
+
+                index += 1
+            for i in range(index, len(particles)):
+                names, quant = particles[i]
+                if tag in names:
+                    if quant in ('*', '+'):
+                        return 2 * i + 1
+
+                    return 2 * (i + 1)
+
+                if quant in ('', '+'):
+                    return None
+
+            return None
+
+        def is_accepting(state):
+            index, matched = divmod(state, 2)
+            for __, quant in particles[index + matched:]:
+                if quant in ('', '+'):
+                    return False
+
+            return True
+
+        allNames = set()
+        for names, __ in particles:
+            allNames.update(names)
+        transitions = {}
+        accepting = set()
+        for state in range(2 * len(particles) + 1):
+            if is_accepting(state):
+                accepting.add(state)
+            for tag in allNames:
+                nextState = step(state, tag)
+                if nextState is not None:
+                    transitions[(state, tag)] = nextState
+        return (transitions, accepting)
+
+    @classmethod
+    def _get_rules(cls, version):
+        # Return the compiled content models and attribute lists
+        # for the DTD of the file version.
+        if version in cls._rules:
+            return cls._rules[version]
+
+        cls._rules[version] = cls.compile_dtd(cls.DTD[version])
+        return cls._rules[version]
@@ -0,0 +1,209 @@
+"""Provide a class for streaming nvcx XML output.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from xml.sax.saxutils import escape
+
+from nvcollection.nvcollection_locale import _
+from nvlib.model.xml.xml_filter import strip_illegal_characters
+from nvlib.novx_globals import list_to_string
+
+
+class NvcxWriter:
+    """Streaming nvcx XML writer.
+
+    Series and book records are written one by one in document order,
+    so the memory usage does not depend on the collection size.
+    The output is formatted the same way as Collection.write does.
+
+    A record is a dictionary as generated by NvcxOpener.iter_records().
+    """
+    INDENT = '  '
+
+    def __init__(self, file, majorVersion, minorVersion):
+        """Write the XML header and the root start tag.
+
+        Positional arguments:
+            file -- text file object, open for writing.
+            majorVersion -- int: major DTD version.
+            minorVersion -- int: minor DTD version.
+        """
+        self._file = file
+        self._file.write(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<!DOCTYPE nvcx SYSTEM "nvcx_{majorVersion}_{minorVersion}.dtd">\n'
+            f'<nvcx version="{majorVersion}.{minorVersion}"'
+        )
+        self._isEmpty = True
+        # True, if the root element has no children yet.
+
+        self._seriesId = None
+        # ID of the series element that is still open.
+
+        self._seriesIsEmpty = True
+        # True, if the open series element has no children yet.
+
+        self._positions = {'': 0}
+        # Dictionary:
+        #   keyword -- parent ID
+        #   value -- expected position of the next child
+
+    def close(self):
+        """Write the closing tags."""
+        self._close_series()
+        if self._isEmpty:
+            self._file.write(' />')
+        else:
+            self._file.write('</nvcx>\n')
+
+    def write_record(self, record):
+        """Write a root, series, or book record.
+
+        Raise the "RuntimeError" exception, if the record
+        is not in document order.
+        """
+        if record['type'] == 'ROOT':
+            if self._positions[''] or self._seriesId is not None:
+                raise RuntimeError(
+                    f'{_("Records are not in document order")}: '
+                    f'"{record.get("id", "")}".'
+                )
+
+            self._open_child()
+            xmlRoot = self._element(
+                'ROOT',
+                record.get('path', None),
+                name=record['id'],
+            )
+            self._file.write(f'{self.INDENT}{xmlRoot}\n')
+            return
+
+        parent = record.get('parent', '') or ''
+        if parent != self._seriesId:
+            self._close_series()
+        if parent and parent != self._seriesId:
+            raise RuntimeError(
+                f'{_("Records are not in document order")}: '
+                f'"{record.get("id", "")}".'
+            )
+
+        position = record.get('position', None)
+        if position is not None and position != self._positions[parent]:
+            raise RuntimeError(
+                f'{_("Records are not in document order")}: '
+                f'"{record.get("id", "")}".'
+            )
+
+        self._positions[parent] += 1
+        if record['type'] == 'SERIES':
+            if parent:
+                raise RuntimeError(
+                    f'{_("Series cannot be nested")}: "{record["id"]}".'
+                )
+
+            self._open_child()
+            self._file.write(
+                f'{self.INDENT}<SERIES id="{self._escape_attr(record["id"])}"'
+            )
+            self._seriesId = record['id']
+            self._seriesIsEmpty = True
+            self._positions[self._seriesId] = 0
+            for line in self._get_content(record, 2):
+                self._open_series_content()
+                self._file.write(line)
+        elif record['type'] == 'BOOK':
+            if parent:
+                self._open_series_content()
+                level = 2
+            else:
+                self._open_child()
+                level = 1
+            indentation = self.INDENT * level
+            self._file.write(
+                f'{indentation}<BOOK id="{self._escape_attr(record["id"])}"'
+            )
+            lines = list(self._get_content(record, level + 1))
+            if record.get('tags', None):
+                xmlTags = self._element('Tags', list_to_string(record['tags']))
+                lines.append(f'{indentation}{self.INDENT}{xmlTags}\n')
+            if record.get('path', None) is not None:
+                xmlPath = self._element(
+                    'Path',
+                    record['path'],
+                    root=record.get('root', None),
+                )
+                lines.append(f'{indentation}{self.INDENT}{xmlPath}\n')
+            if lines:
+                self._file.write('>\n')
+                self._file.writelines(lines)
+                self._file.write(f'{indentation}</BOOK>\n')
+            else:
+                self._file.write(' />\n')
+        else:
+            raise RuntimeError(
+                f'{_("Unknown record type")}: "{record["type"]}".'
+            )
+
+    def _close_series(self):
+        # Write the end tag of the open series element, if any.
+        if self._seriesId is None:
+            return
+
+        if self._seriesIsEmpty:
+            self._file.write(' />\n')
+        else:
+            self._file.write(f'{self.INDENT}</SERIES>\n')
+        self._seriesId = None
+
+    def _element(self, tag, text, **attributes):
+        # Return a single-line XML element.
+        # Attributes with the value None are omitted.
+        startTag = tag
+        for name, value in attributes.items():
+            if value is not None:
+                startTag = f'{startTag} {name}="{self._escape_attr(value)}"'
+        if text:
+            return f'<{startTag}>{self._escape_text(text)}</{tag}>'
+
+        return f'<{startTag} />'
+
+    def _escape_attr(self, value):
+        return escape(
+            strip_illegal_characters(value),
+            {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#09;'},
+        )
+
+    def _escape_text(self, text):
+        return escape(strip_illegal_characters(text))
+
+    def _get_content(self, record, level):
+        # Generate the formatted Title and Desc lines of a record.
+        indentation = self.INDENT * level
+        if record.get('title', None) is not None:
+            yield f'{indentation}{self._element("Title", record["title"])}\n'
+        desc = record.get('desc', None)
+        if desc is not None:
+            if desc:
+                yield f'{indentation}<Desc>\n'
+                for paragraph in desc.split('\n'):
+                    yield (
+                        f'{indentation}{self.INDENT}'
+                        f'{self._element("p", paragraph)}\n'
+                    )
+                yield f'{indentation}</Desc>\n'
+            else:
+                yield f'{indentation}<Desc />\n'
+
+    def _open_child(self):
+        # Complete the root start tag before writing the first child.
+        if self._isEmpty:
+            self._file.write('>\n')
+            self._isEmpty = False
+
+    def _open_series_content(self):
+        # Complete the series start tag before writing the first child.
+        if self._seriesIsEmpty:
+            self._file.write('>\n')
+            self._seriesIsEmpty = False
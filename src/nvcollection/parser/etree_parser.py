@@ -0,0 +1,182 @@
+"""Provide an ElementTree based nvcx parser backend.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from nvcollection.nvcx_compression import NvcxCompression
+from nvcollection.parser.nvcx_parser import NvcxParser
+from nvlib.novx_globals import string_to_list
+import xml.etree.ElementTree as ET
+
+
+class EtreeParser(NvcxParser):
+    """nvcx parser backend using the xml.etree.ElementTree pull parser.
+    
+    This is the fallback backend. Processed elements are discarded,
+    so the memory usage does not depend on the collection size.
+    If there is a validator, the file is fed to the parser
+    line by line, so the validator gets the line number of each event.
+    A tag spanning several lines is reported at its last line.
+    """
+
+    def iter_records(self, filePath, check_root):
+        """Generate the records of the file at filePath.
+        
+        Overrides the superclass method.
+        """
+        xmlStack = []
+        positions = {'': 0}
+        pendingSeries = None
+        for event, xmlElement in self._iterparse(filePath):
+            if event == 'start':
+                if not xmlStack:
+                    check_root(xmlElement)
+                elif xmlElement.tag == 'BOOK' and pendingSeries is not None:
+                    # The series' Title and Desc are complete.
+                    yield self._get_record(pendingSeries, '', positions)
+                    pendingSeries = None
+                elif xmlElement.tag == 'SERIES' and len(xmlStack) == 1:
+                    pendingSeries = xmlElement
+                xmlStack.append(xmlElement)
+                continue
+
+            xmlStack.pop()
+            if xmlElement.tag == 'BOOK' and (
+                len(xmlStack) == 1
+                or (len(xmlStack) == 2 and xmlStack[-1].tag == 'SERIES')
+            ):
+                parent = ''
+                if len(xmlStack) == 2:
+                    parent = xmlStack[-1].attrib.get('id', '')
+                record = self._get_record(xmlElement, parent, positions)
+                xmlTags = xmlElement.find('Tags')
+                if xmlTags is not None:
+                    record['tags'] = string_to_list(xmlTags.text or '')
+                else:
+                    record['tags'] = None
+                xmlPath = xmlElement.find('Path')
+                if xmlPath is not None:
+                    record['path'] = xmlPath.text or ''
+                    record['root'] = xmlPath.attrib.get('root', None)
+                else:
+                    record['path'] = None
+                    record['root'] = None
+                xmlStack[-1].remove(xmlElement)
+                yield record
+
+            elif xmlElement.tag == 'ROOT' and len(xmlStack) == 1:
+                xmlStack[-1].remove(xmlElement)
+                yield dict(
+                    type='ROOT',
+                    id=xmlElement.attrib.get('name', ''),
+                    path=xmlElement.text or '',
+                )
+
+            elif xmlElement.tag == 'SERIES' and len(xmlStack) == 1:
+                if pendingSeries is not None:
+                    yield self._get_record(pendingSeries, '', positions)
+                    pendingSeries = None
+                xmlStack[-1].remove(xmlElement)
+
+    def _get_record(self, xmlElement, parent, positions):
+        # Return a record with the common series and book data.
+        # Update the position counters.
+        elementId = xmlElement.attrib.get('id', '')
+        position = positions.get(parent, 0)
+        positions[parent] = position + 1
+        if xmlElement.tag == 'SERIES':
+            positions[elementId] = 0
+        xmlTitle = xmlElement.find('Title')
+        if xmlTitle is not None:
+            title = xmlTitle.text or ''
+        else:
+            title = None
+        xmlDesc = xmlElement.find('Desc')
+        if xmlDesc is not None:
+            paragraphs = []
+            for xmlParagraph in xmlDesc.iterfind('p'):
+                paragraphs.append(xmlParagraph.text or '')
+            desc = '\n'.join(paragraphs)
+        else:
+            desc = None
+        return dict(
+            type=xmlElement.tag,
+            id=elementId,
+            parent=parent,
+            position=position,
+            title=title,
+            desc=desc,
+        )
+
+    def _iterparse(self, filePath):
+        # Generate the parser events.
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        with NvcxCompression.open_read(filePath) as f:
+            if self._validator is None:
+                while True:
+                    chunk = f.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    parser.feed(chunk)
+                    yield from parser.read_events()
+            else:
+                yield from self._iterparse_validated(parser, f)
+        parser.close()
+        yield from parser.read_events()
+
+    def _iterparse_validated(self, parser, f):
+        # Generate the parser events, driving the validator.
+        # The text between the tags is taken from the "text" and "tail"
+        # attributes, which are complete when the next event is read.
+        flush = getattr(parser, 'flush', None)
+        # Makes newer expat versions report each line's events at once.
+
+        openElements = []
+        # List of [element, last child] lists.
+
+        lineNumber = 0
+        for lineNumber, line in enumerate(f, 1):
+            parser.feed(line)
+            if flush is not None:
+                flush()
+            for event, xmlElement in parser.read_events():
+                self._validate(event, xmlElement, openElements, lineNumber)
+                yield event, xmlElement
+
+        for event, xmlElement in parser.read_events():
+            self._validate(event, xmlElement, openElements, lineNumber)
+            yield event, xmlElement
+
+        self._validator.close()
+
+    def _validate(self, event, xmlElement, openElements, lineNumber):
+        # Pass a parser event to the validator,
+        # with the text preceding the tag.
+        if event == 'start':
+            if openElements:
+                parent = openElements[-1]
+                if parent[1] is None:
+                    text = parent[0].text
+                else:
+                    text = parent[1].tail
+                if text:
+                    self._validator.character_data(text)
+                parent[1] = xmlElement
+            self._validator.start_element(
+                xmlElement.tag,
+                xmlElement.attrib,
+                lineNumber,
+            )
+            openElements.append([xmlElement, None])
+            return
+
+        __, lastChild = openElements.pop()
+        if lastChild is None:
+            text = xmlElement.text
+        else:
+            text = lastChild.tail
+        if text:
+            self._validator.character_data(text)
+        self._validator.end_element(xmlElement.tag, lineNumber)
@@ -0,0 +1,242 @@
+"""Provide an expat based nvcx parser backend.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from nvcollection.nvcx_compression import NvcxCompression
+from nvcollection.parser.nvcx_parser import NvcxParser
+from nvlib.novx_globals import string_to_list
+import xml.etree.ElementTree as ET
+
+try:
+    from xml.parsers import expat
+except ImportError:
+    expat = None
+
+
+class ExpatParser(NvcxParser):
+    """nvcx parser backend using the expat SAX interface.
+
+    The records are built directly from the parser callbacks,
+    without creating Element objects.
+    The file is fed to the parser in chunks, and the records
+    are passed on after each chunk, so the memory usage
+    does not depend on the collection size.
+    The validator, if any, is driven by the same callbacks.
+    """
+    FIELDS = {'Title': 'title', 'Desc': 'desc', 'Tags': 'tags', 'Path': 'path'}
+
+    @classmethod
+    def is_available(cls):
+        """Return True, if the expat library is installed.
+
+        Overrides the superclass method.
+        """
+        return expat is not None
+
+    def __init__(self, validator=None):
+        """Extends the superclass constructor."""
+        super().__init__(validator)
+        self._check_root = None
+        self._parser = None
+        self._records = []
+        # Records completed during the current chunk.
+
+        self._depth = 0
+        # Number of open elements.
+
+        self._inSeries = False
+        # True, if the open top level element is a series.
+
+        self._positions = {'': 0}
+        self._series = None
+        # Pending series record, waiting for its first book.
+
+        self._seriesId = ''
+
+        self._record = None
+        # Series or book record under construction.
+
+        self._recordDepth = 0
+        self._field = None
+        self._text = None
+        self._textDepth = None
+        # Depth of the element whose text is being collected.
+
+        self._paragraphs = None
+        self._pathRoot = None
+        # Root name of the book's path.
+
+    def iter_records(self, filePath, check_root):
+        """Generate the records of the file at filePath.
+
+        Overrides the superclass method.
+        """
+        self._check_root = check_root
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start_element
+        self._parser.EndElementHandler = self._end_element
+        self._parser.CharacterDataHandler = self._character_data
+        with NvcxCompression.open_read(filePath) as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                self._parser.Parse(chunk, not chunk)
+                yield from self._records
+                self._records.clear()
+                if not chunk:
+                    break
+
+        if self._validator is not None:
+            self._validator.close()
+
+    def _character_data(self, data):
+        # Collect the text up to the first child element,
+        # like the "text" attribute of an ElementTree element.
+        if self._validator is not None:
+            self._validator.character_data(data)
+        if self._depth - 1 == self._textDepth and self._text is not None:
+            self._text.append(data)
+
+    def _emit(self, record):
+        # Assign the position and pass the record on.
+        parent = record['parent']
+        record['position'] = self._positions.get(parent, 0)
+        self._positions[parent] = record['position'] + 1
+        if record['type'] == 'SERIES':
+            self._positions[record['id']] = 0
+        self._records.append(record)
+
+    def _end_element(self, tag):
+        if self._validator is not None:
+            self._validator.end_element(tag, self._parser.CurrentLineNumber)
+        self._depth -= 1
+        depth = self._depth
+        if self._record is None:
+            return
+
+        if self._record['type'] == 'ROOT' and depth > self._recordDepth:
+            return
+
+        if depth == self._recordDepth:
+            # The series or book element is complete.
+            if tag == 'BOOK':
+                if self._record['tags'] is not None:
+                    self._record['tags'] = string_to_list(self._record['tags'])
+                self._record.setdefault('path', None)
+                self._record['root'] = self._pathRoot
+                self._emit(self._record)
+            elif tag == 'ROOT':
+                self._record['path'] = ''.join(self._text)
+                self._text = None
+                self._textDepth = None
+                self._field = None
+                self._records.append(self._record)
+            elif self._series is not None:
+                self._emit(self._series)
+            self._series = None
+            self._record = None
+        elif depth == self._recordDepth + 1 and self._field is not None:
+            if self._field == 'desc':
+                self._record['desc'] = '\n'.join(self._paragraphs)
+                self._paragraphs = None
+            else:
+                self._record[self._field] = ''.join(self._text)
+                self._text = None
+                self._textDepth = None
+            self._field = None
+        elif (depth == self._recordDepth + 2
+              and self._field == 'desc'
+              and self._text is not None
+        ):
+            self._paragraphs.append(''.join(self._text))
+            self._text = None
+            self._textDepth = None
+
+    def _new_record(self, tag, attrs, parent, depth):
+        # Start a record with the same key order as the other backends.
+        self._record = dict(
+            type=tag,
+            id=attrs.get('id', ''),
+            parent=parent,
+            position=None,
+            title=None,
+            desc=None,
+        )
+        if tag == 'BOOK':
+            self._record['tags'] = None
+        self._recordDepth = depth
+        self._pathRoot = None
+        return self._record
+
+    def _start_element(self, tag, attrs):
+        if self._validator is not None:
+            self._validator.start_element(
+                tag,
+                attrs,
+                self._parser.CurrentLineNumber,
+            )
+        depth = self._depth
+        self._depth += 1
+        if depth == 0:
+            self._check_root(ET.Element(tag, attrs))
+            return
+
+        if depth == 1:
+            self._inSeries = tag == 'SERIES'
+            if tag == 'SERIES':
+                self._series = self._new_record(tag, attrs, '', depth)
+                self._seriesId = self._series['id']
+            elif tag == 'BOOK':
+                self._new_record(tag, attrs, '', depth)
+            elif tag == 'ROOT':
+                # Collect the directory like a field of the record itself.
+                self._record = dict(type=tag, id=attrs.get('name', ''))
+                self._recordDepth = depth
+                self._field = 'path'
+                self._text = []
+                self._textDepth = depth
+            return
+
+        if depth == 2 and tag == 'BOOK' and self._inSeries:
+            if self._series is not None:
+                # The series' Title and Desc are complete.
+                self._emit(self._series)
+                self._series = None
+            self._new_record(tag, attrs, self._seriesId, depth)
+            return
+
+        if self._record is None:
+            return
+
+        if self._textDepth is not None and depth > self._textDepth:
+            # Ignore the text after a child element.
+            self._textDepth = -1
+
+        if self._record['type'] == 'ROOT':
+            return
+
+        if depth == self._recordDepth + 1:
+            field = self.FIELDS.get(tag, None)
+            if field is None:
+                return
+
+            if self._record.get(field, None) is not None:
+                # Only the first element counts.
+                return
+
+            self._field = field
+            if field == 'path':
+                self._pathRoot = attrs.get('root', None)
+            if field == 'desc':
+                self._paragraphs = []
+            else:
+                self._text = []
+                self._textDepth = depth
+        elif (depth == self._recordDepth + 2
+              and self._field == 'desc'
+              and tag == 'p'
+        ):
+            self._text = []
+            self._textDepth = depth
@@ -0,0 +1,43 @@
+"""Provide an abstract base class for nvcx parser backends.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class NvcxParser:
+    """Abstract nvcx parser backend.
+    
+    A backend reads an nvcx file incrementally and generates 
+    root, series, and book records, as specified in NvcxOpener.iter_records().
+    
+    Backends raise the exceptions of the underlying library; 
+    NvcxOpener translates them into uniform error messages.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, validator=None):
+        """Set the optional validator.
+        
+        Optional arguments:
+            validator -- NvcxValidator instance that is driven 
+                         by the parser events, with line numbers.
+        """
+        self._validator = validator
+
+    @classmethod
+    def is_available(cls):
+        """Return True, if the required libraries are installed."""
+        return True
+
+    def iter_records(self, filePath, check_root):
+        """Generate the records of the file at filePath.
+        
+        Positional arguments:
+            filePath -- str: path to the nvcx file.
+            check_root -- callback function that takes the XML root 
+                          element, with tag and attributes only.
+                          It is called before any record is generated.
+        """
+        raise NotImplementedError
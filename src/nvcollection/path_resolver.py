@@ -0,0 +1,123 @@
+"""Provide a class for resolving stored book paths.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import os
+
+
+class PathResolver:
+    """Translate between project file paths and their stored form.
+    
+    Book paths are stored relative to a named root directory,
+    or relative to the collection file's directory, if they are 
+    located there. Other paths are stored as absolute paths, 
+    so they are still valid when the collection file is moved.
+    
+    The absolute root directories are cached per root name,
+    so moving a root only changes a single cache entry.
+    """
+
+    def __init__(self, collectionDir=''):
+        """Positional arguments:
+            collectionDir -- str: directory of the collection file.
+        """
+        self.roots = {}
+        # Dictionary:
+        #   keyword -- root name
+        #   value -- root directory as stored; 
+        #            may be relative to the collection file's directory
+
+        self._bases = {}
+        # Cache of absolute, normalized root directories:
+        #   keyword -- root name; None for the collection file's directory
+        #   value -- str: directory
+
+        self._collectionDir = None
+        self.set_collection_dir(collectionDir)
+
+    def clear(self):
+        """Remove all roots."""
+        self.roots.clear()
+        self._bases.clear()
+
+    def get_location(self, filePath):
+        """Return a tuple (root name, path) for storing filePath.
+        
+        The root with the longest matching directory is preferred.
+        If no root matches, the root name is None, and the path 
+        is relative to the collection file's directory, if located there;
+        otherwise, the path is absolute.
+        Path separators of relative paths are stored as slashes.
+        """
+        absPath = os.path.abspath(filePath)
+        rootName = None
+        rootDir = None
+        for name in self.roots:
+            base = self._get_base(name)
+            if self._contains(base, absPath) and (
+                rootDir is None or len(base) > len(rootDir)
+            ):
+                rootName = name
+                rootDir = base
+        if rootName is None:
+            rootDir = self._get_base(None)
+            if not self._contains(rootDir, absPath):
+                return None, absPath
+
+        path = os.path.relpath(absPath, rootDir)
+        return rootName, path.replace(os.sep, '/')
+
+    def resolve(self, rootName, path):
+        """Return the absolute file path for a stored path.
+        
+        Return None, if rootName is unknown.
+        """
+        base = self._get_base(rootName)
+        if base is None:
+            return None
+
+        return os.path.normpath(os.path.join(base, path))
+
+    def set_collection_dir(self, collectionDir):
+        """Set the directory that relative paths refer to."""
+        self._collectionDir = collectionDir
+        self._bases.clear()
+
+    def set_root(self, name, directory):
+        """Define the named root or move it to another directory."""
+        self.roots[name] = directory
+        self._bases.pop(name, None)
+
+    def _contains(self, directory, filePath):
+        # Return True, if filePath is located in directory.
+        try:
+            return os.path.normcase(
+                os.path.commonpath((directory, filePath))
+            ) == os.path.normcase(directory)
+
+        except ValueError:
+            return False
+
+    def _get_base(self, rootName):
+        # Return the absolute directory of the root, using the cache.
+        # Return None, if rootName is unknown.
+        base = self._bases.get(rootName, None)
+        if base is not None:
+            return base
+
+        if rootName is None:
+            base = os.path.abspath(self._collectionDir)
+        elif rootName in self.roots:
+            base = os.path.normpath(
+                os.path.join(
+                    os.path.abspath(self._collectionDir),
+                    self.roots[rootName],
+                )
+            )
+        else:
+            return None
+
+        self._bases[rootName] = base
+        return base
@@ -11,4 +11,6 @@ class GenericKeys:
 
     OPEN_HELP = ('<F1>', 'F1')
     QUIT_PROGRAM = ('<Control-q>', f'{_("Ctrl")}-Q')
+    REDO = ('<Control-y>', f'{_("Ctrl")}-Y')
+    UNDO = ('<Control-z>', f'{_("Ctrl")}-Z')
 
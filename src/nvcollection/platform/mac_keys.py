@@ -10,3 +10,5 @@ from nvcollection.platform.generic_keys import GenericKeys
 class MacKeys(GenericKeys):
 
     QUIT_PROGRAM = ('<Command-q>', 'Cmd-Q')
+    REDO = ('<Command-Shift-Z>', 'Cmd-Shift-Z')
+    UNDO = ('<Command-z>', 'Cmd-Z')
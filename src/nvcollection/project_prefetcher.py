@@ -0,0 +1,100 @@
+"""Provide a class for prefetching project files in the background.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+
+class ProjectPrefetcher:
+    """Background reader that warms up the file cache for project files.
+
+    novelibre opens a project by its path, so prefetched data cannot
+    be handed over. Instead, the file is read through once, leaving its
+    content in the file cache of the operating system. So the project
+    opens from warm data, even if the file is on network storage.
+
+    The file is read into a single buffer of CHUNK_SIZE bytes
+    that is reused, so the memory usage does not depend on the file size.
+    Reading stops as soon as another file is prefetched.
+    """
+    CHUNK_SIZE = 1 << 20
+    MAX_SIZE = 256 << 20
+    # Larger files are read only up to this size.
+
+    MAX_ENTRIES = 32
+    # Number of recently prefetched files that are not read again
+    # as long as they are not changed.
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+        self._current = None
+        # Path of the file to prefetch. Reading other files is stopped.
+
+        self._entries = OrderedDict()
+        # Dictionary:
+        #   keyword -- normalized project file path
+        #   value -- tuple (mtime_ns, size) when prefetched
+
+    def prefetch(self, filePath):
+        """Start reading the file at filePath in the background.
+
+        Reading a file prefetched before is stopped.
+        """
+        with self._lock:
+            self._current = filePath
+        self._executor.submit(self._read_file, filePath)
+
+    def shutdown(self):
+        """Stop the background thread."""
+        with self._lock:
+            self._current = None
+        self._executor.shutdown(wait=False)
+
+    def _is_current(self, filePath):
+        with self._lock:
+            return filePath == self._current
+
+    def _read_file(self, filePath):
+        # Read the file, unless it was prefetched and not changed since.
+        if not self._is_current(filePath):
+            return
+
+        key = os.path.normcase(os.path.abspath(filePath))
+        try:
+            fileStat = os.stat(filePath)
+        except OSError:
+            return
+
+        signature = (fileStat.st_mtime_ns, fileStat.st_size)
+        with self._lock:
+            if self._entries.get(key, None) == signature:
+                self._entries.move_to_end(key)
+                return
+
+        buffer = bytearray(self.CHUNK_SIZE)
+        bytesRead = 0
+        try:
+            with open(filePath, 'rb', buffering=0) as f:
+                while bytesRead < self.MAX_SIZE:
+                    if not self._is_current(filePath):
+                        return
+
+                    chunkSize = f.readinto(buffer)
+                    if not chunkSize:
+                        break
+
+                    bytesRead += chunkSize
+        except OSError:
+            return
+
+        with self._lock:
+            self._entries[key] = signature
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
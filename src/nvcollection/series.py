@@ -4,14 +4,17 @@ Copyright (c) Peter Triesberger
 For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
+from nvcollection.basic_element import BasicElement
+from nvcollection.series_stats import SeriesStats
 
 
-class Series:
+class Series(BasicElement):
     """Book series representation for the collection.
     
     A series has a title and a description. 
     """
 
     def __init__(self):
-        self.title = None
-        self.desc = None
+        super().__init__()
+        self.stats = SeriesStats()
+        # Aggregates of the member books.
@@ -0,0 +1,98 @@
+"""Provide a class for aggregated series statistics.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from collections import Counter
+import heapq
+
+from nvcollection.book_stats import BookStats
+from nvcollection.nvcollection_locale import _
+
+
+class SeriesStats(BookStats):
+    """Aggregates of a series' member books.
+
+    Besides the totals of the manuscript statistics,
+    the member books and the books whose project file is missing
+    are counted. All values are updated when a member is added
+    or removed, without walking through the members.
+
+    For the latest modification, a heap of the members' modification
+    timestamps is kept. Timestamps of removed members are discarded
+    when they come to the top.
+    """
+    COMPACT_MIN = 16
+    # Minimum number of heap entries before discarded timestamps are purged.
+
+    def __init__(self):
+        super().__init__()
+        self.books = 0
+        self.missing = 0
+
+        self._timestamps = Counter()
+        # Number of members per modification timestamp.
+
+        self._heap = []
+        # Negated timestamps; may contain timestamps of removed members.
+
+    def add_member(self, stats, missing):
+        """Add a member book.
+
+        Positional arguments:
+            stats -- BookStats instance of the book, or None.
+            missing -- bool: True, if the book's project file is missing.
+        """
+        self.books += 1
+        self.missing += missing
+        if stats is None:
+            return
+
+        self.add(stats)
+        if stats.modified is not None:
+            self._timestamps[stats.modified] += 1
+            heapq.heappush(self._heap, -stats.modified)
+            if self.modified is None or stats.modified > self.modified:
+                self.modified = stats.modified
+
+    def get_values(self):
+        """Return a tuple of the values to display."""
+        if self.missing:
+            books = f'{self.books} ({self.missing} {_("missing")})'
+        else:
+            books = self.books
+        return super().get_values() + (books,)
+
+    def remove_member(self, stats, missing):
+        """Remove a member book.
+
+        Positional arguments:
+            stats -- BookStats instance of the book, as added, or None.
+            missing -- bool: the missing state, as added.
+        """
+        self.books -= 1
+        self.missing -= missing
+        if stats is None:
+            return
+
+        self.add(stats, -1)
+        if stats.modified is None:
+            return
+
+        self._timestamps[stats.modified] -= 1
+        if self._timestamps[stats.modified] <= 0:
+            del self._timestamps[stats.modified]
+        if len(self._heap) > 2 * len(self._timestamps) + self.COMPACT_MIN:
+            self._heap = [-timestamp for timestamp in self._timestamps]
+            heapq.heapify(self._heap)
+        while self._heap and not -self._heap[0] in self._timestamps:
+            heapq.heappop(self._heap)
+        if self._heap:
+            self.modified = -self._heap[0]
+        else:
+            self.modified = None
+
+    def set_missing(self, wasMissing, missing):
+        """Update the count after a member's missing state has changed."""
+        self.missing += missing - wasMissing
@@ -0,0 +1,255 @@
+"""Provide a class for collecting manuscript statistics with a file cache.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import threading
+
+from nvcollection.book_stats import BookStats
+from nvlib.model.data.section import ADDITIONAL_WORD_LIMITS
+from nvlib.model.data.section import NO_WORD_LIMITS
+import xml.etree.ElementTree as ET
+
+
+class StatsCache:
+    """Manuscript statistics and content digests of novelibre project files.
+    
+    The statistics and the digests are read from the .novx files 
+    in a single pass by worker threads.
+    The threads overlap the file access, e.g. on network drives;
+    the parsing itself is CPU-bound and runs one thread at a time.
+    Words are counted like novelibre counts them.
+    
+    Each file has two digests:
+    - The file digest identifies identical files.
+    - The text digest identifies projects with the same manuscript text,
+      regardless of formatting, letter case, and project metadata.
+      It is None, if the manuscript has no text.
+
+    Results are cached per file, keyed on modification time and size,
+    so unchanged files are not parsed again. 
+    The cache can be saved as a JSON file.
+    """
+    MAX_WORKERS = 8
+    CHUNK_SIZE = 65536
+    FILENAME = 'collection_stats.json'
+    # Name of the plugin's cache file in the novelibre configuration directory.
+
+    def __init__(self, filePath=None):
+        """Load the cache file, if any.
+        
+        Optional arguments:
+            filePath -- str: path to the JSON cache file.
+        """
+        self.filePath = filePath
+        self._entries = {}
+        # Dictionary:
+        #   keyword -- normalized project file path
+        #   value -- list [mtime_ns, size, words, chapters, sections,
+        #                  file digest, text digest]
+        #            with hexadecimal digests
+
+        self._isModified = False
+        self._lock = threading.Lock()
+        # Allows collecting in several background threads.
+
+        if filePath is not None:
+            try:
+                with open(filePath, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+
+    def collect(self, filePaths):
+        """Return a dictionary with a BookStats instance per file path.
+        
+        Positional arguments:
+            filePaths -- iterable of project file paths.
+        
+        The value is None, if the file cannot be read.
+        Cache misses are read by worker threads. 
+        This method may run in a background thread.
+        """
+        stats = {}
+        for filePath, entry in self._collect(filePaths).items():
+            if entry is None:
+                stats[filePath] = None
+                continue
+
+            mtime, __, words, chapters, sections, __, __ = entry
+            stats[filePath] = BookStats(
+                words=words,
+                chapters=chapters,
+                sections=sections,
+                modified=mtime / 1e9,
+            )
+        return stats
+
+    def collect_digests(self, filePaths):
+        """Return a dictionary with a tuple (file digest, text digest) per file path.
+
+        Positional arguments:
+            filePaths -- iterable of project file paths.
+
+        The value is None, if the file cannot be read.
+        Cache misses are read by worker threads.
+        This method may run in a background thread.
+        """
+        digests = {}
+        for filePath, entry in self._collect(filePaths).items():
+            if entry is None:
+                digests[filePath] = None
+            else:
+                digests[filePath] = (entry[5], entry[6])
+        return digests
+
+    def get_size(self, filePath):
+        """Return the file size last seen, or None if not cached."""
+        key = os.path.normcase(os.path.abspath(filePath))
+        with self._lock:
+            entry = self._entries.get(key, None)
+        if entry is None:
+            return None
+
+        return entry[1]
+
+    @classmethod
+    def read_novx_file(cls, filePath):
+        """Return the statistics and the digests of a .novx file.
+        
+        Return a tuple (word count, chapter count, section count, 
+        file digest, text digest) with hexadecimal digests.
+        Only normal chapters and sections are counted.
+        The words are counted with novelibre's word limits,
+        so comments are not counted.
+        The text digest covers the words of all sections.
+        The file is read and parsed incrementally in one pass.
+        """
+        words = 0
+        chapters = 0
+        sections = 0
+        isNormalChapter = False
+        isNormalSection = False
+        fileDigest = hashlib.blake2b(digest_size=16)
+        textDigest = hashlib.blake2b(digest_size=16)
+        hasText = False
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        with open(filePath, 'rb') as f:
+            while True:
+                chunk = f.read(cls.CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                fileDigest.update(chunk)
+                parser.feed(chunk)
+                for event, xmlElement in parser.read_events():
+                    if event == 'start':
+                        if xmlElement.tag == 'CHAPTER':
+                            isNormalChapter = xmlElement.attrib.get('type', '0') == '0'
+                            if isNormalChapter:
+                                chapters += 1
+                        elif xmlElement.tag == 'SECTION':
+                            isNormalSection = (
+                                isNormalChapter
+                                and xmlElement.attrib.get('type', '0') == '0'
+                            )
+                            if isNormalSection:
+                                sections += 1
+                        continue
+
+                    if xmlElement.tag == 'Content':
+                        for text in xmlElement.itertext():
+                            for word in text.split():
+                                textDigest.update(f'{word.casefold()} '.encode('utf-8'))
+                                hasText = True
+                        if isNormalSection:
+                            words += cls._count_words(xmlElement)
+                        xmlElement.clear()
+                    elif xmlElement.tag in ('SECTION', 'CHAPTER'):
+                        xmlElement.clear()
+        parser.close()
+        if not hasText:
+            return words, chapters, sections, fileDigest.hexdigest(), None
+
+        return (
+            words,
+            chapters,
+            sections,
+            fileDigest.hexdigest(),
+            textDigest.hexdigest(),
+        )
+
+    def save(self):
+        """Write the cache file, if modified."""
+        if self.filePath is None or not self._isModified:
+            return
+
+        try:
+            with self._lock:
+                data = json.dumps(self._entries)
+            with open(self.filePath, 'w', encoding='utf-8') as f:
+                f.write(data)
+        except OSError:
+            pass
+        else:
+            self._isModified = False
+
+    def _collect(self, filePaths):
+        # Return a dictionary with the cache entry per file path.
+        # Update the cache.
+        filePaths = list(filePaths)
+        with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+            results = executor.map(self._get_entry, filePaths)
+            entries = {}
+            for filePath, (key, entry) in zip(filePaths, results):
+                entries[filePath] = entry
+                if entry is None:
+                    continue
+
+                with self._lock:
+                    if self._entries.get(key, None) != entry:
+                        self._entries[key] = entry
+                        self._isModified = True
+        return entries
+
+    @classmethod
+    def _count_words(cls, xmlContent):
+        # Return the number of words of a Content element.
+        # The content is serialized without indentation, like
+        # the section content in novelibre, and counted the same way.
+        xmlContent.tail = None
+        text = ET.tostring(xmlContent, encoding='unicode', short_empty_elements=False)
+        text = ''.join(line.strip() for line in text.split('\n'))
+        text = ADDITIONAL_WORD_LIMITS.sub(' ', text)
+        text = NO_WORD_LIMITS.sub('', text)
+        return len(text.split())
+
+    def _get_entry(self, filePath):
+        # Return a tuple (cache key, cache entry).
+        # The entry is None, if the file cannot be read.
+        key = os.path.normcase(os.path.abspath(filePath))
+        try:
+            fileStat = os.stat(filePath)
+        except OSError:
+            return key, None
+
+        entry = self._entries.get(key, None)
+        # Entries of older plugin versions have no digests.
+        if (entry is not None
+            and len(entry) == 7
+            and entry[0] == fileStat.st_mtime_ns
+            and entry[1] == fileStat.st_size
+        ):
+            return key, entry
+
+        try:
+            data = self.read_novx_file(filePath)
+        except Exception:
+            return key, None
+
+        return key, [fileStat.st_mtime_ns, fileStat.st_size, *data]
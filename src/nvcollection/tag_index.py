@@ -0,0 +1,173 @@
+"""Provide a class for a bitmap index of book tags.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class TagIndex:
+    """Bitmap index of the books' tags for faceted selection.
+
+    Each book is given a bit number. For each tag, an integer
+    is kept as a bitmap with the bits of the tagged books set.
+    AND, OR, and NOT combinations of tags are thus computed
+    by a few integer operations on the bitmaps,
+    no matter how many books are tagged.
+
+    Tags are compared case-insensitively.
+    Bit numbers of removed books are reused.
+    A whole collection is loaded at once.
+    """
+
+    def __init__(self):
+        self._bitmaps = {}
+        # Dictionary:
+        #   keyword -- casefolded tag
+        #   value -- int: bitmap of the tagged books
+
+        self._bits = {}
+        # Dictionary:
+        #   keyword -- book ID
+        #   value -- bit number
+
+        self._tags = {}
+        # Dictionary:
+        #   keyword -- book ID
+        #   value -- tuple of the book's casefolded tags
+
+        self._bkIds = []
+        # Book IDs by bit number; None for free bit numbers.
+
+        self._freeBits = []
+        self._all = 0
+        # Bitmap of all indexed books.
+
+    def add(self, bkId, tags):
+        """Add a book, or update its tags.
+
+        Positional arguments:
+            bkId -- str: book ID.
+            tags -- iterable of str: the book's tags.
+        """
+        if bkId in self._bits:
+            self._clear_tags(bkId)
+            bit = self._bits[bkId]
+        else:
+            if self._freeBits:
+                bit = self._freeBits.pop()
+                self._bkIds[bit] = bkId
+            else:
+                bit = len(self._bkIds)
+                self._bkIds.append(bkId)
+            self._bits[bkId] = bit
+            self._all |= 1 << bit
+        keys = tuple(dict.fromkeys(tag.casefold() for tag in tags))
+        mask = 1 << bit
+        for key in keys:
+            self._bitmaps[key] = self._bitmaps.get(key, 0) | mask
+        self._tags[bkId] = keys
+
+    def clear(self):
+        """Remove all books."""
+        self._bitmaps.clear()
+        self._bits.clear()
+        self._tags.clear()
+        self._bkIds.clear()
+        self._freeBits.clear()
+        self._all = 0
+
+    def discard(self, bkId):
+        """Remove a book, if indexed."""
+        if not bkId in self._bits:
+            return
+
+        self._clear_tags(bkId)
+        bit = self._bits.pop(bkId)
+        del self._tags[bkId]
+        self._all &= ~(1 << bit)
+        self._bkIds[bit] = None
+        self._freeBits.append(bit)
+
+    def get_ids(self, bitmap):
+        """Generate the IDs of the books selected by bitmap.
+
+        The IDs are generated in the order of their bit numbers.
+        """
+        bits = bin(bitmap)[:1:-1]
+        # Binary digits, least significant first.
+
+        bit = bits.find('1')
+        while bit >= 0:
+            yield self._bkIds[bit]
+            bit = bits.find('1', bit + 1)
+
+    def get_tags(self):
+        """Return a dictionary with the number of books per casefolded tag."""
+        return {
+            key: bin(bitmap).count('1')
+            for key, bitmap in self._bitmaps.items()
+        }
+
+    def load(self, items):
+        """Replace the indexed books.
+
+        Positional arguments:
+            items -- iterable of tuples (book ID, tags).
+
+        The bit positions are collected first, and each tag's bitmap
+        is built once, so loading many books is faster
+        than adding them one by one.
+        """
+        self._tags = {
+            bkId: tuple(dict.fromkeys(tag.casefold() for tag in tags))
+            for bkId, tags in items
+        }
+        self._bkIds = list(self._tags)
+        self._bits = {bkId: bit for bit, bkId in enumerate(self._bkIds)}
+        self._freeBits = []
+        self._all = (1 << len(self._bkIds)) - 1
+        tagBits = {}
+        # Ascending bit numbers per casefolded tag.
+
+        for bit, keys in enumerate(self._tags.values()):
+            for key in keys:
+                tagBits.setdefault(key, []).append(bit)
+        self._bitmaps = {}
+        for key, bits in tagBits.items():
+            bitmap = bytearray(bits[-1] // 8 + 1)
+            for bit in bits:
+                bitmap[bit >> 3] |= 1 << (bit & 7)
+            self._bitmaps[key] = int.from_bytes(bitmap, 'little')
+
+    def select(self, required=(), excluded=()):
+        """Return a bitmap of the books matching the tag conditions.
+
+        Optional arguments:
+            required -- iterable of alternatives, each an iterable of tags:
+                        a book must have at least one tag of each alternative.
+            excluded -- iterable of tags the books must not have.
+
+        Without any condition, all books are selected.
+        Pass the bitmap to get_ids() for the book IDs.
+        """
+        bitmap = self._all
+        for alternatives in required:
+            anyBitmap = 0
+            for tag in alternatives:
+                anyBitmap |= self._bitmaps.get(tag.casefold(), 0)
+            bitmap &= anyBitmap
+        for tag in excluded:
+            bitmap &= ~self._bitmaps.get(tag.casefold(), 0)
+        return bitmap
+
+    def _clear_tags(self, bkId):
+        # Remove the book's bit from the bitmaps of its tags.
+        # Bitmaps without books are deleted.
+        mask = ~(1 << self._bits[bkId])
+        for key in self._tags[bkId]:
+            bitmap = self._bitmaps[key] & mask
+            if bitmap:
+                self._bitmaps[key] = bitmap
+            else:
+                del self._bitmaps[key]
@@ -0,0 +1,92 @@
+"""Provide a class for a sorted index of element titles.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from bisect import bisect_left
+from bisect import bisect_right
+from bisect import insort
+
+
+class TitleIndex:
+    """Sorted index of book and series titles for prefix search.
+
+    Titles are compared case-insensitively.
+    The first element with a title prefix is found by bisection,
+    so the search time hardly depends on the collection size.
+    Single elements are inserted in place; a whole collection
+    is loaded at once.
+    """
+
+    def __init__(self):
+        self._entries = []
+        # Sorted list of tuples (casefolded title, element ID).
+
+        self._keys = {}
+        # Dictionary:
+        #   keyword -- element ID
+        #   value -- casefolded title, as indexed
+
+    def add(self, elementId, title):
+        """Add an element, or update its title."""
+        self.discard(elementId)
+        key = (title or '').casefold()
+        insort(self._entries, (key, elementId))
+        self._keys[elementId] = key
+
+    def clear(self):
+        """Remove all elements."""
+        self._entries.clear()
+        self._keys.clear()
+
+    def discard(self, elementId):
+        """Remove an element, if indexed."""
+        key = self._keys.pop(elementId, None)
+        if key is None:
+            return
+
+        del self._entries[bisect_left(self._entries, (key, elementId))]
+
+    def find(self, prefix, after=None):
+        """Generate the IDs of the elements whose titles start with prefix.
+
+        Positional arguments:
+            prefix -- str: the beginning of the title.
+
+        Optional arguments:
+            after -- element ID. If its title starts with prefix,
+                     begin with the next match, and wrap around.
+
+        The elements are generated in title order.
+        """
+        prefix = prefix.casefold()
+        first = bisect_left(self._entries, (prefix,))
+        start = first
+        afterKey = self._keys.get(after, None)
+        if afterKey is not None and afterKey.startswith(prefix):
+            start = bisect_right(self._entries, (afterKey, after))
+        i = start
+        while i < len(self._entries) and self._entries[i][0].startswith(prefix):
+            yield self._entries[i][1]
+            i += 1
+        for i in range(first, start):
+            # All titles between the first match and "after" match.
+            yield self._entries[i][1]
+
+    def load(self, items):
+        """Replace the indexed elements.
+
+        Positional arguments:
+            items -- iterable of tuples (element ID, title).
+
+        The entries are sorted once, so loading many elements
+        is faster than adding them one by one.
+        """
+        self._keys = {
+            elementId: (title or '').casefold()
+            for elementId, title in items
+        }
+        self._entries = sorted(
+            (key, elementId) for elementId, key in self._keys.items()
+        )
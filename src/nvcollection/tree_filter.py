@@ -0,0 +1,166 @@
+"""Provide a class for filtering the collection tree in place.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+
+
+class TreeFilter:
+    """Hide and restore tree nodes without rebuilding the tree.
+
+    Non-matching nodes are detached from the Treeview,
+    and moved back to their original positions when they match again.
+    Only nodes whose visibility changes cause Treeview calls.
+
+    While the filter is active, the full child order of the
+    top level and the series is kept, so that the model can be
+    saved and edited with hidden nodes. Structural changes
+    must be reported with update_node() and remove_node().
+    """
+
+    def __init__(self, tree):
+        """Positional arguments:
+            tree -- ttk.Treeview holding the series and books.
+        """
+        self.tree = tree
+        self._fullOrder = None
+        # Dictionary, while the filter is active:
+        #   keyword -- parent node ID
+        #   value -- list of all child node IDs, including hidden ones
+
+        self._parents = {}
+        # Dictionary, while the filter is active:
+        #   keyword -- node ID
+        #   value -- parent node ID
+
+        self._hidden = set()
+        # IDs of the detached nodes.
+
+    @property
+    def isActive(self):
+        return self._fullOrder is not None
+
+    def apply(self, is_visible):
+        """Show only the matching nodes.
+
+        Positional arguments:
+            is_visible -- function that takes a node ID and
+                          returns True if the node matches.
+
+        A matching series is shown with all its members.
+        A non-matching series is shown if any member matches.
+        """
+        if self._fullOrder is None:
+            self._fullOrder = {'': list(self.tree.get_children(''))}
+            for node in self._fullOrder['']:
+                self._parents[node] = ''
+                self._fullOrder[node] = list(self.tree.get_children(node))
+                for child in self._fullOrder[node]:
+                    self._parents[child] = node
+        hidden = set()
+        for node in self._fullOrder['']:
+            if is_visible(node):
+                continue
+
+            members = self._fullOrder[node]
+            hiddenMembers = [child for child in members if not is_visible(child)]
+            if len(hiddenMembers) == len(members):
+                # Detaching the parent hides the members as well.
+                hidden.add(node)
+            else:
+                hidden.update(hiddenMembers)
+        self._set_hidden(hidden)
+
+    def clear(self):
+        """Show all nodes and deactivate the filter."""
+        if self._fullOrder is None:
+            return
+
+        self._set_hidden(set())
+        self._fullOrder = None
+        self._parents.clear()
+
+    def get_children(self, node):
+        """Return all children of node, including the hidden ones."""
+        if self._fullOrder is not None and node in self._fullOrder:
+            return tuple(self._fullOrder[node])
+
+        return self.tree.get_children(node)
+
+    def get_parent(self, node):
+        """Return the parent of node, even if node is hidden."""
+        if self._fullOrder is not None and node in self._parents:
+            return self._parents[node]
+
+        return self.tree.parent(node)
+
+    def is_hidden(self, node):
+        """Return True, if the node or its series is detached."""
+        if node in self._hidden:
+            return True
+
+        return self._parents.get(node, '') in self._hidden
+
+    def remove_node(self, node):
+        """Forget a node and its children before they are deleted."""
+        if self._fullOrder is None:
+            return
+
+        self._remove_from_order(node)
+        for child in self._fullOrder.pop(node, ()):
+            del self._parents[child]
+            self._hidden.discard(child)
+        self._hidden.discard(node)
+
+    def update_node(self, node):
+        """Register a node that was inserted or moved in the visible tree.
+
+        The node is placed behind its visible predecessor
+        in the full child order.
+        """
+        if self._fullOrder is None:
+            return
+
+        self._remove_from_order(node)
+        parent = self.tree.parent(node)
+        siblings = self._fullOrder.setdefault(parent, [])
+        previousNode = self.tree.prev(node)
+        if previousNode and previousNode in siblings:
+            siblings.insert(siblings.index(previousNode) + 1, node)
+        else:
+            nextNode = self.tree.next(node)
+            if nextNode and nextNode in siblings:
+                siblings.insert(siblings.index(nextNode), node)
+            else:
+                siblings.append(node)
+        self._parents[node] = parent
+        self._hidden.discard(node)
+        if not parent and not node in self._fullOrder:
+            self._fullOrder[node] = list(self.tree.get_children(node))
+            for child in self._fullOrder[node]:
+                self._parents[child] = node
+
+    def _remove_from_order(self, node):
+        # Remove node from its parent's full child list.
+        parent = self._parents.pop(node, None)
+        if parent is not None:
+            self._fullOrder[parent].remove(node)
+
+    def _set_hidden(self, hidden):
+        # Detach the nodes that become hidden, and move the nodes
+        # that become visible back to their original positions.
+        toHide = hidden - self._hidden
+        toShow = self._hidden - hidden
+        if toHide:
+            self.tree.detach(*toHide)
+        if toShow:
+            for parent, children in self._fullOrder.items():
+                index = 0
+                for node in children:
+                    if node in toShow:
+                        self.tree.move(node, parent, index)
+                        index += 1
+                    elif not node in hidden:
+                        index += 1
+        self._hidden = hidden
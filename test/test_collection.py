@@ -6,19 +6,43 @@ For further information see https://github.com/peter88213/nv_collection
 License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
 """
 
+from contextlib import redirect_stderr
+from contextlib import redirect_stdout
+import io
+import json
 import os
 from shutil import copyfile
 from shutil import rmtree
 from tkinter import ttk
 import unittest
+from unittest.mock import patch
 
+from nvcollection.book_locator import BookLocator
+from nvcollection.book_stats import BookStats
+from nvcollection.change_bus import ChangeBus
 from nvcollection.collection import Collection
+from nvcollection.collection_cli import CollectionCli
+from nvcollection.collection_preloader import CollectionPreloader
+from nvcollection.desc_store import DescStore
+from nvcollection.ndjson_converter import NdjsonConverter
+from nvcollection.novx_metadata_writer import NovxMetadataWriter
+from nvcollection.path_resolver import PathResolver
+from nvcollection.nvcx_opener import NvcxOpener
+from nvcollection.nvcx_validator import NvcxValidator
+from nvcollection.stats_cache import StatsCache
+from nvcollection.tag_index import TagIndex
 from nvlib.model.data.novel import Novel
 from nvlib.model.data.nv_tree import NvTree
 from nvlib.model.novx.novx_file import NovxFile
 
 DATA_PATH = '../data'
+DTD_PATH = '../../dtd'
 TEST_FILE = 'collection.nvcx'
+NDJSON_FILE = 'collection.ndjson'
+COMPRESSED_FILE = 'collection.nvcx.gz'
+SPLIT_FILE = 'series.nvcx'
+STATS_FILE = 'stats.json'
+PRELOAD_DIR = 'preload'
 
 os.makedirs('temp', exist_ok=True)
 os.chdir('temp')
@@ -32,9 +56,37 @@ def read_file(inputFile):
 def remove_all_testfiles():
     try:
         os.remove(TEST_FILE)
+    except:
+        pass
+    try:
+        os.remove(NDJSON_FILE)
+    except:
+        pass
+    try:
+        os.remove(COMPRESSED_FILE)
+    except:
+        pass
+    try:
+        os.remove(SPLIT_FILE)
+    except:
+        pass
+    try:
+        os.remove(STATS_FILE)
+    except:
+        pass
+    try:
+        rmtree(PRELOAD_DIR)
+    except:
+        pass
+    try:
         rmtree('novelibre Projects')
     except:
         pass
+    for historyDir in (f'{TEST_FILE}.history', f'{COMPRESSED_FILE}.history'):
+        try:
+            rmtree(historyDir)
+        except:
+            pass
 
 
 class NrmOpr(unittest.TestCase):
@@ -116,6 +168,159 @@ class NrmOpr(unittest.TestCase):
         self.assertEqual(read_file(TEST_FILE),
                          read_file(DATA_PATH + '/_collection/create_collection.xml'))
 
+    def test_undo_redo(self):
+        """Undo and redo removing books."""
+        copyfile(DATA_PATH + '/_collection/add_second_book.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.remove_book('bk1')
+        myCollection.remove_book('bk2')
+        self.assertEqual(myCollection.undo(), 'Undo: Remove.')
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/remove_book.xml'))
+        self.assertEqual(myCollection.undo(), 'Undo: Remove.')
+        self.assertIsNone(myCollection.undo())
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/add_second_book.xml'))
+        self.assertEqual(myCollection.redo(), 'Redo: Remove.')
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/remove_book.xml'))
+
+    def test_restore_version(self):
+        """Restore a saved version from the history."""
+        copyfile(DATA_PATH + '/_collection/add_second_book.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.remove_book('bk1')
+        myCollection.write()
+        myCollection.remove_book('bk2')
+        myCollection.write()
+        versions = myCollection.history.get_versions()
+        self.assertEqual(len(versions), 3)
+        self.assertEqual(myCollection.history.get_summary(versions[2]), (2, 0))
+        myCollection.restore_version(versions[2])
+        self.assertEqual(myCollection.write(),
+                         '"' + TEST_FILE + '" written.')
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/add_second_book.xml'))
+        self.assertEqual(len(myCollection.history.get_versions()), 4)
+        self.assertIsNone(myCollection.history.add_version(myCollection.iter_records()))
+
+    def test_compressed_collection(self):
+        """Write and read a compressed collection file."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.filePath = COMPRESSED_FILE
+        self.assertEqual(myCollection.write(),
+                         '"' + COMPRESSED_FILE + '" written.')
+        with open(COMPRESSED_FILE, 'rb') as f:
+            self.assertEqual(f.read(2), b'\x1f\x8b')
+        os.remove(TEST_FILE)
+        myCollection = Collection(COMPRESSED_FILE, ttk.Treeview())
+        self.assertEqual(myCollection.read(),
+                         '2 Books found in "' + COMPRESSED_FILE + '".')
+        myCollection.filePath = TEST_FILE
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/read_write.xml'))
+
+    def test_concurrent_write(self):
+        """Merge the changes of two instances editing the same file."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        firstCollection = Collection(TEST_FILE, ttk.Treeview())
+        firstCollection.read()
+        secondCollection = Collection(TEST_FILE, ttk.Treeview())
+        secondCollection.read()
+        firstCollection.remove_book('bk1')
+        self.assertEqual(firstCollection.write(),
+                         '"' + TEST_FILE + '" written.')
+        secondCollection.set_title('sr3', 'Captain Conner Returns')
+        secondCollection.set_title('bk2', 'The Refugee Ship (2nd edition)')
+        self.assertEqual(secondCollection.write(),
+                         '"' + TEST_FILE + '" written; merged with changes by another process; '
+                         'undo history cleared.')
+        self.assertEqual(secondCollection.mergeConflicts, [])
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        self.assertEqual(sorted(myCollection.books), ['bk2'])
+        self.assertEqual(myCollection.books['bk2'].title, 'The Refugee Ship (2nd edition)')
+        self.assertEqual(myCollection.series['sr3'].title, 'Captain Conner Returns')
+
+        # Changes that cannot be merged are not overwritten.
+        copyfile(DATA_PATH + '/_collection/invalid.xml', TEST_FILE)
+        secondCollection.set_title('sr3', 'Captain Conner')
+        with self.assertRaises(RuntimeError):
+            secondCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/invalid.xml'))
+        self.assertEqual(secondCollection.series['sr3'].title, 'Captain Conner')
+
+    def test_find_duplicates(self):
+        """Find and merge books with the same project file."""
+        os.makedirs('novelibre Projects/Copy', exist_ok=True)
+        copyfile(DATA_PATH + '/novelibre Projects/The Gravity Monster/The Gravity Monster.novx',
+                 'novelibre Projects/Copy/The Gravity Monster.novx')
+        copyfile(DATA_PATH + '/_collection/add_second_book.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        book = NovxFile('novelibre Projects/Copy/The Gravity Monster.novx')
+        book.novel = Novel(tree=NvTree())
+        book.read()
+        self.assertEqual(myCollection.add_book(book),
+                         'bk3')
+        digests = StatsCache().collect_digests(
+            [book.filePath for book in myCollection.books.values()])
+        duplicates = myCollection.find_duplicates(digests)
+        self.assertEqual(duplicates, [(True, ('bk1', 'bk3'))])
+        myCollection.merge_books(duplicates[0][1])
+        self.assertEqual(sorted(myCollection.books), ['bk1', 'bk2'])
+        self.assertEqual(myCollection.undo(), 'Undo: Merge duplicates.')
+        self.assertEqual(sorted(myCollection.books), ['bk1', 'bk2', 'bk3'])
+
+    def test_push_metadata(self):
+        """Write the collection's metadata into the project files."""
+        copyfile(DATA_PATH + '/_collection/add_second_book.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.set_title('bk1', 'The Gravity Monster Returns')
+        myCollection.set_desc('bk1', 'New blurb.')
+        items = [
+            (book.filePath, book.title, book.desc)
+            for book in myCollection.books.values()
+        ]
+        items.append(('novelibre Projects/Missing.novx', 'Missing', None))
+        updated, skipped, failed = NovxMetadataWriter.push_all(items)
+        self.assertEqual(updated, [myCollection.books['bk1'].filePath])
+        self.assertEqual(skipped, [myCollection.books['bk2'].filePath])
+        self.assertEqual([path for path, __ in failed], ['novelibre Projects/Missing.novx'])
+        book = NovxFile(myCollection.books['bk1'].filePath)
+        book.novel = Novel(tree=NvTree())
+        book.read()
+        self.assertEqual(book.novel.title, 'The Gravity Monster Returns')
+        self.assertEqual(book.novel.desc, 'New blurb.')
+        updated, skipped, failed = NovxMetadataWriter.push_all(items[:1])
+        self.assertEqual(skipped, [myCollection.books['bk1'].filePath])
+
+    def test_push_metadata_keeps_markup(self):
+        """Keep everything but Title and Desc when writing metadata."""
+        filePath = 'novelibre Projects/The Gravity Monster/The Gravity Monster.novx'
+        text = read_file(filePath)
+        text = text.replace('<PROJECT>', '<PROJECT>\n    <!-- Project comment -->', 1)
+        text = text.replace('</PROJECT>', '</PROJECT>\n  <?novx-test keep?>', 1)
+        with open(filePath, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.assertTrue(NovxMetadataWriter.write_metadata(filePath, 'New title', 'New blurb.'))
+        newText = read_file(filePath)
+        self.assertIn('<!-- Project comment -->', newText)
+        self.assertIn('<Title>New title</Title>', newText)
+        self.assertEqual(newText[newText.index('</PROJECT>'):], text[text.index('</PROJECT>'):])
+        self.assertEqual(newText[:newText.index('<PROJECT>')], text[:text.index('<PROJECT>')])
+        self.assertFalse(NovxMetadataWriter.write_metadata(filePath, 'New title', 'New blurb.'))
+
     def test_create_series(self):
         """Use Case: manage book series/create a series."""
         copyfile(DATA_PATH + '/_collection/add_first_book.xml', TEST_FILE)
@@ -152,6 +357,216 @@ class NrmOpr(unittest.TestCase):
         self.assertEqual(read_file(TEST_FILE),
                          read_file(DATA_PATH + '/_collection/add_book_to_series.xml'))
 
+    def test_series_aggregates(self):
+        """Maintain the book counts and the latest modification of series."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        os.remove('novelibre Projects/The Refugee Ship/The Refugee Ship.novx')
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        seriesStats = myCollection.series['sr2'].stats
+        self.assertEqual((seriesStats.books, seriesStats.missing), (2, 1))
+        myCollection.apply_stats({
+            myCollection.books['bk1'].filePath: BookStats(100, 1, 2, 1000),
+            myCollection.books['bk2'].filePath: BookStats(50, 1, 1, 2000),
+        })
+        self.assertEqual((seriesStats.words, seriesStats.modified), (150, 2000))
+        myCollection.move_node('bk2', 'sr3', 0)
+        self.assertEqual((seriesStats.books, seriesStats.missing), (1, 0))
+        self.assertEqual((seriesStats.words, seriesStats.modified), (100, 1000))
+        myCollection.remove_book('bk1')
+        self.assertEqual((seriesStats.books, seriesStats.modified), (0, None))
+        myCollection.undo()
+        myCollection.undo()
+        self.assertEqual((seriesStats.books, seriesStats.missing), (2, 1))
+        self.assertEqual(seriesStats.modified, 2000)
+        myCollection.remove_series('sr2')
+        myCollection.undo()
+        seriesStats = myCollection.series['sr2'].stats
+        self.assertEqual((seriesStats.books, seriesStats.words), (2, 150))
+
+    def test_stats_cache(self):
+        """Count the words like novelibre, and cache the statistics."""
+        bookPath = 'novelibre Projects/The Gravity Monster/The Gravity Monster.novx'
+        copyfile(DATA_PATH + '/_stats/Word Count.novx', bookPath)
+        self.assertEqual(StatsCache.read_novx_file(bookPath)[:3], (5, 1, 1))
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        statsCache = StatsCache(STATS_FILE)
+        filePaths = [book.filePath for book in myCollection.books.values()]
+        filePaths.append('novelibre Projects/Missing.novx')
+        stats = statsCache.collect(filePaths)
+        self.assertIsNone(stats['novelibre Projects/Missing.novx'])
+        myCollection.apply_stats(stats)
+        book = myCollection.books['bk1']
+        self.assertEqual((book.stats.words, book.stats.chapters, book.stats.sections), (5, 1, 1))
+        otherStats = myCollection.books['bk2'].stats
+        self.assertEqual(myCollection.series['sr2'].stats.words, 5 + otherStats.words)
+        statsCache.save()
+
+        # The cached statistics are used for unchanged files only.
+        statsCache = StatsCache(STATS_FILE)
+        statsCache.read_novx_file = None
+        self.assertEqual(statsCache.get_size(book.filePath), os.path.getsize(bookPath))
+        self.assertEqual(statsCache.collect([book.filePath])[book.filePath].words, 5)
+        digests = statsCache.collect_digests([book.filePath])
+        self.assertEqual(digests[book.filePath], StatsCache.read_novx_file(bookPath)[3:])
+        with open(bookPath, 'a', encoding='utf-8') as f:
+            f.write('\n')
+        self.assertIsNone(statsCache.collect([book.filePath])[book.filePath])
+
+    def test_preloader(self):
+        """Preload the most important collections first; detect changes."""
+        os.makedirs(PRELOAD_DIR, exist_ok=True)
+        filePaths = [
+            f'{PRELOAD_DIR}/{i}.nvcx'
+            for i in range(CollectionPreloader.MAX_ENTRIES + 1)
+        ]
+        for filePath in filePaths:
+            copyfile(DATA_PATH + '/_collection/read_write.xml', filePath)
+        preloader = CollectionPreloader()
+        with patch.object(Collection, 'preload', wraps=Collection.preload) as preload:
+            preloader._preload_files(filePaths)
+        self.assertEqual(
+            [call.args[0] for call in preload.call_args_list],
+            filePaths[:CollectionPreloader.MAX_ENTRIES],
+        )
+        self.assertIsNone(preloader.get(filePaths[-1]))
+        self.assertEqual(preloader.get(filePaths[0]), Collection.preload(filePaths[0]))
+
+        # The least important collection is removed first.
+        preloader._preload_files(filePaths[-1:])
+        self.assertIsNone(preloader.get(filePaths[-2]))
+        self.assertIsNotNone(preloader.get(filePaths[0]))
+        self.assertIsNotNone(preloader.get(filePaths[-1]))
+
+        # Changed files are not taken from the preloader.
+        with open(filePaths[0], 'a', encoding='utf-8') as f:
+            f.write('\n')
+        self.assertIsNone(preloader.get(filePaths[0]))
+
+    def test_desc_store(self):
+        """Keep long descriptions out of memory until they are accessed."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        descStore = myCollection.descStore
+
+        # Short descriptions stay in memory.
+        shortDesc = 'Books not belonging to a specific series.'
+        self.assertLess(len(shortDesc), DescStore.MIN_LENGTH)
+        self.assertIsNone(myCollection.series['sr1']._descKey)
+        self.assertEqual(myCollection.series['sr1']._desc, shortDesc)
+
+        # Long descriptions are loaded on first access only.
+        self.assertIsNotNone(myCollection.books['bk1']._descKey)
+        self.assertEqual(len(descStore._loaded), 0)
+        os.remove(TEST_FILE)
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/read_write.xml'))
+
+        # The number of loaded descriptions is limited.
+        descStore = DescStore()
+        descs = [f'{i:04} {"x" * DescStore.MIN_LENGTH}' for i in range(DescStore.MAX_LOADED * 3)]
+        keys = [descStore.put(desc) for desc in descs]
+        for __ in range(2):
+            for key, desc in zip(keys, descs):
+                self.assertEqual(descStore.get(key), desc)
+                self.assertLessEqual(len(descStore._loaded), DescStore.MAX_LOADED)
+        self.assertEqual(len(descStore._loaded), DescStore.MAX_LOADED)
+        descStore.clear()
+
+    def test_sort(self):
+        """Sort by title and by modification date; undo the sorting."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        myCollection.sort()
+        self.assertEqual(myTree.get_children(''), ('sr3', 'sr1', 'sr2'))
+        self.assertEqual(myTree.get_children('sr2'), ('bk1', 'bk2'))
+        myCollection.sort(reverse=True)
+        self.assertEqual(myTree.get_children(''), ('sr2', 'sr1', 'sr3'))
+        self.assertEqual(myTree.get_children('sr2'), ('bk2', 'bk1'))
+        myCollection.undo()
+        self.assertEqual(myTree.get_children(''), ('sr3', 'sr1', 'sr2'))
+        self.assertEqual(myTree.get_children('sr2'), ('bk1', 'bk2'))
+        myCollection.undo()
+        self.assertEqual(myTree.get_children(''), ('sr1', 'sr2', 'sr3'))
+        myCollection.apply_stats({
+            myCollection.books['bk1'].filePath: BookStats(100, 1, 2, 2000),
+            myCollection.books['bk2'].filePath: BookStats(50, 1, 1, 1000),
+        })
+        myCollection.sort('sr2', sortBy='modified')
+        self.assertEqual(myTree.get_children('sr2'), ('bk2', 'bk1'))
+        self.assertEqual(myTree.get_children(''), ('sr1', 'sr2', 'sr3'))
+        myCollection.sort('sr2', sortBy='modified', reverse=True)
+        self.assertEqual(myTree.get_children('sr2'), ('bk1', 'bk2'))
+        myCollection.sort(sortBy='modified')
+        # Series without modification date are placed at the end.
+        self.assertEqual(myTree.get_children(''), ('sr2', 'sr1', 'sr3'))
+        myCollection.undo()
+        self.assertEqual(myTree.get_children(''), ('sr1', 'sr2', 'sr3'))
+        myCollection.undo()
+        self.assertEqual(myTree.get_children('sr2'), ('bk2', 'bk1'))
+        myCollection.redo()
+        self.assertEqual(myTree.get_children('sr2'), ('bk1', 'bk2'))
+
+    def test_change_events(self):
+        """Queue the display changes, and apply them in one go."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        changes = {}
+        myCollection.changeBus.subscribe(
+            lambda eventType, elementId: changes.setdefault(elementId, set()).add(eventType)
+        )
+        myCollection.read()
+        myCollection.apply_stats({
+            myCollection.books['bk1'].filePath: BookStats(100, 1, 2, None),
+            myCollection.books['bk2'].filePath: BookStats(50, 1, 1, None),
+        })
+        myCollection.set_title('bk1', 'The Gravity Monster Returns')
+        self.assertEqual(sorted(changes), ['bk1', 'bk2', 'sr1', 'sr2', 'sr3'])
+        self.assertEqual(changes['bk1'], {ChangeBus.STATS, ChangeBus.TITLE})
+        self.assertEqual(myCollection.tree.item('bk1', 'text'), 'The Gravity Monster')
+        myCollection.refresh_nodes(changes)
+        self.assertEqual(myCollection.tree.item('bk1', 'text'), 'The Gravity Monster Returns')
+
+    def test_title_index(self):
+        """Find elements by the beginning of their titles."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        titleIndex = myCollection.titleIndex
+        self.assertEqual(list(titleIndex.find('the')), ['bk1', 'bk2'])
+        self.assertEqual(list(titleIndex.find('THE', after='bk1')), ['bk2', 'bk1'])
+        self.assertEqual(list(titleIndex.find('x')), [])
+        myCollection.set_title('bk2', 'Refugees')
+        self.assertEqual(list(titleIndex.find('r')), ['bk2', 'sr2'])
+        myCollection.remove_series_with_books('sr2')
+        self.assertEqual(list(titleIndex.find('')), ['sr3', 'sr1'])
+        myCollection.undo()
+        self.assertEqual(list(titleIndex.find('the g')), ['bk1'])
+
+    def test_pull_metadata(self):
+        """Update a book from its project, and find it by the new title."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        project = NovxFile('novelibre Projects/The Gravity Monster/The Gravity Monster.novx')
+        project.novel = Novel(tree=NvTree())
+        project.read()
+        project.novel.title = 'Gravity Returns'
+        self.assertTrue(myCollection.pull_metadata('bk1', project.novel))
+        self.assertFalse(myCollection.pull_metadata('bk1', project.novel))
+        self.assertEqual(list(myCollection.titleIndex.find('gravity r')), ['bk1'])
+        self.assertEqual(list(myCollection.titleIndex.find('the g')), [])
+        self.assertEqual(myTree.item('bk1', 'text'), 'Gravity Returns')
+        self.assertEqual(myCollection.undo(), 'Undo: Edit title.')
+        self.assertEqual(list(myCollection.titleIndex.find('the g')), ['bk1'])
+
     def test_remove_book_from_series(self):
         """Use Case: manage book series/remove a book from a series."""
         copyfile(DATA_PATH + '/_collection/add_book_to_series.xml', TEST_FILE)
@@ -164,6 +579,320 @@ class NrmOpr(unittest.TestCase):
         self.assertEqual(read_file(TEST_FILE),
                          read_file(DATA_PATH + '/_collection/empty_series.xml'))
 
+    def test_read_legacy_collection(self):
+        """Read a legacy file without rewriting it; upgrade it on saving."""
+        copyfile(DATA_PATH + '/_collection/legacy.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        self.assertEqual(myCollection.read(),
+                         '2 Books found in "' + TEST_FILE + '".')
+        self.assertTrue(myCollection.upgradePending)
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/legacy.xml'))
+        self.assertEqual(myCollection.write(),
+                         '"' + TEST_FILE + '" written.')
+        self.assertFalse(myCollection.upgradePending)
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/read_write.xml'))
+
+    def test_read_broken_file(self):
+        """Keep the collection, if the file cannot be read."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        myCollection.set_title('bk1', 'Changed')
+        bkIds = list(myCollection.books)
+        children = myTree.get_children('')
+        text = read_file(TEST_FILE)
+        with open(TEST_FILE, 'w', encoding='utf-8') as f:
+            f.write(text[:len(text) // 2])
+        with self.assertRaises(RuntimeError):
+            myCollection.read()
+        self.assertEqual(list(myCollection.books), bkIds)
+        self.assertEqual(myTree.get_children(''), children)
+        self.assertEqual(myCollection.books['bk1'].title, 'Changed')
+        self.assertIsNotNone(myCollection.undo())
+        self.assertNotEqual(myCollection.books['bk1'].title, 'Changed')
+
+    def test_project_root(self):
+        """Store the book paths relative to a named root directory."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.set_root('projects', 'novelibre Projects')
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/project_root.xml'))
+        os.rename('novelibre Projects', 'Projects')
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        myCollection.set_root('projects', 'Projects')
+        self.assertTrue(os.path.isfile(myCollection.books['bk1'].filePath))
+        rmtree('Projects')
+
+        # Paths outside the roots and the collection directory stay absolute.
+        pathResolver = PathResolver(os.path.abspath('collection'))
+        pathResolver.set_root('projects', os.path.abspath('projects'))
+        outsidePath = os.path.abspath('elsewhere/book.novx')
+        self.assertEqual(pathResolver.get_location(outsidePath), (None, outsidePath))
+        self.assertEqual(pathResolver.get_location('collection/books/book.novx'),
+                         (None, 'books/book.novx'))
+        self.assertEqual(pathResolver.get_location('projects/book.novx'),
+                         ('projects', 'book.novx'))
+        self.assertEqual(pathResolver.resolve(None, outsidePath), outsidePath)
+
+    def test_relocate_books(self):
+        """Find the moved project files of missing books."""
+        os.makedirs('novelibre Projects/Archive', exist_ok=True)
+        os.rename('novelibre Projects/The Gravity Monster',
+                  'novelibre Projects/Archive/The Gravity Monster')
+        os.makedirs('novelibre Projects/Copy', exist_ok=True)
+        copyfile(DATA_PATH + '/novelibre Projects/The Gravity Monster/The Gravity Monster.novx',
+                 'novelibre Projects/Copy/The Gravity Monster.novx')
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        self.assertTrue(myCollection.books['bk1'].isMissing)
+        locator = BookLocator()
+        self.assertEqual(locator.add_directories(['novelibre Projects', 'novelibre Projects/Copy']), 3)
+        missingPath = myCollection.books['bk1'].filePath
+        newPaths, ambiguous = locator.locate([missingPath])
+        self.assertEqual(ambiguous, [])
+        self.assertEqual(myCollection.relocate_books(newPaths), ['bk1'])
+        self.assertFalse(myCollection.books['bk1'].isMissing)
+        self.assertEqual(myCollection.books['bk1'].path,
+                         'novelibre Projects/Archive/The Gravity Monster/The Gravity Monster.novx')
+        self.assertEqual(myCollection.undo(), 'Undo: Relocate books.')
+        self.assertTrue(myCollection.books['bk1'].isMissing)
+        self.assertEqual(myCollection.books['bk1'].filePath, missingPath)
+
+    def test_cli_relocate(self):
+        """Tell moved project files apart by their last known size."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        bookPath = 'novelibre Projects/The Gravity Monster/The Gravity Monster.novx'
+        statsCache = StatsCache(STATS_FILE)
+        statsCache.collect([os.path.abspath(bookPath)])
+        statsCache.save()
+        for directory in ('A', 'B'):
+            os.makedirs(f'novelibre Projects/{directory}', exist_ok=True)
+        copyfile(bookPath, 'novelibre Projects/B/The Gravity Monster.novx')
+        with open('novelibre Projects/B/The Gravity Monster.novx', 'a', encoding='utf-8') as f:
+            f.write('\n')
+        os.rename(bookPath, 'novelibre Projects/A/The Gravity Monster.novx')
+        with redirect_stdout(io.StringIO()) as output:
+            CollectionCli.main([
+                'relocate', TEST_FILE, 'novelibre Projects',
+                '--stats-cache', 'missing.json',
+            ])
+            CollectionCli.main([
+                'relocate', TEST_FILE, 'novelibre Projects',
+                '--stats-cache', STATS_FILE,
+            ])
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(results[0]['ambiguous'], ['bk1'])
+        self.assertEqual(results[1]['relocated'], ['bk1'])
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        myCollection.read()
+        self.assertEqual(myCollection.books['bk1'].path,
+                         'novelibre Projects/A/The Gravity Monster.novx')
+
+    def test_merge_and_split(self):
+        """Move a series into a new collection, and merge it back."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        self.assertEqual(myCollection.split_series('sr2', SPLIT_FILE),
+                         'Series moved to a new collection: "Rick Starlift" (2 books) -> "' + SPLIT_FILE + '".')
+        self.assertEqual(sorted(myCollection.books), [])
+        with self.assertRaises(RuntimeError):
+            myCollection.split_series('sr1', SPLIT_FILE)
+        splitCollection = Collection(SPLIT_FILE, ttk.Treeview())
+        self.assertEqual(splitCollection.read(),
+                         '2 Books found in "' + SPLIT_FILE + '".')
+        self.assertFalse(splitCollection.books['bk1'].isMissing)
+        self.assertEqual(myCollection.add_series('New series'), 'sr2')
+        self.assertEqual(myCollection.merge_collection(SPLIT_FILE),
+                         'Collection merged: "' + SPLIT_FILE + '" (2 books added, 0 duplicates skipped).')
+        self.assertEqual(myCollection.series['sr4'].title, 'Rick Starlift')
+        self.assertEqual(myTree.get_children('sr4'), ('bk1', 'bk2'))
+        self.assertEqual(myCollection.merge_collection(SPLIT_FILE),
+                         'Collection merged: "' + SPLIT_FILE + '" (0 books added, 2 duplicates skipped).')
+        self.assertEqual(myCollection.undo(), 'Undo: Merge collection.')
+        self.assertEqual(myTree.get_children(''), ('sr1', 'sr3', 'sr2', 'sr4'))
+        self.assertEqual(myCollection.undo(), 'Undo: Merge collection.')
+        self.assertEqual(sorted(myCollection.books), [])
+
+    def test_ndjson_round_trip(self):
+        """Export the collection to NDJSON and import it again."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        self.assertEqual(NdjsonConverter.export_collection(TEST_FILE, NDJSON_FILE),
+                         '5 records exported to "' + NDJSON_FILE + '".')
+        os.remove(TEST_FILE)
+        self.assertEqual(NdjsonConverter.import_collection(NDJSON_FILE, TEST_FILE),
+                         '5 records imported to "' + TEST_FILE + '".')
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/read_write.xml'))
+
+    def test_filter_and_write(self):
+        """Hide books and series by filtering, and save them anyway."""
+        copyfile(DATA_PATH + '/_collection/read_write.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        allNodes = myTree.get_children('')
+        myCollection.filter_titles('no match')
+        self.assertEqual(myTree.get_children(''), ())
+        os.remove(TEST_FILE)
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/read_write.xml'))
+        myCollection.filter_titles('')
+        self.assertEqual(myTree.get_children(''), allNodes)
+
+    def test_filter_by_tags(self):
+        """Show only the books with matching tags, and save the tags."""
+        copyfile(DATA_PATH + '/_collection/tags.xml', TEST_FILE)
+        myTree = ttk.Treeview()
+        myCollection = Collection(TEST_FILE, myTree)
+        myCollection.read()
+        self.assertEqual(myCollection.books['bk2'].tags, ['Science fiction', 'Draft'])
+        myCollection.filter_titles('#draft')
+        self.assertEqual(myTree.get_children(''), ('sr2',))
+        self.assertEqual(myTree.get_children('sr2'), ('bk2',))
+        myCollection.filter_titles('#juvenile|#draft -#DRAFT')
+        self.assertEqual(myTree.get_children('sr2'), ('bk1',))
+        myCollection.filter_titles('#draft gravity')
+        self.assertEqual(myTree.get_children(''), ())
+        os.remove(TEST_FILE)
+        myCollection.write()
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/tags.xml'))
+        myCollection.filter_titles('')
+        self.assertTrue(myCollection.set_tags('bk1', ['Draft']))
+        myCollection.filter_titles('#draft')
+        self.assertEqual(myTree.get_children('sr2'), ('bk1', 'bk2'))
+        myCollection.undo()
+        tagIndex = myCollection.tagIndex
+        self.assertEqual(list(tagIndex.get_ids(tagIndex.select([['draft']]))), ['bk2'])
+        myCollection.remove_book('bk2')
+        self.assertEqual(tagIndex.get_tags(), {'science fiction': 1, 'juvenile': 1})
+        items = [(f'bk{i}', ['Draft'] if i % 3 else ['Draft', 'Juvenile']) for i in range(20)]
+        loadedIndex = TagIndex()
+        loadedIndex.load(items)
+        addedIndex = TagIndex()
+        for bkId, tags in items:
+            addedIndex.add(bkId, tags)
+        self.assertEqual(loadedIndex.get_tags(), addedIndex.get_tags())
+        for required in ([['draft']], [['juvenile']], [['draft'], ['juvenile']]):
+            self.assertEqual(
+                list(loadedIndex.get_ids(loadedIndex.select(required, ['juvenile']))),
+                list(addedIndex.get_ids(addedIndex.select(required, ['juvenile']))),
+            )
+
+    def test_cli_remove(self):
+        """Remove books with the headless command line interface."""
+        copyfile(DATA_PATH + '/_collection/add_second_book.xml', TEST_FILE)
+        with redirect_stdout(io.StringIO()) as output:
+            self.assertEqual(CollectionCli.main(['remove', TEST_FILE, 'bk1']), 0)
+            self.assertEqual(CollectionCli.main(['remove', TEST_FILE, 'bk1']), 1)
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(results[0]['removed'], ['bk1'])
+        self.assertEqual(results[1]['failed'][0]['id'], 'bk1')
+        self.assertEqual(read_file(TEST_FILE),
+                         read_file(DATA_PATH + '/_collection/remove_book.xml'))
+        for jobs in ('0', '-1', 'x'):
+            with redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit) as context:
+                    CollectionCli.main(['-j', jobs, 'validate', TEST_FILE, TEST_FILE])
+            self.assertEqual(context.exception.code, 2)
+
+    def test_validate(self):
+        """Check collection files against the DTD."""
+        self.assertEqual(NvcxValidator.validate_file(DATA_PATH + '/_collection/read_write.xml'),
+                         [])
+        self.assertEqual(NvcxValidator.validate_file(DATA_PATH + '/_collection/invalid.xml'),
+                         [(6, 'Element "SERIES" not allowed here in element "SERIES"'),
+                          (11, 'Incomplete content in element "BOOK"'),
+                          (13, 'Duplicate ID "bk1"')])
+        copyfile(DATA_PATH + '/_collection/invalid.xml', TEST_FILE)
+        myCollection = Collection(TEST_FILE, ttk.Treeview())
+        with self.assertRaises(RuntimeError):
+            myCollection.read()
+        self.assertEqual(myCollection.books, {})
+        copyfile(DATA_PATH + '/_collection/legacy.xml', TEST_FILE)
+        myCollection.read()
+        bkIds = list(myCollection.books)
+        copyfile(DATA_PATH + '/_collection/invalid.xml', TEST_FILE)
+        with self.assertRaises(RuntimeError):
+            myCollection.read()
+        self.assertEqual(list(myCollection.books), bkIds)
+        self.assertTrue(myCollection.upgradePending)
+
+    def test_parser_backends(self):
+        """Check that all parser backends read and validate alike."""
+        with open(TEST_FILE, 'w', encoding='utf-8') as f:
+            f.write(
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<nvcx version="1.3">\n'
+                '<BOOK id="bk1"><Title>A</Title><Path>a.novx</Path></BOOK>\n'
+                '<BOOK id="bk2"><Title>B</Title><Path>b.novx</Path></BOOK\n'
+                '</nvcx>\n'
+            )
+        filePaths = [
+            DATA_PATH + '/_collection/read_write.xml',
+            DATA_PATH + '/_collection/legacy.xml',
+            DATA_PATH + '/_collection/invalid.xml',
+            TEST_FILE,
+        ]
+        results = {}
+        try:
+            for parser in NvcxOpener.PARSERS:
+                NvcxOpener.parser = parser
+                results[parser] = []
+                for filePath in filePaths:
+                    validator = NvcxValidator()
+                    try:
+                        records = list(NvcxOpener.iter_records(
+                            filePath,
+                            1,
+                            3,
+                            validator=validator,
+                        ))
+                        error = None
+                    except RuntimeError as ex:
+                        # The records generated before the error don't count.
+                        records = None
+                        error = str(ex)
+                    results[parser].append((records, validator.violations, error))
+        finally:
+            NvcxOpener.parser = None
+        expected = results[NvcxOpener.PARSERS[0]]
+        for parser in NvcxOpener.PARSERS[1:]:
+            for filePath, result, expectedResult in zip(filePaths, results[parser], expected):
+                self.assertEqual(result, expectedResult, f'{parser.__name__}: {filePath}')
+        self.assertIsNotNone(expected[0][0])
+        self.assertEqual(len(expected[2][1]), 3)
+        self.assertIn('not well-formed', expected[3][2])
+
+    def test_validator_dtd(self):
+        """Compare the validator's DTD declarations with the DTD files."""
+        dtdFiles = sorted(
+            fileName for fileName in os.listdir(DTD_PATH)
+            if fileName.endswith('.dtd')
+        )
+        self.assertEqual(
+            dtdFiles,
+            sorted(f'nvcx_{version.replace(".", "_")}.dtd' for version in NvcxValidator.DTD),
+        )
+        for version in NvcxValidator.DTD:
+            dtd = read_file(f'{DTD_PATH}/nvcx_{version.replace(".", "_")}.dtd')
+            self.assertEqual(
+                NvcxValidator.compile_dtd(dtd),
+                NvcxValidator.compile_dtd(NvcxValidator.DTD[version]),
+                version,
+            )
+
 
 def main():
     unittest.main()
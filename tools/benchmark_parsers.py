@@ -0,0 +1,75 @@
+"""Compare the nvcx parser backends at different collection sizes.
+
+Generate synthetic collections, read them with each available 
+parser backend, and print the best time of several runs per backend.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, f'{os.getcwd()}/../../novelibre/src')
+sys.path.insert(0, f'{os.getcwd()}/../src')
+from nvcollection.nvcx_opener import NvcxOpener
+from nvcollection.nvcx_writer import NvcxWriter
+
+SIZES = (10, 100, 1000, 10000, 100000)
+BOOKS_PER_SERIES = 10
+RUNS = 3
+
+
+def make_collection(filePath, numberOfBooks):
+    with open(filePath, 'w', encoding='utf-8') as f:
+        writer = NvcxWriter(f, 1, 1)
+        for i in range(1, numberOfBooks + 1):
+            if i % BOOKS_PER_SERIES == 1:
+                srId = f'sr{i // BOOKS_PER_SERIES + 1}'
+                writer.write_record(dict(
+                    type='SERIES',
+                    id=srId,
+                    parent='',
+                    title=f'Series {srId}',
+                    desc='A series of books.\nSecond paragraph.',
+                ))
+            writer.write_record(dict(
+                type='BOOK',
+                id=f'bk{i}',
+                parent=srId,
+                title=f'Book {i}',
+                desc=' '.join(['Lorem ipsum dolor sit amet.'] * 20),
+                path=f'/home/user/novelibre Projects/Book {i}/Book {i}.novx',
+            ))
+        writer.close()
+
+
+def read_all(parser, filePath):
+    NvcxOpener.parser = parser
+    for __ in NvcxOpener.iter_records(filePath, 1, 1):
+        pass
+
+
+def main():
+    parsers = [parser for parser in NvcxOpener.PARSERS if parser.is_available()]
+    print(f'{"Books":>10}' + ''.join(f'{p.__name__:>16}' for p in parsers) + '      Winner')
+    with tempfile.TemporaryDirectory() as tempDir:
+        filePath = os.path.join(tempDir, 'benchmark.nvcx')
+        for size in SIZES:
+            make_collection(filePath, size)
+            times = []
+            for parser in parsers:
+                times.append(min(timeit.repeat(
+                    lambda: read_all(parser, filePath),
+                    number=1,
+                    repeat=RUNS,
+                )))
+            winner = parsers[times.index(min(times))].__name__
+            print(f'{size:>10}' + ''.join(f'{t * 1000:>14.2f}ms' for t in times) + f'  {winner}')
+    NvcxOpener.parser = None
+
+
+if __name__ == '__main__':
+    main()
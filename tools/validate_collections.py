@@ -0,0 +1,39 @@
+"""Validate nvcx collection files against the DTD.
+
+Usage: validate_collections.py file [file ...]
+
+Print the violations with line numbers.
+Exit with status 1 if any file is invalid.
+The files are checked in parallel.
+
+Copyright (c) Peter Triesberger
+For further information see https://github.com/peter88213/nv_collection
+License: GNU GPLv3 (https://www.gnu.org/licenses/gpl-3.0.en.html)
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+
+sys.path.insert(0, f'{os.path.dirname(os.path.abspath(__file__))}/../src')
+from nvcollection.nvcx_validator import NvcxValidator
+
+
+def validate(filePath):
+    try:
+        return filePath, NvcxValidator.validate_file(filePath)
+    except OSError as ex:
+        return filePath, [(0, str(ex))]
+
+
+def main(filePaths):
+    isValid = True
+    with ProcessPoolExecutor() as executor:
+        for filePath, violations in executor.map(validate, filePaths, chunksize=16):
+            for lineNumber, message in violations:
+                print(f'{filePath}:{lineNumber}: {message}')
+                isValid = False
+    return 0 if isValid else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))